@@ -44,6 +44,10 @@
         "data/unit_measures.xml",
         "data/item_categories.xml",
         "data/idil_sequence.xml",
+        "data/account_balance_cron.xml",
+        "data/sales_daily_fact_cron.xml",
+        "data/pos_posting_queue_cron.xml",
+        "data/db_backup_job_cron.xml",
         "data/delete.xml",
         "data/booking_sequence.xml",
         "data/sales_commission_sequence.xml",
@@ -82,6 +86,7 @@
         "views/Sales_reciept.xml",
         "views/pos_menu_view.xml",
         "views/pos_session_view.xml",
+        "views/pos_posting_queue_views.xml",
         "views/idil_employee_views.xml",
         "views/Idil_employee_Salary.xml",
         "views/idil_employee_salary_advance.xml",
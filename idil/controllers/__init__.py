@@ -1 +1,2 @@
 from . import order_info_controller
+from . import db_backup_controller
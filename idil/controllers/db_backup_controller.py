@@ -0,0 +1,50 @@
+import os
+import shutil
+
+from odoo import http, _
+from odoo.exceptions import AccessError, UserError
+from odoo.http import request
+from odoo.tools import consteq
+
+
+class DbBackupUploadController(http.Controller):
+    """
+    Chunked upload of backup archives for the restore wizard.
+
+    Each POST carries one chunk of the file with its byte offset; chunks are
+    appended to a file of the server backup directory, so an archive of any
+    size goes through without being held in memory. Chunks must be sent in
+    order; re-sending a chunk at an earlier offset overwrites from there.
+
+    The route is called by upload scripts rather than the web client, so it
+    skips the CSRF check; every chunk must instead carry the upload token the
+    restore wizard shows next to the upload id.
+    """
+
+    @http.route(
+        "/idil/db_backup/upload_chunk",
+        type="http",
+        auth="user",
+        methods=["POST"],
+        csrf=False,
+    )
+    def upload_chunk(self, upload_id, token, offset, chunk, **kwargs):
+        if not request.env.user.has_group("base.group_system"):
+            raise AccessError(_("Only administrators can upload backups."))
+        Wizard = request.env["bizcore.db.backup.wizard"]
+        path = Wizard._get_chunked_upload_path(upload_id)
+        if not consteq(token or "", Wizard._get_upload_token(upload_id)):
+            raise AccessError(_("Invalid upload token."))
+        offset = int(offset)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if offset > size:
+            raise UserError(
+                _("Chunk at offset %s is out of order; %s bytes received so far.")
+                % (offset, size)
+            )
+        with open(path, "r+b" if size else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            shutil.copyfileobj(chunk.stream, f, 1024 * 1024)
+            size = f.tell()
+        return request.make_json_response({"upload_id": upload_id, "size": size})
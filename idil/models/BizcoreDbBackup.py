@@ -1,22 +1,38 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import json
+import uuid
 import zipfile
 import tempfile
 import shutil
 import subprocess
 import base64
 import logging
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
 from odoo import models, fields, _
 from odoo.exceptions import UserError
 from odoo.tools import config
+from odoo.tools.misc import hmac
 
 import psycopg2
 
+from .backup_storage import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_UPLOAD_WORKERS,
+    LocalBackupStorage,
+    OciBackupStorage,
+)
+
 _logger = logging.getLogger(__name__)
 
+COPY_BUFSIZE = 1024 * 1024
+RESTORE_PROGRESS_FILES = 500  # log a progress line every N filestore files
+UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
 try:
     import oci
     from oci.object_storage import ObjectStorageClient
@@ -43,10 +59,74 @@ class BizcoreDbBackupWizard(models.TransientModel):
         readonly=True,
     )
     attachment_id = fields.Many2one("ir.attachment", readonly=True)
+    backup_mode = fields.Selection(
+        [
+            ("streaming", "Streaming (background job)"),
+            ("full", "Full ZIP (wait for it)"),
+        ],
+        string="Backup Mode",
+        default="streaming",
+        required=True,
+    )
+    storage_backend = fields.Selection(
+        [("oci", "OCI Object Storage"), ("local", "Local Directory")],
+        string="Storage",
+        default="oci",
+        required=True,
+    )
+    backup_type = fields.Selection(
+        [
+            ("full", "Full"),
+            ("incremental", "Incremental (new attachments only)"),
+        ],
+        string="Backup Type",
+        default="full",
+        required=True,
+    )
 
     # ------------------------
     # Restore fields
     # ------------------------
+    restore_source = fields.Selection(
+        [
+            ("upload", "Uploaded ZIP"),
+            ("path", "Server File"),
+            ("chunked", "Chunked Upload"),
+            ("job", "Backup Job"),
+        ],
+        string="Restore From",
+        default="upload",
+        required=True,
+    )
+    restore_job_id = fields.Many2one(
+        "bizcore.db.backup.job",
+        string="Backup Job",
+        domain=[("state", "=", "done"), ("manifest_name", "!=", False)],
+    )
+    restore_path = fields.Char(
+        string="Server File",
+        help="Path of a backup ZIP inside the server backup directory "
+        "(backup_local_dir in odoo.conf).",
+    )
+    restore_upload_id = fields.Char(
+        string="Upload ID",
+        default=lambda self: uuid.uuid4().hex,
+        readonly=True,
+        help="POST the backup ZIP in chunks to /idil/db_backup/upload_chunk "
+        "with this upload_id, the upload token, the byte offset of the chunk "
+        "and the chunk file.",
+    )
+    restore_upload_token = fields.Char(
+        string="Upload Token",
+        compute="_compute_restore_upload_token",
+        help="Secret of this upload, checked on every chunk.",
+    )
+    restore_jobs = fields.Integer(
+        string="Parallel Restore Jobs",
+        default=lambda self: int(
+            config.get("restore_jobs") or min(4, os.cpu_count() or 1)
+        ),
+    )
     restore_zip = fields.Binary(string="Upload Backup ZIP")
     restore_zip_filename = fields.Char(string="Filename")
     restore_db_name = fields.Char(string="Restore As (New DB Name)")
@@ -130,6 +210,28 @@ class BizcoreDbBackupWizard(models.TransientModel):
         cur.close()
         conn.close()
 
+    def _get_backup_storage(self, backend):
+        """
+        Storage backend of the streaming backups. Tuned from odoo.conf with
+        backup_chunk_size_mb, backup_upload_workers and, for the local
+        backend, backup_local_dir (default: <data_dir>/backups).
+        """
+        chunk_mb = config.get("backup_chunk_size_mb")
+        kwargs = {
+            "chunk_size": int(chunk_mb) * 1024 * 1024 if chunk_mb else DEFAULT_CHUNK_SIZE,
+            "upload_workers": int(
+                config.get("backup_upload_workers") or DEFAULT_UPLOAD_WORKERS
+            ),
+        }
+        if backend == "local":
+            return LocalBackupStorage(self._get_backup_dir(), **kwargs)
+        return OciBackupStorage(
+            self._get_oci_client(),
+            self._get_oci_namespace(),
+            self._get_oci_bucket(),
+            **kwargs,
+        )
+
     # ============================================================
     # OCI Object Storage Helpers
     # ============================================================
@@ -309,6 +411,33 @@ class BizcoreDbBackupWizard(models.TransientModel):
     def action_backup_now(self):
         self.ensure_one()
 
+        if self.backup_mode == "full":
+            return self._backup_full_zip()
+
+        job = self.env["bizcore.db.backup.job"].enqueue(
+            self.storage_backend, name=self.backup_name, backup_type=self.backup_type
+        )
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Backup Started"),
+                "message": _(
+                    "The backup runs in the background. Follow its progress in Backup Jobs."
+                ),
+                "type": "info",
+                "sticky": False,
+                "next": {
+                    "type": "ir.actions.act_window",
+                    "res_model": "bizcore.db.backup.job",
+                    "res_id": job.id,
+                    "views": [(False, "form")],
+                    "target": "current",
+                },
+            },
+        }
+
+    def _backup_full_zip(self):
         dbname = self.env.cr.dbname
         db_host, db_port, db_user, db_password = self._get_pg_config()
 
@@ -416,96 +545,294 @@ class BizcoreDbBackupWizard(models.TransientModel):
             "target": "self",
         }
 
-    # Replace the action_restore_to_new_db method with this improved version:
+    def _get_backup_dir(self):
+        return config.get("backup_local_dir") or os.path.join(
+            config["data_dir"], "backups"
+        )
 
-    def action_restore_to_new_db(self):
-        self.ensure_one()
+    def _compute_restore_upload_token(self):
+        for wizard in self:
+            wizard.restore_upload_token = (
+                self._get_upload_token(wizard.restore_upload_id)
+                if wizard.restore_upload_id
+                else False
+            )
 
-        if not self.restore_zip:
-            raise UserError(_("Please upload a backup ZIP file."))
+    def _get_upload_token(self, upload_id):
+        """Per-upload secret the chunk route requires along with upload_id."""
+        return hmac(self.env(su=True), "idil.db_backup.upload", upload_id)
+
+    def _get_chunked_upload_path(self, upload_id):
+        """Server file receiving the chunks of a chunked upload."""
+        if not upload_id or not UPLOAD_ID_RE.match(upload_id):
+            raise UserError(_("Invalid upload id."))
+        upload_dir = os.path.join(self._get_backup_dir(), "uploads")
+        os.makedirs(upload_dir, exist_ok=True)
+        return os.path.join(upload_dir, upload_id + ".zip")
+
+    def _check_restore_path(self, path):
+        """Only files of the backup directory can be restored from the server."""
+        backup_dir = os.path.realpath(self._get_backup_dir())
+        real_path = os.path.realpath(os.path.join(backup_dir, (path or "").strip()))
+        if os.path.commonpath([backup_dir, real_path]) != backup_dir:
+            raise UserError(
+                _("The backup file must be inside the backup directory: %s") % backup_dir
+            )
+        if not os.path.isfile(real_path):
+            raise UserError(_("Backup file not found: %s") % real_path)
+        return real_path
 
-        new_dbname = (self.restore_db_name or "").strip()
-        self._validate_dbname(new_dbname)
+    @contextmanager
+    def _open_restore_archive(self):
+        """
+        Path of the backup ZIP to restore. Uploaded ZIPs are read from their
+        attachment in the filestore, so the archive is never decoded from
+        base64 nor loaded in memory.
+        """
+        if self.restore_source == "path":
+            yield self._check_restore_path(self.restore_path)
+            return
+        if self.restore_source == "chunked":
+            path = self._get_chunked_upload_path(self.restore_upload_id)
+            if not os.path.isfile(path):
+                raise UserError(
+                    _("No chunk was received for upload %s.") % self.restore_upload_id
+                )
+            yield path
+            os.remove(path)
+            return
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", "restore_zip"),
+                    ("res_id", "=", self.id),
+                ],
+                limit=1,
+            )
+        )
+        if attachment.store_fname:
+            yield attachment._full_path(attachment.store_fname)
+            return
+        # Stored in the database: spill it to a temporary file
+        with tempfile.NamedTemporaryFile(suffix=".zip") as f:
+            f.write(base64.b64decode(self.restore_zip))
+            f.flush()
+            yield f.name
+
+    def _restore_progress(self, message):
+        # Logged rather than stored on the wizard: a field write is only
+        # visible after commit and is lost when the restore fails.
+        _logger.info("Restore %s: %s", self.restore_db_name, message)
+
+    def _extract_dump(self, z, tmpdir):
+        """
+        Stream db.dump out of the archive into a temporary file: pg_restore
+        needs a seekable file to restore with several jobs.
+        """
+        if "db.dump" not in z.namelist():
+            raise UserError(_("Invalid backup ZIP: db.dump not found."))
+        dump_path = os.path.join(tmpdir, "db.dump")
+        with z.open("db.dump") as src, open(dump_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        self._restore_progress(
+            _("Extracted db.dump (%.1f MB)") % (os.path.getsize(dump_path) / 1048576.0)
+        )
+        return dump_path
+
+    def _extract_filestore(self, z, new_dbname):
+        """Stream the filestore members of the archive into the new filestore."""
+        members = [
+            info
+            for info in z.infolist()
+            if info.filename.startswith("filestore/") and not info.is_dir()
+        ]
+        if not members:
+            return
+        # filestore/<old db name>/<path>: keep the first database folder
+        old_db_folder = members[0].filename.split("/")[1]
+        prefix = f"filestore/{old_db_folder}/"
+        dst_filestore_dir = os.path.join(config["data_dir"], "filestore", new_dbname)
+        if os.path.exists(dst_filestore_dir):
+            shutil.rmtree(dst_filestore_dir)
+
+        count = 0
+        for info in members:
+            if not info.filename.startswith(prefix):
+                continue
+            rel = info.filename[len(prefix):]
+            target = os.path.realpath(os.path.join(dst_filestore_dir, *rel.split("/")))
+            if os.path.commonpath([os.path.realpath(dst_filestore_dir), target]) != (
+                os.path.realpath(dst_filestore_dir)
+            ):
+                continue  # never write outside the filestore
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with z.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+            count += 1
+            if count % RESTORE_PROGRESS_FILES == 0:
+                self._restore_progress(_("Restored %s filestore files") % count)
+        self._restore_progress(_("Filestore restored: %s files") % count)
+
+    def _restore_from_archive(self, archive_path, new_dbname):
+        with tempfile.TemporaryDirectory() as tmpdir, zipfile.ZipFile(
+            archive_path, "r"
+        ) as z:
+            dump_path = self._extract_dump(z, tmpdir)
 
+            # Create new DB
+            self._create_database(new_dbname)
+
+            self._run_pg_restore(dump_path, new_dbname)
+            os.remove(dump_path)
+
+            # Restore filestore (if exists in ZIP)
+            self._extract_filestore(z, new_dbname)
+
+    def _run_pg_restore(self, dump_path, new_dbname):
         db_host, db_port, db_user, db_password = self._get_pg_config()
         pg_restore = self._get_tool("pg_restore_path", "pg_restore")
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            zip_path = os.path.join(tmpdir, "backup.zip")
-            with open(zip_path, "wb") as f:
-                f.write(base64.b64decode(self.restore_zip))
+        env = os.environ.copy()
+        env["PGPASSWORD"] = db_password
+
+        jobs = max(1, self.restore_jobs or 1)
+        cmd = [
+            pg_restore,
+            "--no-owner",
+            "--no-privileges",
+            "--jobs",
+            str(jobs),
+            "-h",
+            db_host,
+            "-p",
+            str(db_port),
+            "-U",
+            db_user,
+            "-d",
+            new_dbname,
+            dump_path,
+        ]
+
+        _logger.warning("EXECUTING pg_restore: %s", cmd)
+        self._restore_progress(_("Running pg_restore with %s job(s)") % jobs)
+
+        # Large databases take longer than any fixed limit; set restore_timeout
+        # (seconds) in odoo.conf to cap it
+        timeout = int(config.get("restore_timeout") or 0) or None
+        try:
+            # Use subprocess.run with better error handling
+            result = subprocess.run(
+                cmd,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+
+            if result.returncode != 0:
+                error_msg = result.stderr or result.stdout or "Unknown error"
+                raise UserError(_("Database restore failed: %s") % error_msg)
+
+        except subprocess.TimeoutExpired:
+            raise UserError(_("Database restore timed out after %s seconds") % timeout)
+        except subprocess.CalledProcessError as e:
+            raise UserError(_("Database restore failed: %s") % str(e))
+        except Exception as e:
+            raise UserError(_("Unexpected error during restore: %s") % str(e))
+        self._restore_progress(_("Database restored"))
 
-            extract_dir = os.path.join(tmpdir, "extract")
-            os.makedirs(extract_dir, exist_ok=True)
+    def _download_backup_object(self, storage, object_name, path):
+        with storage.open_download(object_name) as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFSIZE)
 
-            with zipfile.ZipFile(zip_path, "r") as z:
-                z.extractall(extract_dir)
+    def _restore_from_job(self, new_dbname):
+        job = self.restore_job_id
+        if not job or job.state != "done" or not job.manifest_name:
+            raise UserError(_("Please select a finished backup job."))
 
-            dump_path = os.path.join(extract_dir, "db.dump")
-            if not os.path.exists(dump_path):
-                raise UserError(_("Invalid backup ZIP: db.dump not found."))
+        storage = self._get_backup_storage(job.storage_backend)
+        with storage.open_download(job.manifest_name) as f:
+            manifest = json.load(f)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_path = os.path.join(tmpdir, "backup.zip")
+            self._download_backup_object(storage, job.name, archive_path)
+            self._restore_progress(_("Downloaded %s") % job.name)
+
+            with zipfile.ZipFile(archive_path, "r") as z:
+                dump_path = self._extract_dump(z, tmpdir)
 
             # Create new DB
             self._create_database(new_dbname)
+            self._run_pg_restore(dump_path, new_dbname)
+            os.remove(dump_path)
+
+            dst_filestore_dir = os.path.join(config["data_dir"], "filestore", new_dbname)
+            if os.path.exists(dst_filestore_dir):
+                shutil.rmtree(dst_filestore_dir)
+            os.makedirs(dst_filestore_dir)
+            self._restore_filestore_from_manifest(
+                storage, manifest, dst_filestore_dir, tmpdir, {job.name: archive_path}
+            )
 
-            env = os.environ.copy()
-            env["PGPASSWORD"] = db_password
-
-            cmd = [
-                pg_restore,
-                "--no-owner",
-                "--no-privileges",
-                "-h",
-                db_host,
-                "-p",
-                str(db_port),
-                "-U",
-                db_user,
-                "-d",
-                new_dbname,
-                dump_path,
-            ]
+    def _restore_filestore_from_manifest(
+        self, storage, manifest, dst_filestore_dir, tmpdir, downloaded
+    ):
+        """
+        Rebuild a full filestore from the chain of a manifest: every object
+        is extracted from the backup that holds its content, one archive
+        at a time.
+        """
+        by_backup = defaultdict(list)
+        for rel, (_fingerprint, index) in manifest["objects"].items():
+            by_backup[manifest["backups"][index]].append(rel)
+
+        prefix = "filestore/%s/" % manifest["database"]
+        for backup_name, rels in by_backup.items():
+            archive_path = downloaded.get(backup_name)
+            if not archive_path:
+                if not storage.exists(backup_name):
+                    raise UserError(
+                        _("Backup %s of the chain is missing from the storage.")
+                        % backup_name
+                    )
+                archive_path = os.path.join(tmpdir, "chain.zip")
+                self._download_backup_object(storage, backup_name, archive_path)
+            with zipfile.ZipFile(archive_path, "r") as z:
+                for rel in rels:
+                    target = os.path.join(dst_filestore_dir, *rel.split("/"))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    try:
+                        with z.open(prefix + rel) as src, open(target, "wb") as dst:
+                            shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+                    except KeyError:
+                        raise UserError(
+                            _("Backup %s does not contain %s.") % (backup_name, rel)
+                        )
+            os.remove(archive_path)
+            self._restore_progress(
+                _("Restored %s filestore object(s) from %s") % (len(rels), backup_name)
+            )
 
-            _logger.warning("EXECUTING pg_restore: %s", cmd)
+    # Replace the action_restore_to_new_db method with this improved version:
 
-            try:
-                # Use subprocess.run with better error handling
-                result = subprocess.run(
-                    cmd,
-                    env=env,
-                    capture_output=True,
-                    text=True,
-                    timeout=300,  # 5 minute timeout
-                )
+    def action_restore_to_new_db(self):
+        self.ensure_one()
 
-                if result.returncode != 0:
-                    error_msg = result.stderr or result.stdout or "Unknown error"
-                    raise UserError(_("Database restore failed: %s") % error_msg)
+        if self.restore_source == "upload" and not self.restore_zip:
+            raise UserError(_("Please upload a backup ZIP file."))
 
-            except subprocess.TimeoutExpired:
-                raise UserError(_("Database restore timed out after 5 minutes"))
-            except subprocess.CalledProcessError as e:
-                raise UserError(_("Database restore failed: %s") % str(e))
-            except Exception as e:
-                raise UserError(_("Unexpected error during restore: %s") % str(e))
+        new_dbname = (self.restore_db_name or "").strip()
+        self._validate_dbname(new_dbname)
 
-            # Restore filestore (if exists in ZIP)
-            data_dir = config["data_dir"]
-            src_filestore_root = os.path.join(extract_dir, "filestore")
-            if os.path.isdir(src_filestore_root):
-                subfolders = [
-                    d
-                    for d in os.listdir(src_filestore_root)
-                    if os.path.isdir(os.path.join(src_filestore_root, d))
-                ]
-                if subfolders:
-                    old_db_folder = subfolders[0]
-                    src_filestore_dir = os.path.join(src_filestore_root, old_db_folder)
-                    dst_filestore_dir = os.path.join(data_dir, "filestore", new_dbname)
-
-                    if os.path.exists(dst_filestore_dir):
-                        shutil.rmtree(dst_filestore_dir)
-                    shutil.copytree(src_filestore_dir, dst_filestore_dir)
+        if self.restore_source == "job":
+            self._restore_from_job(new_dbname)
+        else:
+            with self._open_restore_archive() as archive_path:
+                self._restore_from_archive(archive_path, new_dbname)
 
         # Set result BEFORE any database operations that might fail
         restore_result = (
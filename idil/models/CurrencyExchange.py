@@ -134,7 +134,7 @@ class CurrencyExchange(models.Model):
 
     @api.depends("currency_id", "transaction_date", "company_id")
     def _compute_exchange_rate(self):
-        Rate = self.env["res.currency.rate"].sudo()
+        RateService = self.env["idil.currency.rate.service"].sudo()
         for order in self:
             order.rate = 0.0
             if not order.currency_id:
@@ -146,18 +146,10 @@ class CurrencyExchange(models.Model):
                 else fields.Date.today()
             )
 
-            rate_rec = Rate.search(
-                [
-                    ("currency_id", "=", order.currency_id.id),
-                    ("name", "<=", doc_date),
-                    ("company_id", "in", [order.company_id.id, False]),
-                ],
-                order="company_id desc, name desc",
-                limit=1,
+            order.rate = RateService.get_document_rate(
+                order.currency_id, doc_date, order.company_id
             )
 
-            order.rate = rate_rec.rate or 0.0
-
     @api.onchange("sourcecy_currency_id")
     def _onchange_source_currency_id(self):
         for rec in self:
@@ -197,6 +189,8 @@ class CurrencyExchange(models.Model):
         seq = self.env["ir.sequence"].next_by_code("idil.currency.exchange") or "0000"
         # Construct final reference
         vals["name"] = f"Currency Exchange - {tx_date}/{seq}"
+        if vals.get("rate"):
+            self.env["idil.currency.rate.service"].invalidate()
         return super(CurrencyExchange, self).create(vals)
 
     @api.depends("source_account_id", "target_account_id")
@@ -377,6 +371,8 @@ class CurrencyExchange(models.Model):
                 )
 
     def write(self, vals):
+        if "rate" in vals:
+            self.env["idil.currency.rate.service"].invalidate()
         for record in self:
 
             res = super(CurrencyExchange, record).write(vals)
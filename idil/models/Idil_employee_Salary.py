@@ -1,6 +1,7 @@
 import base64
 import calendar
 import json
+from collections import defaultdict
 from datetime import timedelta
 import io
 
@@ -11,7 +12,7 @@ from reportlab.lib.pagesizes import landscape, letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from odoo import models, fields, api
-from odoo.exceptions import UserError, ValidationError
+from odoo.exceptions import ValidationError
 from reportlab.platypus import Image
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.platypus import SimpleDocTemplate
@@ -377,21 +378,44 @@ class IdilEmployeeSalary(models.Model):
 
     @api.depends("employee_id")
     def _compute_pending_sales(self):
+        StaffSales = self.env["idil.staff.sales"]
+        pending = self._get_pending_staff_sales(self.employee_id.ids)
         for rec in self:
-            if rec.employee_id:
-                rec.pending_sales_ids = self.env["idil.staff.sales"].search(
-                    [
-                        ("employee_id", "=", rec.employee_id.id),
-                        ("payment_status", "=", "pending"),
-                        (
-                            "salary_id",
-                            "=",
-                            False,
-                        ),  # ✅ not already paid in another salary
-                    ]
-                )
-            else:
-                rec.pending_sales_ids = self.env["idil.staff.sales"]
+            rec.pending_sales_ids = pending.get(rec.employee_id.id, StaffSales)
+
+    @api.model
+    def _get_pending_staff_sales(self, employee_ids):
+        """{employee_id: pending staff sales not paid in any salary yet}, one search."""
+        pending = defaultdict(lambda: self.env["idil.staff.sales"])
+        if not employee_ids:
+            return pending
+        sales = self.env["idil.staff.sales"].search(
+            [
+                ("employee_id", "in", list(employee_ids)),
+                ("payment_status", "=", "pending"),
+                ("salary_id", "=", False),  # ✅ not already paid in another salary
+            ]
+        )
+        for sale in sales:
+            pending[sale.employee_id.id] |= sale
+        return pending
+
+    @api.model
+    def _get_open_advances(self, employee_ids):
+        """{employee_id: approved/partially deducted advances, oldest first}, one search."""
+        advances = defaultdict(lambda: self.env["idil.employee.salary.advance"])
+        if not employee_ids:
+            return advances
+        records = self.env["idil.employee.salary.advance"].search(
+            [
+                ("employee_id", "in", list(employee_ids)),
+                ("state", "in", ["approved", "partially_deducted"]),
+            ],
+            order="request_date asc, id asc",
+        )
+        for adv in records:
+            advances[adv.employee_id.id] |= adv
+        return advances
 
     @api.depends("salary_date", "employee_id")
     def _compute_advances_this_month(self):
@@ -465,111 +489,106 @@ class IdilEmployeeSalary(models.Model):
             else:
                 record.advance_deduction = 0.0
 
-    @api.model
-    def create(self, vals):
-        # If there's an employee_id and salary_date, prepare advances info
-        desired_deduction = 0.0
-        advances = self.env["idil.employee.salary.advance"]
-        if vals.get("employee_id"):
-            # Get advances in that month which are approved or partially_deducted
-            advances = self.env["idil.employee.salary.advance"].search(
-                [
-                    ("employee_id", "=", vals["employee_id"]),
-                    ("state", "in", ["approved", "partially_deducted"]),
-                ],
-                order="request_date asc, id asc",
-            )
-
-            # Compute total available to deduct (account for any previously deducted_amount)
-            total_available = sum(
-                float(
-                    (adv.advance_amount or 0.0) - (getattr(adv, "deducted_amount", 0.0))
-                )
-                for adv in advances
-            )
-
-            # If user provided an advance_deduction in vals (user-adjusted), respect it but cap to available
-            if "advance_deduction" in vals:
-                # ensure numeric
-                try:
-                    user_requested = float(vals.get("advance_deduction") or 0.0)
-                except Exception:
-                    user_requested = 0.0
-                desired_deduction = max(0.0, min(user_requested, total_available))
-            else:
-                # default to fully deduct available advances
-                desired_deduction = total_available
-
-            # Set the actual value that will be used
-            vals["advance_deduction"] = desired_deduction
-
-        # Create the salary record
-        record = super(IdilEmployeeSalary, self).create(vals)
-
-        # ✅ Detect and attach all pending staff sales for this employee
-        pending_sales = record.pending_sales_ids  # uses your compute (already filtered)
-
-        if pending_sales:
-            # Link to salary (Many2many)
-            record.staff_sales_ids = [(6, 0, pending_sales.ids)]
-
-            # Mark as paid + link back to salary (Many2one)
-            pending_sales.write(
-                {
-                    "payment_status": "paid",
-                    "salary_id": record.id,
-                }
-            )
-        else:
-            record.staff_sales_ids = [(5, 0, 0)]  # clear just in case
-
-        # If we found advances and we have an amount to deduct, allocate across advances
-        if advances and float(vals.get("advance_deduction", 0.0)) > 0.0:
-            to_allocate = float(vals.get("advance_deduction", 0.0))
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Advances and pending staff sales of every employee are loaded once;
+        # the records below consume them in order, as one-by-one creation would.
+        employee_ids = {vals["employee_id"] for vals in vals_list if vals.get("employee_id")}
+        advances_by_employee = self._get_open_advances(employee_ids)
+        pending_by_employee = self._get_pending_staff_sales(employee_ids)
+
+        # Remaining amount of each advance while the batch is being allocated
+        available = {
+            adv.id: float((adv.advance_amount or 0.0) - (getattr(adv, "deducted_amount", 0.0)))
+            for advances in advances_by_employee.values()
+            for adv in advances
+        }
+        allocations = []
+        for vals in vals_list:
             allocation_data = []
-
-            for adv in advances:
-                if to_allocate <= 0:
-                    break
-
-                existing_deducted = float(getattr(adv, "deducted_amount", 0.0))
-                adv_remaining = float((adv.advance_amount or 0.0) - existing_deducted)
-                if adv_remaining <= 0.0:
-                    continue
-
-                if to_allocate >= adv_remaining:
-                    used_amount = adv_remaining
-                    adv.write(
-                        {
-                            "deducted_amount": existing_deducted + used_amount,
-                            "state": "deducted",
-                        }
-                    )
-                    to_allocate -= used_amount
+            if vals.get("employee_id"):
+                advances = advances_by_employee[vals["employee_id"]]
+
+                # Compute total available to deduct (account for any previously deducted_amount)
+                total_available = sum(max(available[adv.id], 0.0) for adv in advances)
+
+                # If user provided an advance_deduction in vals (user-adjusted), respect it but cap to available
+                if "advance_deduction" in vals:
+                    # ensure numeric
+                    try:
+                        user_requested = float(vals.get("advance_deduction") or 0.0)
+                    except Exception:
+                        user_requested = 0.0
+                    desired_deduction = max(0.0, min(user_requested, total_available))
                 else:
-                    used_amount = to_allocate
-                    adv.write(
+                    # default to fully deduct available advances
+                    desired_deduction = total_available
+
+                # Set the actual value that will be used
+                vals["advance_deduction"] = desired_deduction
+
+                # Allocate the deduction across advances, oldest first
+                to_allocate = desired_deduction
+                for adv in advances:
+                    if to_allocate <= 0:
+                        break
+                    adv_remaining = available[adv.id]
+                    if adv_remaining <= 0.0:
+                        continue
+                    used_amount = min(to_allocate, adv_remaining)
+                    available[adv.id] -= used_amount
+                    to_allocate -= used_amount
+                    allocation_data.append(
                         {
-                            "deducted_amount": existing_deducted + used_amount,
-                            "state": "partially_deducted",
+                            "advance_id": adv.id,
+                            "deducted_amount": used_amount,
                         }
                     )
-                    to_allocate = 0.0
+            allocations.append(allocation_data)
+
+        # Create the salary records
+        records = super(IdilEmployeeSalary, self).create(vals_list)
 
-                allocation_data.append(
+        for record, allocation_data in zip(records, allocations):
+            # ✅ Attach the pending staff sales of this employee (first salary takes them)
+            pending_sales = pending_by_employee.pop(record.employee_id.id, None)
+
+            if pending_sales:
+                # Link to salary (Many2many)
+                record.staff_sales_ids = [(6, 0, pending_sales.ids)]
+
+                # Mark as paid + link back to salary (Many2one)
+                pending_sales.write(
                     {
-                        "advance_id": adv.id,
-                        "deducted_amount": used_amount,
+                        "payment_status": "paid",
+                        "salary_id": record.id,
                     }
                 )
+            else:
+                record.staff_sales_ids = [(5, 0, 0)]  # clear just in case
 
             if allocation_data:
                 record.advance_allocation_json = json.dumps(allocation_data)
 
-        # Book transaction booking and lines
-        self._book_transaction(record)
+        # Write the final deducted amount of every advance touched by the batch
+        Advance = self.env["idil.employee.salary.advance"]
+        for adv_id, remaining in available.items():
+            adv = Advance.browse(adv_id)
+            existing_deducted = float(getattr(adv, "deducted_amount", 0.0))
+            new_deducted = float(adv.advance_amount or 0.0) - remaining
+            if new_deducted <= existing_deducted:
+                continue
+            adv.write(
+                {
+                    "deducted_amount": new_deducted,
+                    "state": "deducted" if remaining <= 0.0 else "partially_deducted",
+                }
+            )
+
+        # Book transaction bookings and lines
+        self._book_transactions(records)
 
-        return record
+        return records
 
     def _ensure_salary_posting_configuration(self, credit_account):
         """Validate all required configs are present for salary posting."""
@@ -658,14 +677,16 @@ class IdilEmployeeSalary(models.Model):
         return acc
 
     def _book_transaction(self, record):
+        self._book_transactions(record)
+
+    def _book_transactions(self, records):
         TransactionBooking = self.env["idil.transaction_booking"]
         BookingLine = self.env["idil.transaction_bookingline"]
         ChartAccount = self.env["idil.chart.account"]
         TrxSource = self.env["idil.transaction.source"]
 
         # --- Validate configs ---
-        credit_account = record.account_id
-        if not credit_account:
+        if any(not record.account_id for record in records):
             raise ValidationError(
                 "Please choose a valid payout/credit account (account_id)."
             )
@@ -682,149 +703,175 @@ class IdilEmployeeSalary(models.Model):
         if not salary_expense_trx_source:
             raise ValidationError("Transaction Source 'Salary Expense' is missing.")
 
-        # --- Currencies ---
-        doc_currency = record.currency_id  # salary document currency (your default SL)
-        rate = record.rate
-
         expense_currency = self._require_account_currency(
             salary_expense_account, "Salary Expense account"
         )
-        credit_currency = self._require_account_currency(
-            credit_account, "Payout/Credit account"
+
+        # --- Balance check MUST be in credit account currency ---
+        # One aggregate per run; each salary consumes it before the next is checked
+        self.env["idil.transaction_bookingline"].flush_model()
+        balances = dict.fromkeys(records.account_id.ids, 0.0)
+        balances.update(
+            self.env["idil.account.balance"].get_balances(records.account_id.ids)
         )
+        clearing_accounts = {}
 
-        # Amount in each account currency (based on document currency)
-        amount_in_doc = float(record.total_salary or 0.0)
+        header_vals = []
+        line_groups = []
+        for record in records:
+            credit_account = record.account_id
 
-        amount_for_expense = self._convert_amount(
-            amount_in_doc, doc_currency, expense_currency, rate, ctx="Salary -> Expense"
-        )
-        amount_for_credit = self._convert_amount(
-            amount_in_doc, doc_currency, credit_currency, rate, ctx="Salary -> Payout"
-        )
+            # --- Currencies ---
+            doc_currency = record.currency_id  # salary document currency (your default SL)
+            rate = record.rate
 
-        # --- Balance check MUST be in credit account currency ---
-        lines = BookingLine.search([("account_number", "=", credit_account.id)])
-        current_balance = sum(lines.mapped("dr_amount")) - sum(
-            lines.mapped("cr_amount")
-        )
+            credit_currency = self._require_account_currency(
+                credit_account, "Payout/Credit account"
+            )
 
-        if current_balance < amount_for_credit:
-            raise ValidationError(
-                f"Insufficient balance in account '{credit_account.name}'. "
-                f"Available: {current_balance}, required: {amount_for_credit} ({credit_currency.name})."
+            # Amount in each account currency (based on document currency)
+            amount_in_doc = float(record.total_salary or 0.0)
+
+            amount_for_expense = self._convert_amount(
+                amount_in_doc, doc_currency, expense_currency, rate, ctx="Salary -> Expense"
+            )
+            amount_for_credit = self._convert_amount(
+                amount_in_doc, doc_currency, credit_currency, rate, ctx="Salary -> Payout"
             )
 
-        # --- Create booking header ---
-        trx = TransactionBooking.create(
-            {
-                "transaction_number": self.env["ir.sequence"].next_by_code(
-                    "idil.transaction_booking"
+            current_balance = balances[credit_account.id]
+            if current_balance < amount_for_credit:
+                raise ValidationError(
+                    f"Insufficient balance in account '{credit_account.name}'. "
+                    f"Available: {current_balance}, required: {amount_for_credit} ({credit_currency.name})."
                 )
-                or "/",
-                "reffno": str(record.id),
+            balances[credit_account.id] -= amount_for_credit
+
+            # --- Booking header ---
+            header_vals.append(
+                {
+                    "transaction_number": self.env["ir.sequence"].next_by_code(
+                        "idil.transaction_booking"
+                    )
+                    or "/",
+                    "reffno": str(record.id),
+                    "employee_salary_id": record.id,
+                    "employee_id": record.employee_id.id,
+                    "trx_source_id": salary_expense_trx_source.id,
+                    "payment_method": "cash",
+                    "payment_status": "paid",
+                    "rate": rate,
+                    "trx_date": record.salary_date,
+                    # keep header "amount" in document currency (recommended)
+                    "amount": amount_in_doc,
+                    "amount_paid": amount_in_doc,
+                    "remaining_amount": 0,
+                }
+            )
+
+            desc = (
+                "Salary Payment of - "
+                + record.salary_date.strftime("%Y-%m")
+                + " for - "
+                + record.employee_id.name
+            )
+            base = {
                 "employee_salary_id": record.id,
-                "employee_id": record.employee_id.id,
-                "trx_source_id": salary_expense_trx_source.id,
-                "payment_method": "cash",
-                "payment_status": "paid",
-                "rate": rate,
-                "trx_date": record.salary_date,
-                # keep header "amount" in document currency (recommended)
-                "amount": amount_in_doc,
-                "amount_paid": amount_in_doc,
-                "remaining_amount": 0,
+                "transaction_date": record.salary_date,
             }
-        )
 
-        desc = (
-            "Salary Payment of - "
-            + record.salary_date.strftime("%Y-%m")
-            + " for - "
-            + record.employee_id.name
-        )
+            # --- Same currency: normal 2 lines ---
+            if expense_currency.id == credit_currency.id:
+                line_groups.append(
+                    (
+                        record,
+                        False,
+                        [
+                            dict(
+                                base,
+                                description=desc,
+                                account_number=salary_expense_account.id,
+                                transaction_type="dr",
+                                dr_amount=amount_for_expense,
+                                cr_amount=0.0,
+                            ),
+                            dict(
+                                base,
+                                description=desc,
+                                account_number=credit_account.id,
+                                transaction_type="cr",
+                                dr_amount=0.0,
+                                cr_amount=amount_for_expense,
+                            ),
+                        ],
+                    )
+                )
+                continue
 
-        # --- Same currency: normal 2 lines ---
-        if expense_currency.id == credit_currency.id:
-            BookingLine.create(
-                [
-                    {
-                        "transaction_booking_id": trx.id,
-                        "employee_salary_id": record.id,
-                        "description": desc,
-                        "account_number": salary_expense_account.id,
-                        "transaction_type": "dr",
-                        "dr_amount": amount_for_expense,
-                        "cr_amount": 0.0,
-                        "transaction_date": record.salary_date,
-                    },
-                    {
-                        "transaction_booking_id": trx.id,
-                        "employee_salary_id": record.id,
-                        "description": desc,
-                        "account_number": credit_account.id,
-                        "transaction_type": "cr",
-                        "dr_amount": 0.0,
-                        "cr_amount": amount_for_expense,
-                        "transaction_date": record.salary_date,
-                    },
-                ]
+            # --- Different currencies: 4 lines with clearing accounts ---
+            for currency in (expense_currency, credit_currency):
+                if currency.id not in clearing_accounts:
+                    clearing_accounts[currency.id] = self._get_exchange_clearing(currency)
+            source_clearing = clearing_accounts[expense_currency.id]
+            target_clearing = clearing_accounts[credit_currency.id]
+
+            line_groups.append(
+                (
+                    record,
+                    True,
+                    [
+                        # 1) DR Salary Expense (expense currency)
+                        dict(
+                            base,
+                            description=desc,
+                            account_number=salary_expense_account.id,
+                            transaction_type="dr",
+                            dr_amount=amount_for_expense,
+                            cr_amount=0.0,
+                        ),
+                        # 2) CR Source Clearing (expense currency)
+                        dict(
+                            base,
+                            description="Salary - Source Clearing",
+                            account_number=source_clearing.id,
+                            transaction_type="cr",
+                            dr_amount=0.0,
+                            cr_amount=amount_for_expense,
+                        ),
+                        # 3) DR Target Clearing (credit currency)
+                        dict(
+                            base,
+                            description="Salary - Target Clearing",
+                            account_number=target_clearing.id,
+                            transaction_type="dr",
+                            dr_amount=amount_for_credit,
+                            cr_amount=0.0,
+                        ),
+                        # 4) CR Payout/Credit account (credit currency)
+                        dict(
+                            base,
+                            description=desc,
+                            account_number=credit_account.id,
+                            transaction_type="cr",
+                            dr_amount=0.0,
+                            cr_amount=amount_for_credit,
+                        ),
+                    ],
+                )
             )
-            return
 
-        # --- Different currencies: 4 lines with clearing accounts ---
-        source_clearing = self._get_exchange_clearing(expense_currency)
-        target_clearing = self._get_exchange_clearing(credit_currency)
-
-        BookingLine.create(
-            [
-                # 1) DR Salary Expense (expense currency)
-                {
-                    "transaction_booking_id": trx.id,
-                    "employee_salary_id": record.id,
-                    "description": desc,
-                    "account_number": salary_expense_account.id,
-                    "transaction_type": "dr",
-                    "dr_amount": amount_for_expense,
-                    "cr_amount": 0.0,
-                    "transaction_date": record.salary_date,
-                },
-                # 2) CR Source Clearing (expense currency)
-                {
-                    "transaction_booking_id": trx.id,
-                    "employee_salary_id": record.id,
-                    "description": "Salary - Source Clearing",
-                    "account_number": source_clearing.id,
-                    "transaction_type": "cr",
-                    "dr_amount": 0.0,
-                    "cr_amount": amount_for_expense,
-                    "transaction_date": record.salary_date,
-                },
-                # 3) DR Target Clearing (credit currency)
-                {
-                    "transaction_booking_id": trx.id,
-                    "employee_salary_id": record.id,
-                    "description": "Salary - Target Clearing",
-                    "account_number": target_clearing.id,
-                    "transaction_type": "dr",
-                    "dr_amount": amount_for_credit,
-                    "cr_amount": 0.0,
-                    "transaction_date": record.salary_date,
-                },
-                # 4) CR Payout/Credit account (credit currency)
-                {
-                    "transaction_booking_id": trx.id,
-                    "employee_salary_id": record.id,
-                    "description": desc,
-                    "account_number": credit_account.id,
-                    "transaction_type": "cr",
-                    "dr_amount": 0.0,
-                    "cr_amount": amount_for_credit,
-                    "transaction_date": record.salary_date,
-                },
-            ]
-        )
-        record.is_paid = True
+        # --- Create every header, then every line, in one call each ---
+        bookings = TransactionBooking.create(header_vals)
+        line_vals = []
+        converted = self.browse()
+        for trx, (record, is_converted, lines) in zip(bookings, line_groups):
+            for vals in lines:
+                vals["transaction_booking_id"] = trx.id
+            line_vals.extend(lines)
+            if is_converted:
+                converted |= record
+        BookingLine.create(line_vals)
+        converted.write({"is_paid": True})
 
     @api.depends(
         "total_earnings",
@@ -1048,34 +1095,58 @@ class IdilEmployeeSalary(models.Model):
     #     return super(IdilEmployeeSalary, self).unlink()
 
     @api.model
-    def process_monthly_salary(self, _logger=None):
+    def process_monthly_salary(self, account_id, salary_date=None):
+        """
+        Pay the monthly salary of every employee with a valid contract from
+        the payout account account_id.
+
+        The run is created and booked as one batch. If anything in it fails,
+        each employee is retried on its own under a savepoint so a single
+        bad record does not abort the run. Returns a run summary:
+        {"salaries": created records, "errors": ["<employee>: <reason>"]}.
+        """
+        salary_date = fields.Date.to_date(salary_date) if salary_date else fields.Date.today()
         employees = self.env["idil.employee"].search([])
-        salary_logs = []
+        errors = []
+        vals_list = []
         for employee in employees:
             if employee.contract_start_date and employee.contract_end_date:
-                today = fields.Date.today()
-                if employee.contract_start_date <= today <= employee.contract_end_date:
-                    # Create salary record
-                    self.create(
+                if employee.contract_start_date <= salary_date <= employee.contract_end_date:
+                    vals_list.append(
                         {
                             "employee_id": employee.id,
-                            "basic_salary": employee.salary,
+                            "account_id": account_id,
+                            "salary_date": salary_date,
                             "bonus": employee.bonus,
                         }
                     )
                 else:
-                    salary_logs.append(
-                        f"Contract expired for employee {employee.name}."
-                    )
+                    errors.append(f"{employee.name}: Contract expired.")
             else:
-                salary_logs.append(
-                    f"Missing contract dates for employee {employee.name}."
-                )
-
-        if salary_logs:
-            # Log the warnings
-            _logger.warning("\n".join(salary_logs))
-            raise UserError("\n".join(salary_logs))
+                errors.append(f"{employee.name}: Missing contract dates.")
+
+        salaries = self.browse()
+        try:
+            with self.env.cr.savepoint():
+                salaries = self.create(vals_list)
+        except Exception:
+            for vals in vals_list:
+                try:
+                    with self.env.cr.savepoint():
+                        salaries |= self.create([dict(vals)])
+                except Exception as e:
+                    employee = self.env["idil.employee"].browse(vals["employee_id"])
+                    errors.append(f"{employee.name}: {e}")
+
+        _logger.info(
+            "Monthly payroll %s: %s salaries created, %s employee(s) skipped.",
+            salary_date,
+            len(salaries),
+            len(errors),
+        )
+        if errors:
+            _logger.warning("\n".join(errors))
+        return {"salaries": salaries, "errors": errors}
 
     def action_generate_salary_report_pdf(self):
         """Generate the payment slip for the selected employee."""
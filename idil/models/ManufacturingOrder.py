@@ -361,7 +361,7 @@ class ManufacturingOrder(models.Model):
 
     @api.depends("currency_id", "scheduled_start_date", "company_id")
     def _compute_exchange_rate(self):
-        Rate = self.env["res.currency.rate"].sudo()
+        RateService = self.env["idil.currency.rate.service"].sudo()
         for order in self:
             order.rate = 0.0
             if not order.currency_id:
@@ -374,19 +374,11 @@ class ManufacturingOrder(models.Model):
                 else fields.Date.today()
             )
 
-            # Get latest rate on or before the doc_date, preferring the order's company, then global (company_id False)
-            rate_rec = Rate.search(
-                [
-                    ("currency_id", "=", order.currency_id.id),
-                    ("name", "<=", doc_date),
-                    ("company_id", "in", [order.company_id.id, False]),
-                ],
-                order="company_id desc, name desc",
-                limit=1,
+            # Get latest rate on or before the doc_date (global rates, then the order's company)
+            order.rate = RateService.get_document_rate(
+                order.currency_id, doc_date, order.company_id
             )
 
-            order.rate = rate_rec.rate or 0.0
-
     @api.constrains("currency_id", "scheduled_start_date", "company_id")
     def _check_exchange_rate_exists(self):
         Rate = self.env["res.currency.rate"].sudo()
@@ -612,7 +604,46 @@ class ManufacturingOrder(models.Model):
             _logger.error("MO create failed: %s", str(e))
             raise ValidationError(f"MO create failed: {str(e)}")
 
+    def _get_stock_key(self):
+        """Place and day the components of the MO are taken from."""
+        self.ensure_one()
+        return (
+            self.source_warehouse_id.id,
+            self.source_location_id.id,
+            self.scheduled_start_date.date() if self.scheduled_start_date else None,
+        )
+
+    def _get_exchange_clearing_accounts(self):
+        """{currency id: Exchange Clearing Account} for the currencies of self."""
+        currencies = (
+            self.manufacturing_order_line_ids.item_id.asset_account_id.currency_id
+            | self.product_id.asset_account_id.currency_id
+        )
+        accounts = self.env["idil.chart.account"].search(
+            [
+                ("name", "=", "Exchange Clearing Account"),
+                ("currency_id", "in", currencies.ids),
+            ]
+        )
+        clearing = {}
+        for account in accounts:
+            # first match, like search(limit=1) per currency
+            clearing.setdefault(account.currency_id.id, account)
+        return clearing
+
     def action_confirm(self):
+        # Stock of every component and the clearing accounts of the whole
+        # batch are read once; components consumed by the orders confirmed
+        # before in the batch are taken off in memory. The quants stay
+        # locked until commit so concurrent confirmations cannot oversell.
+        availability = self.env["idil.item"].get_stock_availability(
+            self.manufacturing_order_line_ids.item_id.ids,
+            [order._get_stock_key() for order in self],
+            lock=True,
+        )
+        clearing_accounts = self._get_exchange_clearing_accounts()
+        consumed = []  # (item id, warehouse id, location id, date, qty)
+
         for order in self:
             if order.status != "draft":
                 raise ValidationError("Only Draft orders can be confirmed.")
@@ -644,16 +675,18 @@ class ManufacturingOrder(models.Model):
                     )
 
             # ✅ check balances
+            key = order._get_stock_key()
+            warehouse_id, location_id, as_of_date = key
             for line in order.manufacturing_order_line_ids:
-                available_qty = line.item_id.get_qty_in_location(
-                    warehouse_id=order.source_warehouse_id.id,
-                    location_id=order.source_location_id.id,
-                    as_of_date=(
-                        order.scheduled_start_date.date()
-                        if order.scheduled_start_date
-                        else None
-                    ),
-                )
+                available_qty = availability[(line.item_id.id, key)]
+                if warehouse_id and location_id:
+                    available_qty -= sum(
+                        qty
+                        for item_id, wh_id, loc_id, day, qty in consumed
+                        if item_id == line.item_id.id
+                        and (wh_id, loc_id) == (warehouse_id, location_id)
+                        and (not as_of_date or not day or day <= as_of_date)
+                    )
 
                 if float_compare(available_qty, line.quantity, precision_digits=5) < 0:
                     raise ValidationError(
@@ -661,6 +694,9 @@ class ManufacturingOrder(models.Model):
                         f"{order.source_warehouse_id.name}/{order.source_location_id.name}. "
                         f"Available: {available_qty:.5f}, Required: {line.quantity:.5f}, Date: {order.scheduled_start_date}."
                     )
+                consumed.append(
+                    (line.item_id.id, warehouse_id, location_id, as_of_date, line.quantity)
+                )
 
             # ✅ prevent double posting
             if order.transaction_booking_id:
@@ -688,28 +724,11 @@ class ManufacturingOrder(models.Model):
                 cost_amount_usd = line.cost_price * line.quantity
                 cost_amount_sos = cost_amount_usd * order.rate
 
-                source_clearing_account = self.env["idil.chart.account"].search(
-                    [
-                        ("name", "=", "Exchange Clearing Account"),
-                        (
-                            "currency_id",
-                            "=",
-                            line.item_id.asset_account_id.currency_id.id,
-                        ),
-                    ],
-                    limit=1,
+                source_clearing_account = clearing_accounts.get(
+                    line.item_id.asset_account_id.currency_id.id
                 )
-
-                target_clearing_account = self.env["idil.chart.account"].search(
-                    [
-                        ("name", "=", "Exchange Clearing Account"),
-                        (
-                            "currency_id",
-                            "=",
-                            order.product_id.asset_account_id.currency_id.id,
-                        ),
-                    ],
-                    limit=1,
+                target_clearing_account = clearing_accounts.get(
+                    order.product_id.asset_account_id.currency_id.id
                 )
 
                 if not source_clearing_account or not target_clearing_account:
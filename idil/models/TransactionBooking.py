@@ -1,15 +1,27 @@
 from datetime import datetime
 
-from odoo import models, fields, api, exceptions
+from odoo import models, fields, api, exceptions, _
 from odoo.exceptions import UserError, ValidationError
 import re
 import logging
+import uuid
 from odoo.tools.float_utils import float_round
 from odoo.tools.float_utils import float_compare
 
+from .db_indexes import ensure_indexes
+
 
 _logger = logging.getLogger(__name__)
 
+# Booking line columns feeding the idil.account.balance running totals
+BALANCE_FIELDS = {
+    "account_number",
+    "company_id",
+    "transaction_type",
+    "dr_amount",
+    "cr_amount",
+}
+
 
 class TransactionBooking(models.Model):
     _name = "idil.transaction_booking"
@@ -657,6 +669,8 @@ class TransactionBookingline(models.Model):
         ondelete="cascade",
     )
 
+    def init(self):
+        ensure_indexes(self.env.cr, self._table)
 
     @api.constrains("transaction_date")
     def _check_transaction_date_not_future(self):
@@ -675,12 +689,14 @@ class TransactionBookingline(models.Model):
             else:
                 line.account_display = ""
 
-    @api.model
-    def create(self, vals):
-        # Only check budget if it's a new separate line or we are fully creating it
-        # If created via parent, vals might be simple. 
-        self._check_budget_control(vals)
-        return super(TransactionBookingline, self).create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        # All lines of the batch are checked against the budget together,
+        # before any of them is inserted
+        self._check_budget_control_batch(vals_list)
+        lines = super(TransactionBookingline, self).create(vals_list)
+        self._invalidate_running_balances()
+        return lines
 
     def write(self, vals):
         # Determine effective values for check
@@ -730,7 +746,25 @@ class TransactionBookingline(models.Model):
                 # If I pass `rec.id` to exclude, that's better.
                 pass 
                 
-        return super(TransactionBookingline, self).write(vals)
+        res = super(TransactionBookingline, self).write(vals)
+        if BALANCE_FIELDS.intersection(vals):
+            # The running balance trigger only fires once the UPDATE reaches the DB
+            self.flush_recordset(list(BALANCE_FIELDS.intersection(vals)))
+            self._invalidate_running_balances()
+        return res
+
+    def unlink(self):
+        res = super(TransactionBookingline, self).unlink()
+        self._invalidate_running_balances()
+        return res
+
+    def _invalidate_running_balances(self):
+        """Drop cached balances rewritten by the running balance/snapshot triggers."""
+        self.env["idil.account.balance"].invalidate_model()
+        self.env["idil.account.balance.snapshot"].invalidate_model()
+        self.env["idil.chart.account"].invalidate_model(["balance"])
+        # Posting moves the dashboard KPIs too
+        self.env["idil.dashboard"]._invalidate_kpi_cache()
 
     @api.onchange('dr_amount', 'account_number', 'transaction_date')
     def _onchange_budget_check(self):
@@ -740,7 +774,10 @@ class TransactionBookingline(models.Model):
             
             department_id = self.employee_id.department_id.id if self.employee_id else False
 
-            allowed, msg = Budget.check_budget_availability(self.account_number.id, self.dr_amount, date_val, department_id=department_id)
+            allowed, msg = Budget.check_budget_availability(
+                self.account_number.id, self.dr_amount, date_val,
+                department_id=department_id, company_id=self.company_id.id,
+            )
             
             if msg:
                 if not allowed:
@@ -759,45 +796,57 @@ class TransactionBookingline(models.Model):
                     }
 
     def _check_budget_control(self, vals):
-        dr = vals.get('dr_amount', 0)
-        account_id = vals.get('account_number')
-        date = vals.get('transaction_date') or fields.Date.today()
-        
-        # Determine Employee/Department
-        # 1. Try explicit in vals (rare for related)
-        employee_id = vals.get('employee_id')
-        
-        # 2. Try from existing record (if write)
-        if not employee_id and self:
-             employee_id = self.employee_id.id
-             
-        # 3. Try from parent booking in vals
-        if not employee_id:
-             booking_id = vals.get('transaction_booking_id')
-             if booking_id:
-                 booking = self.env['idil.transaction_booking'].browse(booking_id)
-                 if booking.employee_id:
-                      employee_id = booking.employee_id.id
-                      
-        department_id = False
-        if employee_id:
-            emp = self.env['idil.employee'].browse(employee_id)
-            if emp.department_id:
-                 department_id = emp.department_id.id
-        
-        if dr > 0 and account_id:
-            Budget = self.env['idil.budget']
-            allowed, msg = Budget.check_budget_availability(account_id, dr, date, department_id=department_id)
-            
+        self._check_budget_control_batch([vals])
+
+    def _check_budget_control_batch(self, vals_list):
+        Booking = self.env['idil.transaction_booking']
+        # Browse the parent bookings together so their employees are prefetched
+        bookings = Booking.browse({
+            vals['transaction_booking_id'] for vals in vals_list
+            if vals.get('transaction_booking_id')
+        })
+        bookings.mapped('employee_id.department_id')
+
+        entries = []
+        for vals in vals_list:
+            # Determine Employee/Department
+            # 1. Try explicit in vals (rare for related)
+            employee = self.env['idil.employee'].browse(vals.get('employee_id'))
+
+            # 2. Try from existing record (if write)
+            if not employee and self:
+                employee = self.employee_id
+
+            # 3. Try from parent booking in vals
             booking_id = vals.get('transaction_booking_id') or (self.transaction_booking_id.id if self else False)
-            
+            if not employee and booking_id:
+                employee = Booking.browse(booking_id).employee_id
+
+            entries.append({
+                'company_id': vals.get('company_id') or self.env.company.id,
+                'account_id': vals.get('account_number'),
+                'department_id': employee.department_id.id or False,
+                'date': vals.get('transaction_date') or fields.Date.today(),
+                'dr_amount': vals.get('dr_amount') or 0,
+                'cr_amount': vals.get('cr_amount') or 0,
+                'booking_id': booking_id,
+            })
+
+        Budget = self.env['idil.budget']
+        results = Budget.check_budget_batch(entries)
+
+        warnings = {}
+        for entry, (allowed, msg) in zip(entries, results):
             if not allowed:
                 raise ValidationError(msg)
-            elif msg and booking_id:
-                 try:
-                    self.env['idil.transaction_booking'].browse(booking_id).message_post(body=msg)
-                 except:
-                    pass
+            if msg and entry['booking_id']:
+                warnings.setdefault(entry['booking_id'], []).append(msg)
+
+        for booking_id, messages in warnings.items():
+            try:
+                Booking.browse(booking_id).message_post(body="\n\n".join(messages))
+            except:
+                pass
 
     @api.model
     def compute_trial_balance(self, report_currency_id, start_date=None, end_date=None):
@@ -839,11 +888,15 @@ class TransactionBookingline(models.Model):
         total_dr_balance = 0
         total_cr_balance = 0
 
-        # Clear previous trial balance records
-        self.env["idil.trial.balance"].search([]).unlink()
-
+        # Every run writes its own rows under a fresh key, so users running
+        # the report at the same time never touch each other's results
+        report_key = uuid.uuid4().hex
+        accounts = self.env["idil.chart.account"].browse(
+            [line["account_number"] for line in result]
+        )
+        vals_list = []
         for line in result:
-            account = self.env["idil.chart.account"].browse(line["account_number"])
+            account = accounts.browse(line["account_number"])
             # Compute the net balance for the account
             net_balance = line["dr_total"] - line["cr_total"]
 
@@ -858,9 +911,9 @@ class TransactionBookingline(models.Model):
                 cr_balance = abs(net_balance)
                 total_cr_balance += cr_balance
 
-            # Create the trial balance record
-            self.env["idil.trial.balance"].create(
+            vals_list.append(
                 {
+                    "report_key": report_key,
                     "account_number": account.id,
                     "header_name": account.header_name,
                     "currency_id": line["currency_id"],
@@ -871,21 +924,23 @@ class TransactionBookingline(models.Model):
 
         # Add a grand total row if a report currency is specified
         if report_currency_id:
-            self.env["idil.trial.balance"].create(
+            vals_list.append(
                 {
+                    "report_key": report_key,
                     "account_number": None,
                     "currency_id": report_currency_id.id,
                     "dr_balance": total_dr_balance,
                     "cr_balance": total_cr_balance,
-                    "label": "Grand Total",
                 }
             )
+        self.env["idil.trial.balance"].create(vals_list)
 
         return {
             "type": "ir.actions.act_window",
             "name": "Trial Balance",
             "view_mode": "tree",
             "res_model": "idil.trial.balance",
+            "domain": [("report_key", "=", report_key)],
             "target": "new",
         }
 
@@ -902,30 +957,25 @@ class TransactionBookingline(models.Model):
         if start_date:
             start_date = fields.Date.to_date(start_date)
 
-        Currency = self.env["res.currency"]
         Account = self.env["idil.chart.account"]
         TrialBal = self.env["idil.company.trial.balance"]
 
         # Use the report currency if provided, else company currency
         report_currency = report_currency_id or company_id.currency_id
 
-        # --- clear only my previous rows (and this company if field exists) ---
-        clear_domain = [("create_uid", "=", self.env.uid)]
-        if "company_id" in TrialBal._fields:
-            clear_domain.append(("company_id", "=", company_id.id))
-        TrialBal.search(clear_domain).unlink()
+        # --- rows of this run only, see compute_trial_balance ---
+        report_key = uuid.uuid4().hex
 
-        # --- fetch raw lines using ONLY transaction_date ---
+        # --- totals per account/currency/rate using ONLY transaction_date ---
         comparator = "=" if exact_day else "<="
 
         query = """
             SELECT
                 tb.account_number,
-                tb.dr_amount,
-                tb.cr_amount,
-                tb.transaction_date::date AS tdate,
                 ca.currency_id,
-                tb.rate
+                tb.rate,
+                SUM(tb.dr_amount) AS dr_amount,
+                SUM(tb.cr_amount) AS cr_amount
             FROM idil_transaction_bookingline tb
             JOIN idil_chart_account ca ON tb.account_number = ca.id
             WHERE tb.company_id = %s
@@ -940,40 +990,39 @@ class TransactionBookingline(models.Model):
             query += f" AND tb.transaction_date {comparator} %s::date"
             params.append(as_of_date)
 
+        query += " GROUP BY tb.account_number, ca.currency_id, tb.rate"
+
         self.env.cr.execute(query, tuple(params))
         rows = self.env.cr.dictfetchall()
 
-        # --- aggregate in report currency, converting at tdate (transaction_date)
-        #     but prefer per-transaction tb.rate when available ---
+        # --- aggregate in report currency, preferring the per-transaction
+        #     tb.rate when the account is in another currency ---
         balances = {}  # {account_id: {'dr': x, 'cr': y}}
         for r in rows:
             acc_id = r["account_number"]
-            src_cur = Currency.browse(r["currency_id"])
-            dr_src = r["dr_amount"] or 0.0
-            cr_src = r["cr_amount"] or 0.0
+            dr_src = float(r["dr_amount"] or 0.0)
+            cr_src = float(r["cr_amount"] or 0.0)
             tx_rate = r.get("rate")  # per-transaction rate from tb.rate (may be None)
 
             # If transaction currency equals report currency -> no conversion
-            if src_cur.id == report_currency.id:
-                dr_rep = float(dr_src)
-                cr_rep = float(cr_src)
+            if r["currency_id"] == report_currency.id:
+                dr_rep = dr_src
+                cr_rep = cr_src
             # If a tx-specific rate exists -> use it (assumes rate converts src -> report)
-            elif tx_rate not in (None, ""):
-                # tx_rate might be a Decimal/float/string; coerce to float safely
-                try:
-                    rate_val = float(tx_rate)
-                except (TypeError, ValueError):
-                    rate_val = None
-
-                if rate_val is not None:
-                    dr_rep = float(dr_src) / rate_val
-                    cr_rep = float(cr_src) / rate_val
+            elif tx_rate:
+                dr_rep = dr_src / float(tx_rate)
+                cr_rep = cr_src / float(tx_rate)
+            else:
+                # No usable rate: the amounts cannot be expressed in the report currency
+                continue
 
             b = balances.setdefault(acc_id, {"dr": 0.0, "cr": 0.0})
             b["dr"] += dr_rep
             b["cr"] += cr_rep
 
-        # --- write detail lines + grand total ---
+        # --- write detail lines + grand total in one batch ---
+        accounts = Account.browse(list(balances))
+        vals_list = []
         grand_dr = grand_cr = 0.0
         for acc_id, t in balances.items():
             net = t["dr"] - t["cr"]
@@ -983,46 +1032,40 @@ class TransactionBookingline(models.Model):
             dr_bal = report_currency.round(net if net > 0 else 0.0)
             cr_bal = report_currency.round(-net if net < 0 else 0.0)
 
-            acc = Account.browse(acc_id)
-            vals = {
-                "account_number": acc.id,
-                "header_name": acc.header_name,
-                "currency_id": report_currency.id,
-                "dr_balance": dr_bal,
-                "cr_balance": cr_bal,
-            }
-            if "company_id" in TrialBal._fields:
-                vals["company_id"] = company_id.id
-            if "as_of_date" in TrialBal._fields:
-                vals["as_of_date"] = as_of_date
-            TrialBal.create(vals)
+            acc = accounts.browse(acc_id)
+            vals_list.append(
+                {
+                    "report_key": report_key,
+                    "account_number": acc.id,
+                    "header_name": acc.header_name,
+                    "currency_id": report_currency.id,
+                    "dr_balance": dr_bal,
+                    "cr_balance": cr_bal,
+                    "company_id": company_id.id,
+                }
+            )
 
             grand_dr += dr_bal
             grand_cr += cr_bal
 
-        total_vals = {
-            "account_number": False,
-            "currency_id": report_currency.id,
-            "label": (
-                f"Grand Total (as of {as_of_date})"
-                if not exact_day
-                else f"Grand Total ({as_of_date})"
-            ),
-            "dr_balance": grand_dr,
-            "cr_balance": grand_cr,
-        }
-        if "company_id" in TrialBal._fields:
-            total_vals["company_id"] = company_id.id
-        if "as_of_date" in TrialBal._fields:
-            total_vals["as_of_date"] = as_of_date
-        TrialBal.create(total_vals)
+        vals_list.append(
+            {
+                "report_key": report_key,
+                "account_number": False,
+                "currency_id": report_currency.id,
+                "dr_balance": grand_dr,
+                "cr_balance": grand_cr,
+                "company_id": company_id.id,
+            }
+        )
+        TrialBal.create(vals_list)
 
         return {
             "type": "ir.actions.act_window",
             "name": f"Company Trial Balance — {as_of_date}",
             "view_mode": "tree",
             "res_model": "idil.company.trial.balance",
-            "domain": clear_domain,  # show only the rows we just created
+            "domain": [("report_key", "=", report_key)],  # show only the rows we just created
             "target": "new",
         }
 
@@ -1193,10 +1236,12 @@ class IncomeStatementWizard(models.TransientModel):
         return action
 
 
-class CompanyTrialBalance(models.Model):
+class CompanyTrialBalance(models.TransientModel):
     _name = "idil.company.trial.balance"
     _description = "Company Trial Balance"
 
+    report_key = fields.Char(string="Report Run", index=True, readonly=True)
+
     account_number = fields.Many2one("idil.chart.account", string="Account Number")
     header_name = fields.Char(string="Account Type")
     dr_balance = fields.Float(string="Dr", digits=(16, 3))
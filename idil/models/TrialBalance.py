@@ -27,10 +27,12 @@ class TrialBalanceWizard(models.TransientModel):
         return action
 
 
-class TrialBalance(models.Model):
+class TrialBalance(models.TransientModel):
     _name = 'idil.trial.balance'
     _description = 'Trial Balance'
 
+    report_key = fields.Char(string='Report Run', index=True, readonly=True)
+
     account_number = fields.Many2one('idil.chart.account', string='Account Number')
     header_name = fields.Char(string='Account Type')
     dr_balance = fields.Float(string='Dr')
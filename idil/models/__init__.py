@@ -6,6 +6,9 @@ from . import unitmeasure
 from . import item_category
 from . import chart_of_accounts
 from . import TransactionBooking
+from . import account_balance
+from . import account_balance_snapshot
+from . import currency_rate_service
 from . import purchases
 from . import BOM
 from . import BOMType
@@ -20,6 +23,7 @@ from . import pos_order_mod
 from . import CustomPosSession
 from . import pos_session
 from . import posorder
+from . import pos_posting_queue
 from . import pos_payment_method
 from . import idil_employee
 from . import Extend_pos_payment_method
@@ -75,8 +79,10 @@ from . import payment_method
 from . import purchase_received
 from . import purchase_receive_wizard
 from . import warehouse_location
+from . import stock_quant
 from . import internaltransfer
 from . import BizcoreDbBackup
+from . import db_backup_job
 from . import product_cost_history
 from . import ManufacturingCostType
 from . import ManufacturingOrderCostLine
@@ -85,6 +91,7 @@ from . import unbalanced_transaction_report
 
 # from . import model_export_wizard
 # from . import report_production_summary
+from . import sales_daily_fact
 from . import dashboard_stats
 from . import report_cashflow
 from . import report_daily_sales
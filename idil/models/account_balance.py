@@ -0,0 +1,233 @@
+from odoo import models, fields, api, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountBalance(models.Model):
+    """
+    Running Dr/Cr totals per account and company.
+
+    Rows are maintained by a database trigger on idil_transaction_bookingline,
+    so every insert/update/delete (ORM create/write/unlink, ondelete cascades
+    from the parent documents and raw SQL) moves the totals in the same
+    transaction. Totals follow the Current Balance rule of the chart of
+    accounts: Dr lines count their dr_amount, Cr lines their cr_amount.
+    """
+
+    _name = "idil.account.balance"
+    _description = "Account Running Balance"
+    _order = "account_id, company_id"
+
+    account_id = fields.Many2one(
+        "idil.chart.account",
+        string="Account",
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    company_id = fields.Many2one(
+        "res.company", string="Company", required=True, readonly=True, index=True
+    )
+    currency_id = fields.Many2one("res.currency", string="Currency", readonly=True)
+    dr_total = fields.Float(string="Debit Total", digits=(16, 5), readonly=True)
+    cr_total = fields.Float(string="Credit Total", digits=(16, 5), readonly=True)
+    balance = fields.Float(string="Balance", digits=(16, 5), readonly=True)
+    line_count = fields.Integer(string="Lines", readonly=True)
+
+    _sql_constraints = [
+        (
+            "uniq_account_company",
+            "unique(account_id, company_id)",
+            "Only one running balance row is allowed per account and company.",
+        ),
+    ]
+
+    def init(self):
+        cr = self.env.cr
+        cr.execute(
+            """
+            CREATE OR REPLACE FUNCTION idil_account_balance_bump(
+                p_account integer, p_company integer, p_type varchar,
+                p_dr numeric, p_cr numeric, p_sign integer
+            ) RETURNS void AS $$
+            DECLARE
+                v_dr numeric := CASE WHEN p_type = 'dr' THEN COALESCE(p_dr, 0) ELSE 0 END * p_sign;
+                v_cr numeric := CASE WHEN p_type = 'cr' THEN COALESCE(p_cr, 0) ELSE 0 END * p_sign;
+            BEGIN
+                IF p_account IS NULL OR p_company IS NULL THEN
+                    RETURN;
+                END IF;
+                INSERT INTO idil_account_balance AS ab
+                    (account_id, company_id, currency_id, dr_total, cr_total,
+                     balance, line_count, create_date, write_date)
+                SELECT p_account, p_company, ca.currency_id, v_dr, v_cr,
+                       v_dr - v_cr, p_sign, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+                  FROM idil_chart_account ca
+                 WHERE ca.id = p_account
+                ON CONFLICT (account_id, company_id) DO UPDATE
+                   SET dr_total = ab.dr_total + EXCLUDED.dr_total,
+                       cr_total = ab.cr_total + EXCLUDED.cr_total,
+                       balance = ab.balance + EXCLUDED.balance,
+                       line_count = ab.line_count + EXCLUDED.line_count,
+                       write_date = EXCLUDED.write_date;
+                UPDATE idil_chart_account
+                   SET balance = COALESCE(balance, 0) + (v_dr - v_cr)
+                 WHERE id = p_account AND (v_dr <> 0 OR v_cr <> 0);
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION idil_account_balance_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM idil_account_balance_bump(
+                        OLD.account_number, OLD.company_id, OLD.transaction_type,
+                        OLD.dr_amount, OLD.cr_amount, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM idil_account_balance_bump(
+                        NEW.account_number, NEW.company_id, NEW.transaction_type,
+                        NEW.dr_amount, NEW.cr_amount, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS idil_account_balance_sync
+                ON idil_transaction_bookingline;
+            CREATE TRIGGER idil_account_balance_sync
+                AFTER INSERT OR DELETE OR UPDATE OF
+                    account_number, company_id, transaction_type, dr_amount, cr_amount
+                ON idil_transaction_bookingline
+                FOR EACH ROW EXECUTE PROCEDURE idil_account_balance_trigger();
+            """
+        )
+        cr.execute("SELECT 1 FROM idil_account_balance LIMIT 1")
+        if not cr.fetchone():
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def _raw_totals_query(self, account_ids=None):
+        """SQL + params aggregating the booking lines per account/company."""
+        where = ""
+        params = []
+        if account_ids:
+            where = "WHERE bl.account_number IN %s"
+            params.append(tuple(account_ids))
+        query = f"""
+            SELECT bl.account_number AS account_id,
+                   bl.company_id,
+                   COALESCE(SUM(CASE WHEN bl.transaction_type = 'dr'
+                                     THEN bl.dr_amount ELSE 0 END), 0) AS dr_total,
+                   COALESCE(SUM(CASE WHEN bl.transaction_type = 'cr'
+                                     THEN bl.cr_amount ELSE 0 END), 0) AS cr_total,
+                   COUNT(*) AS line_count
+              FROM idil_transaction_bookingline bl
+              {where}
+             GROUP BY bl.account_number, bl.company_id
+        """
+        return query, params
+
+    @api.model
+    def rebuild(self, account_ids=None):
+        """Recompute the running balances (and account.balance) from the lines."""
+        cr = self.env.cr
+        self.flush_model()
+        self.env["idil.transaction_bookingline"].flush_model()
+        query, params = self._raw_totals_query(account_ids)
+        if account_ids:
+            cr.execute(
+                "DELETE FROM idil_account_balance WHERE account_id IN %s",
+                (tuple(account_ids),),
+            )
+        else:
+            cr.execute("DELETE FROM idil_account_balance")
+        cr.execute(
+            f"""
+            INSERT INTO idil_account_balance
+                (account_id, company_id, currency_id, dr_total, cr_total,
+                 balance, line_count, create_uid, write_uid, create_date, write_date)
+            SELECT t.account_id, t.company_id, ca.currency_id, t.dr_total, t.cr_total,
+                   t.dr_total - t.cr_total, t.line_count, %s, %s,
+                   now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM ({query}) t
+              JOIN idil_chart_account ca ON ca.id = t.account_id
+            """,
+            [self.env.uid, self.env.uid] + params,
+        )
+        account_filter = "WHERE ca.id IN %s" if account_ids else ""
+        cr.execute(
+            f"""
+            UPDATE idil_chart_account ca
+               SET balance = COALESCE(
+                   (SELECT SUM(ab.balance) FROM idil_account_balance ab
+                     WHERE ab.account_id = ca.id), 0)
+              {account_filter}
+            """,
+            [tuple(account_ids)] if account_ids else [],
+        )
+        self.invalidate_model()
+        self.env["idil.chart.account"].invalidate_model(["balance"])
+        _logger.info(
+            "Rebuilt running balances for %s account(s).",
+            len(account_ids) if account_ids else "all",
+        )
+
+    @api.model
+    def verify(self, account_ids=None, tolerance=0.001):
+        """
+        Compare the running balances against the raw booking lines.
+
+        Returns a list of dicts, one per (account, company) that drifted.
+        """
+        self.flush_model()
+        self.env["idil.transaction_bookingline"].flush_model()
+        query, params = self._raw_totals_query(account_ids)
+        account_filter = "AND COALESCE(ab.account_id, raw.account_id) IN %s"
+        self.env.cr.execute(
+            f"""
+            SELECT COALESCE(ab.account_id, raw.account_id),
+                   COALESCE(ab.company_id, raw.company_id),
+                   COALESCE(ab.dr_total, 0), COALESCE(raw.dr_total, 0),
+                   COALESCE(ab.cr_total, 0), COALESCE(raw.cr_total, 0),
+                   COALESCE(ab.line_count, 0), COALESCE(raw.line_count, 0)
+              FROM idil_account_balance ab
+              FULL OUTER JOIN ({query}) raw
+                ON raw.account_id = ab.account_id AND raw.company_id = ab.company_id
+             WHERE (ABS(COALESCE(ab.dr_total, 0) - COALESCE(raw.dr_total, 0)) > %s
+                OR ABS(COALESCE(ab.cr_total, 0) - COALESCE(raw.cr_total, 0)) > %s
+                OR COALESCE(ab.line_count, 0) <> COALESCE(raw.line_count, 0))
+               {account_filter if account_ids else ""}
+            """,
+            params
+            + [tolerance, tolerance]
+            + ([tuple(account_ids)] if account_ids else []),
+        )
+        return [
+            {
+                "account_id": row[0],
+                "company_id": row[1],
+                "stored_dr": row[2],
+                "actual_dr": row[3],
+                "stored_cr": row[4],
+                "actual_cr": row[5],
+                "stored_lines": row[6],
+                "actual_lines": row[7],
+            }
+            for row in self.env.cr.fetchall()
+        ]
+
+    @api.model
+    def get_balances(self, account_ids, company_id=None):
+        """{account_id: balance} read straight from the running totals."""
+        if not account_ids:
+            return {}
+        domain = [("account_id", "in", list(account_ids))]
+        if company_id:
+            domain.append(("company_id", "=", company_id))
+        groups = self.read_group(domain, ["balance:sum"], ["account_id"])
+        return {g["account_id"][0]: g["balance"] or 0.0 for g in groups}
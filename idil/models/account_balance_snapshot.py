@@ -0,0 +1,305 @@
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Per-line totals shared by the snapshot backfill and the as-of delta query.
+# Expects the booking line as "bl", its company as "rc" and the fallback
+# res.currency.rate lookup (lines without a frozen rate) as "fx".
+_LINE_RATE = "COALESCE(NULLIF(bl.rate, 0), fx.rate)"
+_IS_COMPANY_CCY = "COALESCE(bl.currency_id, rc.currency_id) = rc.currency_id"
+_LINE_TOTALS = f"""
+    COALESCE(SUM(CASE WHEN bl.transaction_type = 'dr' THEN bl.dr_amount ELSE 0 END), 0) AS typed_dr,
+    COALESCE(SUM(CASE WHEN bl.transaction_type = 'cr' THEN bl.cr_amount ELSE 0 END), 0) AS typed_cr,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN COALESCE(bl.dr_amount, 0) ELSE 0 END), 0) AS company_dr,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN COALESCE(bl.cr_amount, 0) ELSE 0 END), 0) AS company_cr,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN 0 ELSE COALESCE(bl.dr_amount, 0) END), 0) AS foreign_dr,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN 0 ELSE COALESCE(bl.cr_amount, 0) END), 0) AS foreign_cr,
+    COALESCE(SUM(CASE WHEN NOT {_IS_COMPANY_CCY} AND {_LINE_RATE} > 0
+        THEN ABS(COALESCE(bl.dr_amount, 0)) + ABS(COALESCE(bl.cr_amount, 0)) ELSE 0 END), 0) AS fx_movement,
+    COALESCE(SUM(CASE WHEN NOT {_IS_COMPANY_CCY} AND {_LINE_RATE} > 0
+        THEN (ABS(COALESCE(bl.dr_amount, 0)) + ABS(COALESCE(bl.cr_amount, 0))) * {_LINE_RATE}
+        ELSE 0 END), 0) AS fx_weighted,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN COALESCE(bl.dr_amount, 0)
+        ELSE COALESCE(bl.dr_amount, 0) / COALESCE(NULLIF({_LINE_RATE}, 0), 1) END), 0) AS hist_dr_usd,
+    COALESCE(SUM(CASE WHEN {_IS_COMPANY_CCY} THEN COALESCE(bl.cr_amount, 0)
+        ELSE COALESCE(bl.cr_amount, 0) / COALESCE(NULLIF({_LINE_RATE}, 0), 1) END), 0) AS hist_cr_usd,
+    COUNT(*) FILTER (WHERE NOT {_IS_COMPANY_CCY} AND {_LINE_RATE} IS NULL) AS missing_rate
+"""
+_LINE_JOINS = """
+    JOIN res_company rc ON rc.id = bl.company_id
+    LEFT JOIN LATERAL (
+        SELECT r.rate
+          FROM res_currency_rate r
+         WHERE NULLIF(bl.rate, 0) IS NULL
+           AND bl.currency_id <> rc.currency_id
+           AND r.currency_id = bl.currency_id
+           AND r.name <= bl.transaction_date
+         ORDER BY r.name DESC
+         LIMIT 1
+    ) fx ON TRUE
+"""
+TOTAL_KEYS = [
+    "typed_dr",
+    "typed_cr",
+    "company_dr",
+    "company_cr",
+    "foreign_dr",
+    "foreign_cr",
+    "fx_movement",
+    "fx_weighted",
+    "hist_dr_usd",
+    "hist_cr_usd",
+    "missing_rate",
+]
+
+
+class AccountBalanceSnapshot(models.Model):
+    """
+    Month-end closing totals per account and company.
+
+    "Balance as of D" is answered from the latest snapshot on or before D
+    plus the booking lines dated after it. Posting into a closed month drops
+    the snapshots from that month onwards (database trigger); the backfill
+    cron recreates them.
+    """
+
+    _name = "idil.account.balance.snapshot"
+    _description = "Account Balance Snapshot"
+    _order = "snapshot_date desc, account_id"
+
+    account_id = fields.Many2one(
+        "idil.chart.account",
+        string="Account",
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    company_id = fields.Many2one(
+        "res.company", string="Company", required=True, readonly=True, index=True
+    )
+    currency_id = fields.Many2one(
+        "res.currency",
+        string="Currency",
+        related="account_id.currency_id",
+        store=True,
+        readonly=True,
+    )
+    snapshot_date = fields.Date(string="Closing Date", required=True, readonly=True)
+
+    typed_dr = fields.Float(string="Debit (Dr lines)", digits=(16, 5), readonly=True)
+    typed_cr = fields.Float(string="Credit (Cr lines)", digits=(16, 5), readonly=True)
+    company_dr = fields.Float(string="Company Currency Debit", digits=(16, 5), readonly=True)
+    company_cr = fields.Float(string="Company Currency Credit", digits=(16, 5), readonly=True)
+    foreign_dr = fields.Float(string="Foreign Currency Debit", digits=(16, 5), readonly=True)
+    foreign_cr = fields.Float(string="Foreign Currency Credit", digits=(16, 5), readonly=True)
+    fx_movement = fields.Float(string="Rated Movement", digits=(16, 5), readonly=True)
+    fx_weighted = fields.Float(string="Rate-Weighted Movement", digits=(16, 5), readonly=True)
+    hist_dr_usd = fields.Float(string="Historical Debit (USD)", digits=(16, 5), readonly=True)
+    hist_cr_usd = fields.Float(string="Historical Credit (USD)", digits=(16, 5), readonly=True)
+    missing_rate = fields.Integer(string="Lines Without Rate", readonly=True)
+
+    _sql_constraints = [
+        (
+            "uniq_account_company_date",
+            "unique(account_id, company_id, snapshot_date)",
+            "Only one snapshot is allowed per account, company and closing date.",
+        ),
+    ]
+
+    def init(self):
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idil_account_balance_snapshot_lookup_idx
+                ON idil_account_balance_snapshot (account_id, company_id, snapshot_date DESC);
+
+            CREATE OR REPLACE FUNCTION idil_account_balance_snapshot_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.transaction_date IS NOT NULL THEN
+                    DELETE FROM idil_account_balance_snapshot
+                     WHERE account_id = OLD.account_number
+                       AND company_id = OLD.company_id
+                       AND snapshot_date >= OLD.transaction_date;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.transaction_date IS NOT NULL THEN
+                    DELETE FROM idil_account_balance_snapshot
+                     WHERE account_id = NEW.account_number
+                       AND company_id = NEW.company_id
+                       AND snapshot_date >= NEW.transaction_date;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS idil_account_balance_snapshot_sync
+                ON idil_transaction_bookingline;
+            CREATE TRIGGER idil_account_balance_snapshot_sync
+                AFTER INSERT OR DELETE OR UPDATE OF
+                    account_number, company_id, transaction_type, dr_amount,
+                    cr_amount, transaction_date, currency_id, rate
+                ON idil_transaction_bookingline
+                FOR EACH ROW EXECUTE PROCEDURE idil_account_balance_snapshot_trigger();
+            """
+        )
+
+    # ------------------------------------------------------------------
+    # Backfill
+    # ------------------------------------------------------------------
+    @api.model
+    def _last_closed_date(self):
+        return fields.Date.today().replace(day=1) - timedelta(days=1)
+
+    @api.model
+    def backfill(self, cutoff_date=None):
+        """
+        Create the missing month-end snapshots up to cutoff_date (defaults to
+        the end of the previous month), continuing from the latest snapshot
+        of every account/company.
+        """
+        cutoff = fields.Date.to_date(cutoff_date) if cutoff_date else self._last_closed_date()
+        self.env["idil.transaction_bookingline"].flush_model()
+        self.flush_model()
+        columns = ", ".join(TOTAL_KEYS)
+        cumulative = ",\n".join(
+            f"COALESCE(last.{key}, 0) + SUM(m.{key}) OVER w" for key in TOTAL_KEYS
+        )
+        self.env.cr.execute(
+            f"""
+            WITH last AS (
+                SELECT DISTINCT ON (account_id, company_id) *
+                  FROM idil_account_balance_snapshot
+                 ORDER BY account_id, company_id, snapshot_date DESC
+            ),
+            monthly AS (
+                SELECT bl.account_number AS account_id,
+                       bl.company_id,
+                       (date_trunc('month', bl.transaction_date)
+                            + interval '1 month - 1 day')::date AS snapshot_date,
+                       {_LINE_TOTALS}
+                  FROM idil_transaction_bookingline bl
+                  {_LINE_JOINS}
+                  LEFT JOIN last ON last.account_id = bl.account_number
+                                AND last.company_id = bl.company_id
+                 WHERE bl.transaction_date <= %(cutoff)s
+                   AND (last.snapshot_date IS NULL
+                        OR bl.transaction_date > last.snapshot_date)
+                 GROUP BY 1, 2, 3
+            )
+            INSERT INTO idil_account_balance_snapshot
+                (account_id, company_id, currency_id, snapshot_date,
+                 {columns},
+                 create_uid, write_uid, create_date, write_date)
+            SELECT m.account_id, m.company_id, ca.currency_id, m.snapshot_date,
+                   {cumulative},
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM monthly m
+              JOIN idil_chart_account ca ON ca.id = m.account_id
+              LEFT JOIN last ON last.account_id = m.account_id
+                            AND last.company_id = m.company_id
+            WINDOW w AS (PARTITION BY m.account_id, m.company_id ORDER BY m.snapshot_date)
+            """,
+            {"cutoff": cutoff, "uid": self.env.uid},
+        )
+        created = self.env.cr.rowcount
+        self.invalidate_model()
+        _logger.info("Created %s account balance snapshot(s) up to %s.", created, cutoff)
+        return created
+
+    @api.model
+    def _cron_backfill_snapshots(self):
+        self.backfill()
+
+    @api.model
+    def invalidate_currency(self, currency_ids, date_from):
+        """Drop snapshots whose fallback rates may have changed."""
+        if not currency_ids:
+            return
+        self.flush_model()
+        query = """
+            DELETE FROM idil_account_balance_snapshot
+             WHERE currency_id IN %s
+        """
+        params = [tuple(currency_ids)]
+        if date_from:
+            query += " AND snapshot_date >= %s"
+            params.append(date_from)
+        self.env.cr.execute(query, params)
+        self.invalidate_model()
+
+    # ------------------------------------------------------------------
+    # Query API
+    # ------------------------------------------------------------------
+    @api.model
+    def get_totals_as_of(self, account_ids, date, company_id=None):
+        """
+        Ledger totals of account_ids up to and including date.
+
+        Returns {account_id: {key: value}} for every key of TOTAL_KEYS,
+        summed over companies when company_id is not given.
+        """
+        account_ids = list(account_ids or [])
+        if not account_ids:
+            return {}
+        self.env["idil.transaction_bookingline"].flush_model()
+        self.flush_model()
+        company_filter_snap = "AND s.company_id = %(company)s" if company_id else ""
+        company_filter_line = "AND bl.company_id = %(company)s" if company_id else ""
+        combined = ",\n".join(
+            f"SUM(COALESCE(snap.{key}, 0) + COALESCE(delta.{key}, 0))"
+            for key in TOTAL_KEYS
+        )
+        self.env.cr.execute(
+            f"""
+            WITH snap AS (
+                SELECT DISTINCT ON (s.account_id, s.company_id) s.*
+                  FROM idil_account_balance_snapshot s
+                 WHERE s.account_id IN %(accounts)s
+                   AND s.snapshot_date <= %(date)s
+                   {company_filter_snap}
+                 ORDER BY s.account_id, s.company_id, s.snapshot_date DESC
+            ),
+            delta AS (
+                SELECT bl.account_number AS account_id,
+                       bl.company_id,
+                       {_LINE_TOTALS}
+                  FROM idil_transaction_bookingline bl
+                  {_LINE_JOINS}
+                  LEFT JOIN snap ON snap.account_id = bl.account_number
+                                AND snap.company_id = bl.company_id
+                 WHERE bl.account_number IN %(accounts)s
+                   AND bl.transaction_date <= %(date)s
+                   AND (snap.snapshot_date IS NULL
+                        OR bl.transaction_date > snap.snapshot_date)
+                   {company_filter_line}
+                 GROUP BY bl.account_number, bl.company_id
+            )
+            SELECT COALESCE(snap.account_id, delta.account_id),
+                   {combined}
+              FROM snap
+              FULL OUTER JOIN delta ON delta.account_id = snap.account_id
+                                   AND delta.company_id = snap.company_id
+             GROUP BY 1
+            """,
+            {"accounts": tuple(account_ids), "date": date, "company": company_id},
+        )
+        totals = {
+            row[0]: dict(zip(TOTAL_KEYS, row[1:])) for row in self.env.cr.fetchall()
+        }
+        empty = dict.fromkeys(TOTAL_KEYS, 0.0)
+        return {acc_id: totals.get(acc_id, dict(empty)) for acc_id in account_ids}
+
+    @api.model
+    def _check_missing_rates(self, accounts, totals, date):
+        """Raise the same error as Account._get_conversion_rate did per line."""
+        for account in accounts:
+            if totals.get(account.id, {}).get("missing_rate"):
+                raise UserError(
+                    _("Conversion rate not found for %s to %s as of %s")
+                    % (account.currency_id.name, "USD", date)
+                )
+
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+import threading
+import logging
+
+_logger = logging.getLogger(__name__)
+
+try:
+    from oci.object_storage.models import (
+        CreateMultipartUploadDetails,
+        CommitMultipartUploadDetails,
+        CommitMultipartUploadPartDetails,
+    )
+
+    OCI_AVAILABLE = True
+except ImportError:
+    OCI_AVAILABLE = False
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_UPLOAD_WORKERS = 2
+
+
+class MultipartUpload:
+    """
+    Write-only file object that ships its content as a multipart upload.
+
+    Written bytes are cut into parts of chunk_size bytes and handed to
+    upload worker threads through a bounded queue, so producing the data
+    and uploading it overlap, and at most (workers + queue depth) parts are
+    held in memory whatever the total size. Used as a context manager the
+    upload is committed on success and aborted on error.
+    """
+
+    def __init__(self, storage, object_name):
+        self.storage = storage
+        self.object_name = object_name
+        self.chunk_size = storage.chunk_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._part_count = 0
+        self._parts = []
+        self._error = None
+        self._closed = False
+        self._handle = storage._begin_upload(object_name)
+        self._queue = queue.Queue(maxsize=storage.upload_workers)
+        self._workers = [
+            threading.Thread(
+                target=self._upload_loop,
+                name=f"backup-upload-{object_name}-{i}",
+                daemon=True,
+            )
+            for i in range(storage.upload_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def _upload_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks
+            part_num, data = item
+            try:
+                self._parts.append(
+                    (part_num, self.storage._upload_part(self._handle, part_num, data))
+                )
+            except Exception as e:
+                self._error = e
+
+    def _send(self, data):
+        self._part_count += 1
+        self._queue.put((self._part_count, data))
+
+    def _stop_workers(self):
+        for _worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def write(self, data):
+        if self._error is not None:
+            raise self._error
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.chunk_size:
+            self._send(bytes(self._buffer[: self.chunk_size]))
+            del self._buffer[: self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._closed:
+            return
+        if self._buffer or not self._part_count:
+            self._send(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._stop_workers()
+        self._closed = True
+        if self._error is not None:
+            self.storage._abort_upload(self._handle)
+            raise self._error
+        parts = [result for _num, result in sorted(self._parts, key=lambda p: p[0])]
+        self.storage._commit_upload(self._handle, parts)
+        _logger.info(
+            "Uploaded %s (%s bytes in %s parts)",
+            self.object_name,
+            self.bytes_written,
+            self._part_count,
+        )
+
+    def abort(self):
+        if self._closed:
+            return
+        self._stop_workers()
+        self._closed = True
+        self.storage._abort_upload(self._handle)
+        _logger.warning("Aborted upload of %s", self.object_name)
+
+
+class BackupStorage:
+    """
+    Base class of the backup storage backends.
+
+    A backend stores named objects: open_upload() returns a MultipartUpload
+    and open_download() a readable binary stream. Subclasses implement the
+    _begin/_upload_part/_commit/_abort_upload steps.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, upload_workers=DEFAULT_UPLOAD_WORKERS):
+        self.chunk_size = chunk_size
+        self.upload_workers = max(1, upload_workers)
+
+    def open_upload(self, object_name):
+        return MultipartUpload(self, object_name)
+
+    def open_download(self, object_name):
+        raise NotImplementedError()
+
+    def exists(self, object_name):
+        raise NotImplementedError()
+
+    def _begin_upload(self, object_name):
+        raise NotImplementedError()
+
+    def _upload_part(self, handle, part_num, data):
+        raise NotImplementedError()
+
+    def _commit_upload(self, handle, parts):
+        raise NotImplementedError()
+
+    def _abort_upload(self, handle):
+        raise NotImplementedError()
+
+
+class LocalBackupStorage(BackupStorage):
+    """Objects are files of a local directory (testing, NAS mounts)."""
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, object_name):
+        """Path of object_name, which must stay inside the directory."""
+        directory = os.path.realpath(self.directory)
+        path = os.path.realpath(os.path.join(directory, object_name))
+        if path == directory or os.path.commonpath([directory, path]) != directory:
+            raise ValueError("Invalid backup object name: %r" % object_name)
+        return path
+
+    def open_download(self, object_name):
+        return open(self.path(object_name), "rb")
+
+    def exists(self, object_name):
+        return os.path.isfile(self.path(object_name))
+
+    def _begin_upload(self, object_name):
+        final_path = self.path(object_name)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp_path = final_path + ".uploading"
+        return {
+            "file": open(tmp_path, "wb"),
+            "lock": threading.Lock(),
+            "tmp_path": tmp_path,
+            "final_path": final_path,
+        }
+
+    def _upload_part(self, handle, part_num, data):
+        # Every part but the last is exactly chunk_size long
+        with handle["lock"]:
+            handle["file"].seek((part_num - 1) * self.chunk_size)
+            handle["file"].write(data)
+        return part_num
+
+    def _commit_upload(self, handle, parts):
+        handle["file"].flush()
+        os.fsync(handle["file"].fileno())
+        handle["file"].close()
+        os.replace(handle["tmp_path"], handle["final_path"])
+
+    def _abort_upload(self, handle):
+        handle["file"].close()
+        if os.path.exists(handle["tmp_path"]):
+            os.remove(handle["tmp_path"])
+
+
+class OciBackupStorage(BackupStorage):
+    """Objects of an OCI Object Storage bucket, uploaded with the multipart API."""
+
+    def __init__(self, client, namespace, bucket, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.namespace = namespace
+        self.bucket = bucket
+
+    def open_download(self, object_name):
+        response = self.client.get_object(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            object_name=object_name,
+        )
+        return response.data.raw
+
+    def exists(self, object_name):
+        objects = self.client.list_objects(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            prefix=object_name,
+        ).data.objects
+        return any(obj.name == object_name for obj in objects)
+
+    def _begin_upload(self, object_name):
+        response = self.client.create_multipart_upload(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            create_multipart_upload_details=CreateMultipartUploadDetails(
+                object=object_name
+            ),
+        )
+        return {"object_name": object_name, "upload_id": response.data.upload_id}
+
+    def _upload_part(self, handle, part_num, data):
+        response = self.client.upload_part(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            object_name=handle["object_name"],
+            upload_id=handle["upload_id"],
+            upload_part_num=part_num,
+            upload_part_body=data,
+        )
+        return CommitMultipartUploadPartDetails(
+            part_num=part_num, etag=response.headers["etag"]
+        )
+
+    def _commit_upload(self, handle, parts):
+        self.client.commit_multipart_upload(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            object_name=handle["object_name"],
+            upload_id=handle["upload_id"],
+            commit_multipart_upload_details=CommitMultipartUploadDetails(
+                parts_to_commit=parts
+            ),
+        )
+
+    def _abort_upload(self, handle):
+        self.client.abort_multipart_upload(
+            namespace_name=self.namespace,
+            bucket_name=self.bucket,
+            object_name=handle["object_name"],
+            upload_id=handle["upload_id"],
+        )
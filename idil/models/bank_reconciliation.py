@@ -1,11 +1,19 @@
 import base64
+import csv
 import io
 import logging
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 
 _logger = logging.getLogger(__name__)
 
+# Statement lines created per create() call when importing
+IMPORT_CHUNK_SIZE = 1000
+
 try:
     import xlrd
 except ImportError:
@@ -16,6 +24,66 @@ try:
 except ImportError:
     openpyxl = None
 
+def _normalize_ref(value):
+    """Lowercase alphanumerics of a reference, numbers without leading zeros."""
+    ref = re.sub(r'[^0-9a-z]', '', str(value or '').lower())
+    if ref.isdigit():
+        return ref.lstrip('0') or '0'
+    return ref
+
+
+class BankMatchIndex:
+    """
+    In-memory indexes over candidate booking lines for auto-matching.
+
+    Lines are indexed by normalized transaction number and description
+    words (references), and by (side, amount) with their dates. Candidates
+    keep the id desc order of the booking lines; consumed lines are skipped.
+    """
+
+    def __init__(self, rows):
+        self._refs = defaultdict(list)
+        self._amounts = defaultdict(list)
+        self._used = set()
+        for line_id, trx_number, description, dr, cr, date in rows:
+            dr = dr or 0.0
+            cr = cr or 0.0
+            cand = {
+                'id': line_id,
+                'date': date,
+                # Normalized Ledger Amount
+                'ledger_val': dr if dr > 0 else -cr,
+            }
+            keys = {_normalize_ref(trx_number)} if trx_number else set()
+            keys.update(_normalize_ref(word) for word in (description or '').split())
+            keys.add(_normalize_ref(description))
+            for key in keys - {''}:
+                self._refs[key].append(cand)
+            self._amounts[('dr', round(dr, 2))].append(cand)
+            self._amounts[('cr', round(cr, 2))].append(cand)
+
+    def consume(self, cand):
+        self._used.add(cand['id'])
+
+    def by_ref(self, ref):
+        key = _normalize_ref(ref)
+        if not key:
+            return []
+        return [c for c in self._refs.get(key, []) if c['id'] not in self._used]
+
+    def by_amount(self, amount, date, tolerance):
+        """Closest-dated free line on the statement side and amount."""
+        key = ('dr', round(amount, 2)) if amount > 0 else ('cr', round(abs(amount), 2))
+        best = None
+        for cand in self._amounts.get(key, []):
+            if cand['id'] in self._used or not cand['date']:
+                continue
+            gap = abs(cand['date'] - date)
+            if gap <= tolerance and (best is None or gap < best[0]):
+                best = (gap, cand)
+        return best[1] if best else None
+
+
 class IdilBankStatement(models.Model):
     _name = 'idil.bank.statement'
     _description = 'Bank Statement'
@@ -41,8 +109,9 @@ class IdilBankStatement(models.Model):
     line_ids = fields.One2many('idil.bank.statement.line', 'statement_id', string='Statement Lines')
     
     # Excel Import Fields
-    excel_file = fields.Binary(string='Upload Excel')
+    excel_file = fields.Binary(string='Upload Excel / CSV')
     excel_filename = fields.Char(string='Excel Filename')
+    import_log = fields.Text(string='Import Log', readonly=True)
     
     template_file = fields.Binary(string='Template File')
     template_filename = fields.Char(string='Template Filename')
@@ -54,6 +123,12 @@ class IdilBankStatement(models.Model):
         ('cancel', 'Cancelled')
     ], string='Status', default='draft', tracking=True)
 
+    match_date_tolerance = fields.Integer(
+        string='Date Tolerance (Days)',
+        default=0,
+        help="Days a system transaction may be away from the bank date and still be auto-matched.",
+    )
+
     # Discrpancy / Unmatched System View
     unmatched_system_line_ids = fields.One2many('idil.transaction_bookingline', compute='_compute_unmatched_system_lines', string="Unmatched System Transactions")
 
@@ -133,61 +208,125 @@ class IdilBankStatement(models.Model):
         }
 
     def action_import_excel(self):
-        """Import lines from Excel and Auto-Match"""
+        """Import lines from Excel/CSV and Auto-Match"""
         self.ensure_one()
-        if not self.excel_file:
+        # bin_size: only the size, the content is streamed from the filestore
+        if not self.with_context(bin_size=True).excel_file:
             raise UserError(_("Please upload an Excel file first."))
 
+        Line = self.env['idil.bank.statement.line']
+        errors = []
+        imported = 0
         try:
-            file_data = base64.b64decode(self.excel_file)
-            workbook = openpyxl.load_workbook(io.BytesIO(file_data), data_only=True)
-            sheet = workbook.active
-            
-            lines_to_create = []
-            row_idx = 0
-            for row in sheet.iter_rows(values_only=True):
-                row_idx += 1
-                if row_idx == 1: continue # Skip header
-                
-                # Check for empty row
-                if not row or not row[0]: continue
-                
-                date_val = row[0]
-                ref_val = str(row[1]) if row[1] else 'Exel Import'
-                amount_val = row[2]
-                note_val = str(row[3]) if len(row) > 3 and row[3] else ''
+            with self._open_import_file() as stream:
+                chunk = []
+                for row_idx, row in enumerate(self._iter_import_rows(stream), start=1):
+                    if row_idx == 1: continue # Skip header
+
+                    # Check for empty row
+                    if not row or not row[0]: continue
 
-                if not isinstance(amount_val, (int, float)):
                     try:
-                        amount_val = float(amount_val)
-                    except:
-                        continue 
-                
-                if hasattr(date_val, 'date'):
-                    date_val = date_val.date()
-                
-                lines_to_create.append({
-                    'statement_id': self.id,
-                    'date': date_val,
-                    'payment_ref': ref_val,
-                    'amount': amount_val,
-                    'note': note_val,
-                    'match_status': 'unmatched'
-                })
-            
-            if lines_to_create:
-                # Remove existing lines if re-importing? 
-                # For now append. User can clear manually if needed.
-                self.env['idil.bank.statement.line'].create(lines_to_create)
-            
+                        chunk.append(self._prepare_import_line(row))
+                    except ValueError as e:
+                        errors.append(_("Row %s: %s") % (row_idx, e))
+                        continue
+
+                    if len(chunk) >= IMPORT_CHUNK_SIZE:
+                        imported += self._create_import_chunk(Line, chunk)
+                        chunk = []
+                if chunk:
+                    imported += self._create_import_chunk(Line, chunk)
+
             # Auto Run Matching
             self.action_auto_match_advanced()
-                
-            self.excel_file = False 
-            
+
+            self.write({
+                'excel_file': False,
+                'import_log': "\n".join(
+                    [_("%s line(s) imported, %s row(s) skipped.") % (imported, len(errors))] + errors
+                ),
+            })
+
         except Exception as e:
              raise UserError(_("Error importing Excel: %s") % str(e))
 
+    @contextmanager
+    def _open_import_file(self):
+        """
+        Binary stream of the upload. Files kept in the filestore are opened
+        in place instead of being base64-decoded in memory.
+        """
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'excel_file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+        if attachment.store_fname:
+            stream = open(attachment._full_path(attachment.store_fname), 'rb')
+        else:
+            stream = io.BytesIO(base64.b64decode(self.excel_file))
+        try:
+            yield stream
+        finally:
+            stream.close()
+
+    def _iter_import_rows(self, stream):
+        """Rows of the upload as tuples, CSV or read-only Excel."""
+        if (self.excel_filename or '').lower().endswith('.csv'):
+            text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+            for row in csv.reader(text):
+                yield tuple(value.strip() for value in row)
+            return
+
+        if not openpyxl:
+            raise UserError(_("OpenPyXL is not installed."))
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield row
+        finally:
+            workbook.close()
+
+    def _prepare_import_line(self, row):
+        """Statement line values of one row; ValueError explains a bad row."""
+        date_val = row[0]
+        ref_val = str(row[1]) if len(row) > 1 and row[1] else 'Exel Import'
+        amount_val = row[2] if len(row) > 2 else None
+        note_val = str(row[3]) if len(row) > 3 and row[3] else ''
+
+        if not isinstance(amount_val, (int, float)):
+            try:
+                amount_val = float(str(amount_val).replace(',', ''))
+            except (TypeError, ValueError):
+                raise ValueError(_("amount %r is not a number") % (amount_val,))
+
+        if hasattr(date_val, 'date'):
+            date_val = date_val.date()
+        else:
+            try:
+                date_val = fields.Date.to_date(str(date_val))
+            except ValueError:
+                raise ValueError(_("date %r is not in YYYY-MM-DD format") % (date_val,))
+
+        return {
+            'statement_id': self.id,
+            'date': date_val,
+            'payment_ref': ref_val,
+            'amount': amount_val,
+            'note': note_val,
+            'match_status': 'unmatched'
+        }
+
+    def _create_import_chunk(self, Line, vals_list):
+        # Appended to the existing lines; user can clear manually if needed.
+        lines = Line.create(vals_list)
+        lines.flush_recordset()
+        # Keep the cache from growing with the whole statement
+        lines.invalidate_recordset()
+        _logger.info("Bank statement %s: imported %s line(s).", self.name, len(lines))
+        return len(lines)
+
     def action_open(self):
         self.write({'state': 'open'})
 
@@ -211,106 +350,102 @@ class IdilBankStatement(models.Model):
     def action_auto_match_advanced(self):
         """
         Advanced Matching:
-        1. Exact Match: Ref + Amount + Date (Relaxed date?) -> Matched
+        1. Exact Match: Ref + Amount -> Matched
         2. Ref Match + Date Match BUT Amount Diff -> Mismatch (Highlighted)
+        3. Fallback: Amount + Date (within the tolerance) -> Matched
+
+        The unreconciled lines of the account are loaded once and indexed in
+        memory, the whole statement is matched in one pass and the matches
+        are written in bulk.
         """
         self.ensure_one()
-        BookingLine = self.env['idil.transaction_bookingline']
-        Match = self.env['idil.reconciliation.match']
-        
-        # We assume 'payment_ref' in statement maps to 'transaction_number' or 'ref' in booking
-        
+        index = self._build_match_index()
+        tolerance = timedelta(days=max(self.match_date_tolerance, 0))
+
+        match_vals = []
+        matched_lines = self.env['idil.bank.statement.line']
+        mismatched_lines = self.env['idil.bank.statement.line']
+        notes = {}
+
         for st_line in self.line_ids.filtered(lambda l: not l.is_reconciled):
-            
-            # Base Domain: same account, unreconciled
-            base_domain = [
-                ('account_number', '=', self.account_id.id),
-                ('is_reconciled', '=', False),
-                ('company_id', '=', self.company_id.id)
-            ]
-            
-            # Helper to find by Ref
-            # We search for booking lines where the transaction header's number matches the excel ref
-            # This is a bit complex in domain, easier to search potential candidates by amount/date first?
-            # Or search by Ref first? Ref is strongest key.
-            
-            # Let's try matching by REF first (if Ref exists)
-            candidates = BookingLine.browse()
-            if st_line.payment_ref:
-                # Search transaction_booking_ids with this ref
-                # 'transaction_booking_id.transaction_number'
-                # or 'description'
-                ref_domain = base_domain + [
-                    '|', 
-                    ('transaction_booking_id.transaction_number', 'ilike', st_line.payment_ref),
-                    ('description', 'ilike', st_line.payment_ref)
-                ]
-                candidates = BookingLine.search(ref_domain)
-            
             match_found = False
-            
-            # 1. Check Candidates for Exact Match (Amount & Date)
-            for cand in candidates:
-                # Check Amount
-                cand_amount = cand.dr_amount - cand.cr_amount
-                # Bank: +Amount = Debit in Ledger? No.
-                # If Bank Statement says +100 (Deposit), we recvd money. Ledger should have Debit 100 to Bank.
-                # So Bank Amt (+100) == Ledger Dr (100). 
-                # Bank Amt (-50) == Ledger Cr (50).
-                
-                # Normalized Ledger Amount
-                ledger_val = cand.dr_amount if cand.dr_amount > 0 else -cand.cr_amount
-                
-                amount_match = abs(st_line.amount - ledger_val) < 0.01
-                date_match = (cand.transaction_date == st_line.date)
-                
+
+            # 1. Ref candidates: Exact Match (Amount) or Mismatch (Date)
+            for cand in index.by_ref(st_line.payment_ref):
+                # Bank Amt (+100) == Ledger Dr (100), Bank Amt (-50) == Ledger Cr (50)
+                amount_match = abs(st_line.amount - cand['ledger_val']) < 0.01
+                date_match = (
+                    bool(cand['date'] and st_line.date)
+                    and abs(cand['date'] - st_line.date) <= tolerance
+                )
+
                 if amount_match:
-                    # Perfect Match (Ref + Amount). Date is secondary but good to check.
-                    # Create Match
-                    Match.create({
+                    # Perfect Match (Ref + Amount). Date is secondary.
+                    index.consume(cand)
+                    match_vals.append({
                         'statement_line_id': st_line.id,
-                        'booking_line_id': cand.id,
+                        'booking_line_id': cand['id'],
                         'amount': abs(st_line.amount),
                         'match_type': 'auto'
                     })
-                    st_line.match_status = 'matched'
+                    matched_lines |= st_line
                     match_found = True
                     break
-                elif date_match and not amount_match:
+                elif date_match:
                     # Ref + Date match, but Amount mismatch
-                    st_line.match_status = 'mismatch'
-                    st_line.note = (st_line.note or '') + " [Mismatch: Sys Amount %s]" % ledger_val
-                    match_found = True # Handled as mismatch
+                    mismatched_lines |= st_line
+                    notes[st_line.id] = (st_line.note or '') + " [Mismatch: Sys Amount %s]" % cand['ledger_val']
+                    match_found = True  # Handled as mismatch
                     break
-            
+
             if match_found:
-                st_line._compute_is_reconciled()
                 continue
-                
-            # 2. Fallback: If no Ref match, try Amount + Date match (Weak match)
-            # Only if Ref was empty or yielded no results
-            if not match_found:
-                # Try finding by Amount + Date
-                amt_domain = base_domain + [
-                    ('transaction_date', '=', st_line.date)
-                ]
-                if st_line.amount > 0:
-                    amt_domain.append(('dr_amount', '=', st_line.amount))
-                else:
-                    amt_domain.append(('cr_amount', '=', abs(st_line.amount)))
-                
-                weak_candidate = BookingLine.search(amt_domain, limit=1)
-                
-                if weak_candidate:
-                     Match.create({
-                        'statement_line_id': st_line.id,
-                        'booking_line_id': weak_candidate.id,
-                        'amount': abs(st_line.amount),
-                        'match_type': 'auto'
-                    })
-                     st_line.match_status = 'matched'
-                     st_line._compute_is_reconciled()
 
+            # 2. Fallback: Amount + Date match (Weak match)
+            cand = index.by_amount(st_line.amount, st_line.date, tolerance)
+            if cand:
+                index.consume(cand)
+                match_vals.append({
+                    'statement_line_id': st_line.id,
+                    'booking_line_id': cand['id'],
+                    'amount': abs(st_line.amount),
+                    'match_type': 'auto'
+                })
+                matched_lines |= st_line
+
+        self.env['idil.reconciliation.match'].create(match_vals)
+        if matched_lines:
+            matched_lines.write({'match_status': 'matched'})
+        for st_line in mismatched_lines:
+            st_line.write({'match_status': 'mismatch', 'note': notes[st_line.id]})
+        (matched_lines | mismatched_lines)._compute_is_reconciled()
+        _logger.info(
+            "Bank statement %s: %s line(s) matched, %s mismatch(es).",
+            self.name, len(matched_lines), len(mismatched_lines),
+        )
+
+    def _build_match_index(self):
+        """Unreconciled booking lines of the statement account, indexed."""
+        BookingLine = self.env['idil.transaction_bookingline']
+        BookingLine.flush_model([
+            'account_number', 'company_id', 'is_reconciled', 'description',
+            'dr_amount', 'cr_amount', 'transaction_date', 'transaction_booking_id',
+        ])
+        self.env['idil.transaction_booking'].flush_model(['transaction_number'])
+        self.env.cr.execute(
+            """
+            SELECT bl.id, b.transaction_number, bl.description,
+                   bl.dr_amount, bl.cr_amount, bl.transaction_date
+              FROM idil_transaction_bookingline bl
+              LEFT JOIN idil_transaction_booking b ON b.id = bl.transaction_booking_id
+             WHERE bl.account_number = %s
+               AND bl.company_id = %s
+               AND bl.is_reconciled IS NOT TRUE
+             ORDER BY bl.id DESC
+            """,
+            (self.account_id.id, self.company_id.id),
+        )
+        return BankMatchIndex(self.env.cr.fetchall())
 
 class IdilBankStatementLine(models.Model):
     _name = 'idil.bank.statement.line'
@@ -374,9 +509,9 @@ class IdilReconciliationMatch(models.Model):
     amount = fields.Float(string='Matched Amount', required=True)
     match_type = fields.Selection([('auto', 'Auto'), ('manual', 'Manual')], default='manual')
 
-    @api.model
-    def create(self, vals):
-        res = super(IdilReconciliationMatch, self).create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(IdilReconciliationMatch, self).create(vals_list)
         res.booking_line_id._compute_reconciliation_status()
         return res
 
@@ -54,9 +54,113 @@ class IdilBudget(models.Model):
             if rec.date_start > rec.date_end:
                 raise UserError(_('Start Date must be before End Date.'))
                 
-    def get_budget_state(self, account_id, date, department_id=False):
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(IdilBudget, self).create(vals_list)
+        self._invalidate_budget_cache()
+        return records
+
+    def write(self, vals):
+        res = super(IdilBudget, self).write(vals)
+        self._invalidate_budget_cache()
+        return res
+
+    def unlink(self):
+        res = super(IdilBudget, self).unlink()
+        self._invalidate_budget_cache()
+        return res
+
+    # ------------------------------------------------------------------
+    # Transaction cache
+    # ------------------------------------------------------------------
+    @api.model
+    def _budget_cache(self):
+        """
+        Budget lookups of the current transaction.
+
+        The cache lives in cr.precommit.data, which is dropped on commit and
+        rollback: {(company, department): [(budget_id, start, end)]}.
+        Consumed amounts are not kept here: they are read from the booked
+        lines, so lines rolled back to a savepoint are never counted.
+        """
+        return self.env.cr.precommit.data.setdefault('idil.budget.cache', {})
+
+    @api.model
+    def _invalidate_budget_cache(self):
+        cache = self.env.cr.precommit.data.get('idil.budget.cache')
+        if cache:
+            cache.clear()
+
+    @api.model
+    def _get_matching_budgets(self, date, department_id=False, company_id=None):
+        """Confirmed budgets of company_id (default: current company) covering date."""
+        company_id = company_id or self.env.company.id
+        index = self._budget_cache()
+        key = (company_id, department_id or False)
+        if key not in index:
+            # Departmental budgets never leak into global checks and vice versa
+            budgets = self.search([
+                ('state', '=', 'confirmed'),
+                ('company_id', '=', company_id),
+                ('department_id', '=', department_id or False),
+            ])
+            index[key] = [(b.id, b.date_start, b.date_end) for b in budgets]
+        date = fields.Date.to_date(date)
+        return self.browse([
+            budget_id for budget_id, start, end in index[key]
+            if start <= date <= end
+        ])
+
+    @api.model
+    def _get_consumed(self, account_id, department_id, date_from, date_to, company_id=None, consumed=None):
+        """
+        [dr, cr] booked on account for the department and company over the
+        period. With consumed (the counters of a check_budget_batch call), the
+        totals are read once and kept there.
         """
-        Return dict describing budget status for an account/date/department.
+        company_id = company_id or self.env.company.id
+        counters = {} if consumed is None else consumed.setdefault(
+            (company_id, account_id, department_id or False), {}
+        )
+        period = (date_from, date_to)
+        if period not in counters:
+            domain = [
+                ('account_number', '=', account_id),
+                ('transaction_date', '>=', date_from),
+                ('transaction_date', '<=', date_to),
+                ('company_id', '=', company_id),
+            ]
+            if department_id:
+                # Filter actuals by department (via employee)
+                domain.append(('employee_id.department_id', '=', department_id))
+            else:
+                # For global budget, include transactions with NO department (either no employee or employee with no dept)
+                domain.extend(['|', ('employee_id', '=', False), ('employee_id.department_id', '=', False)])
+            groups = self.env['idil.transaction_bookingline'].read_group(
+                domain, ['dr_amount:sum', 'cr_amount:sum'], []
+            )
+            group = groups[0] if groups else {}
+            counters[period] = [group.get('dr_amount') or 0.0, group.get('cr_amount') or 0.0]
+        return counters[period]
+
+    @api.model
+    def _consume_budget(self, consumed, company_id, account_id, department_id, date, dr, cr):
+        """Move every loaded counter covering a line that is being booked."""
+        counters = consumed.get(
+            (company_id, account_id, department_id or False)
+        )
+        if not counters:
+            return
+        date = fields.Date.to_date(date)
+        for (date_from, date_to), totals in counters.items():
+            if date_from <= date <= date_to:
+                totals[0] += dr or 0.0
+                totals[1] += cr or 0.0
+
+    def get_budget_state(self, account_id, date, department_id=False, company_id=None, consumed=None):
+        """
+        Return dict describing budget status for an account/date/department
+        of company_id (default: current company).
         {
             'active': bool,
             'planned': float,
@@ -65,20 +169,7 @@ class IdilBudget(models.Model):
             'msg': str
         }
         """
-        domain = [
-            ('state', '=', 'confirmed'),
-            ('date_start', '<=', date),
-            ('date_end', '>=', date),
-            ('company_id', '=', self.env.company.id)
-        ]
-        
-        # Filter budgets by department if provided, else ensure global budgets (so departmental budgets don't leak into global checks)
-        if department_id:
-             domain.append(('department_id', '=', department_id))
-        else:
-             domain.append(('department_id', '=', False))
-
-        budgets = self.search(domain)
+        budgets = self._get_matching_budgets(date, department_id, company_id)
         if not budgets:
             return {'active': False}
             
@@ -89,25 +180,9 @@ class IdilBudget(models.Model):
         min_date = min(budgets.mapped('date_start'))
         max_date = max(budgets.mapped('date_end'))
         
-        BookingLine = self.env['idil.transaction_bookingline']
-        actual_domain = [
-            ('account_number', '=', account_id),
-            ('transaction_date', '>=', min_date),
-            ('transaction_date', '<=', max_date),
-            ('company_id', '=', self.env.company.id)
-        ]
-        
-        if department_id:
-            # Filter actuals by department (via employee)
-            actual_domain.append(('employee_id.department_id', '=', department_id))
-        else:
-            # For global budget, include transactions with NO department (either no employee or employee with no dept)
-            actual_domain.extend(['|', ('employee_id', '=', False), ('employee_id.department_id', '=', False)])
-        
-        booked_lines = BookingLine.search(actual_domain)
-        
-        total_dr = sum(booked_lines.mapped('dr_amount'))
-        total_cr = sum(booked_lines.mapped('cr_amount'))
+        total_dr, total_cr = self._get_consumed(
+            account_id, department_id, min_date, max_date, company_id, consumed
+        )
         
         account = self.env['idil.chart.account'].browse(account_id)
         is_revenue = account.code and account.code.startswith('4')
@@ -126,15 +201,16 @@ class IdilBudget(models.Model):
             'used': current_actual,
             'remaining': remaining,
             'min_date': min_date,
-            'max_date': max_date
+            'max_date': max_date,
+            'budget_ids': budgets.ids,
         }
 
-    def check_budget_availability(self, account_id, amount, date, department_id=False):
+    def check_budget_availability(self, account_id, amount, date, department_id=False, company_id=None, consumed=None):
         """
         Check if budget is available for account on date with amount.
         Returns (allowed_bool, message)
         """
-        state = self.get_budget_state(account_id, date, department_id)
+        state = self.get_budget_state(account_id, date, department_id, company_id, consumed)
         if not state.get('active'):
             return True, ""
             
@@ -143,19 +219,7 @@ class IdilBudget(models.Model):
         current_actual = state['used']
         
         if amount > remaining:
-            # Re-fetch budgets to check action
-            domain = [
-                ('state', '=', 'confirmed'),
-                ('date_start', '<=', date),
-                ('date_end', '>=', date),
-                ('company_id', '=', self.env.company.id)
-            ]
-            if department_id:
-                domain.append(('department_id', '=', department_id))
-            else:
-                domain.append(('department_id', '=', False))
-                
-            budgets = self.search(domain)
+            budgets = self.browse(state['budget_ids'])
             actions = budgets.mapped('control_action')
             account = self.env['idil.chart.account'].browse(account_id)
             department_name = budgets[0].department_id.name if budgets and budgets[0].department_id else "Global"
@@ -176,6 +240,50 @@ class IdilBudget(models.Model):
             
         return True, ""
 
+    @api.model
+    def check_budget_batch(self, entries):
+        """
+        Validate the lines of one posting together.
+
+        entries is a list of dicts with company_id, account_id, department_id,
+        date, dr_amount and cr_amount. Every line consumes its amounts before
+        the next one is checked, so the outcome is the same as creating the
+        lines one by one, but each (account, department, period) is read from
+        the database only once per batch. The counters die with the call, so
+        every batch starts from the lines actually booked.
+        Returns a list of (allowed_bool, message), one per entry.
+        """
+        consumed = {}
+        checked = [
+            entry for entry in entries
+            if entry['dr_amount'] > 0 and entry['account_id']
+        ]
+        # Load the counters before consuming anything so the database totals
+        # never already contain lines of this batch.
+        for entry in checked:
+            self.get_budget_state(
+                entry['account_id'], entry['date'], entry['department_id'],
+                entry['company_id'], consumed,
+            )
+
+        results = []
+        for entry in entries:
+            if entry['dr_amount'] > 0 and entry['account_id']:
+                results.append(self.check_budget_availability(
+                    entry['account_id'], entry['dr_amount'], entry['date'],
+                    department_id=entry['department_id'],
+                    company_id=entry['company_id'],
+                    consumed=consumed,
+                ))
+            else:
+                results.append((True, ""))
+            if entry['account_id']:
+                self._consume_budget(
+                    consumed, entry['company_id'], entry['account_id'], entry['department_id'],
+                    entry['date'], entry['dr_amount'], entry['cr_amount'],
+                )
+        return results
+
 
 class IdilBudgetLine(models.Model):
     _name = 'idil.budget.line'
@@ -189,6 +297,22 @@ class IdilBudgetLine(models.Model):
     variance = fields.Float('Variance', compute='_compute_actual_amount', store=True)
     percentage = fields.Float('Usage %', compute='_compute_actual_amount', store=True)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(IdilBudgetLine, self).create(vals_list)
+        self.env['idil.budget']._invalidate_budget_cache()
+        return records
+
+    def write(self, vals):
+        res = super(IdilBudgetLine, self).write(vals)
+        self.env['idil.budget']._invalidate_budget_cache()
+        return res
+
+    def unlink(self):
+        res = super(IdilBudgetLine, self).unlink()
+        self.env['idil.budget']._invalidate_budget_cache()
+        return res
+
     @api.depends('budget_id.date_start', 'budget_id.date_end', 'account_id', 'budget_id.state', 'budget_id.department_id')
     def _compute_actual_amount(self):
         BookingLine = self.env['idil.transaction_bookingline']
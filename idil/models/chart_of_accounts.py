@@ -1,10 +1,15 @@
+from collections import defaultdict
+
 from odoo import models, fields, api, _
 
 from odoo.exceptions import ValidationError, UserError
+from odoo.osv import expression
 import logging
 
 from odoo.tools.float_utils import float_round
 
+from .report_metrics import track_report
+
 _logger = logging.getLogger(__name__)
 
 
@@ -224,8 +229,128 @@ class AccountHeader(models.Model):
         )
         report_data["net_profit_formatted"] = "${:,.3f}".format(profit_sum)
 
+    @api.model
+    def _get_statement_hierarchy(
+        self,
+        company_id=None,
+        prefixes=None,
+        header_order="code",
+        subheader_order="name",
+        account_order="code",
+    ):
+        """
+        Headers -> sub headers -> accounts in report order, fetched with one
+        search per level instead of one per node.
+        Returns [(header, [(subheader, accounts), ...]), ...].
+        """
+        domain = []
+        if prefixes:
+            domain = expression.OR([[("code", "=like", p + "%")] for p in prefixes])
+        headers = self.search(domain, order=header_order)
+        subheaders = self.env["idil.chart.account.subheader"].search(
+            [("header_id", "in", headers.ids)], order=subheader_order
+        )
+        account_domain = [("subheader_id", "in", subheaders.ids)]
+        if company_id:
+            account_domain.append(("company_id", "=", company_id))
+        accounts = self.env["idil.chart.account"].search(
+            account_domain, order=account_order
+        )
+
+        account_ids_by_sub = defaultdict(list)
+        for account in accounts:
+            account_ids_by_sub[account.subheader_id.id].append(account.id)
+        subs_by_header = defaultdict(list)
+        for subheader in subheaders:
+            subs_by_header[subheader.header_id.id].append(
+                (subheader, accounts.browse(account_ids_by_sub[subheader.id]))
+            )
+        return [(header, subs_by_header[header.id]) for header in headers]
+
+    @api.model
+    def _is_cogs_account(self, acc):
+        """
+        Strict Logic: Account is COGS only if Type is COGS.
+        Safety: Explicitly Exclude common OPEX names even if Type is COGS.
+        """
+        sh_name = (acc.subheader_id.name or "").lower()
+        # 1. Force Exclusion (Safety override)
+        if any(
+            x in sh_name
+            for x in [
+                "rent",
+                "utility",
+                "utilities",
+                "salary",
+                "payroll",
+                "commission",
+                "admin",
+                "operating",
+                "expense",
+            ]
+        ):
+            return False
+
+        # 2. Strict Check
+        return getattr(acc, "account_type", None) in ("cogs", "COGS")
+
+    @api.model
+    def _build_income_sections(
+        self, company_id, report_date, prefixes, mode="income", filter_fn=None
+    ):
+        """
+        Flattens the report structure: Group by SubHeader (Type) directly.
+        prefixes: list of strings, e.g. ['4'] or ['5', '6', '7']
+        Balances of every account involved come from a single batch query.
+        """
+        flat_types = []
+        grand_total = 0.0
+
+        hierarchy = self._get_statement_hierarchy(company_id, prefixes)
+        selected = self.env["idil.chart.account"]
+        for _header, subs in hierarchy:
+            for _sub, accs in subs:
+                selected |= accs.filtered(filter_fn) if filter_fn else accs
+        balances = selected.get_dr_cr_balances_usd(report_date, company_id)
+
+        for _header, subs in hierarchy:
+            for s, accs in subs:
+                t_block = {"name": s.name, "lines": [], "subtotal": 0.0}
+
+                for acc in accs:
+                    if acc.id not in balances:
+                        continue
+
+                    dr, cr = balances[acc.id]
+                    signed = (dr or 0.0) - (cr or 0.0)
+                    amount = (-signed) if mode == "income" else signed
+
+                    if abs(amount) > 0.001:
+                        t_block["lines"].append(
+                            {
+                                "code": acc.code or "",
+                                "name": acc.name or "",
+                                "amount": "${:,.3f}".format(amount),
+                                "amount_raw": amount,
+                            }
+                        )
+                        t_block["subtotal"] += amount
+
+                if t_block["lines"]:
+                    t_block["subtotal_fmt"] = "${:,.3f}".format(t_block["subtotal"])
+                    flat_types.append(t_block)
+                    grand_total += t_block["subtotal"]
+
+        return flat_types, grand_total
+
     @api.model
     def get_trial_balance_report_data(self, company_id, report_date):
+        with track_report(self.env, "trial_balance_advanced") as stats:
+            report_data = self._get_trial_balance_report_data(company_id, report_date)
+        report_data["stats"] = stats
+        return report_data
+
+    def _get_trial_balance_report_data(self, company_id, report_date):
         company = (
             self.env["res.company"].browse(company_id)
             if company_id
@@ -233,7 +358,15 @@ class AccountHeader(models.Model):
         )
         r_date = report_date or fields.Date.today()
 
-        headers = self.search([])
+        hierarchy = self._get_statement_hierarchy(
+            header_order="id", subheader_order="id desc", account_order="id"
+        )
+        all_accounts = self.env["idil.chart.account"]
+        for _header, subs in hierarchy:
+            for _sub, accs in subs:
+                all_accounts |= accs
+        balances = all_accounts.get_dr_cr_balances_usd(report_date, company_id)
+
         report_data = {
             "headers": [],
             "grand_total_debit": 0,
@@ -247,18 +380,18 @@ class AccountHeader(models.Model):
         total_dr = 0
         total_cr = 0
 
-        for header in headers:
+        for header, subs in hierarchy:
             header_dr = 0
             header_cr = 0
             subheaders_data = []
 
-            for subheader in header.sub_header_ids:
+            for subheader, accounts in subs:
                 subheader_dr = 0
                 subheader_cr = 0
                 accounts_data = []
 
-                for account in subheader.account_ids:
-                    dr, cr = account.get_dr_cr_balance_usd(report_date, company_id)
+                for account in accounts:
+                    dr, cr = balances[account.id]
                     # Skip zero balance accounts
                     if abs(dr) < 0.001 and abs(cr) < 0.001:
                         continue
@@ -308,117 +441,45 @@ class AccountHeader(models.Model):
 
     @api.model
     def get_income_statement_advanced_data(self, company_id, report_date):
-        company = (
-            self.env["res.company"].browse(company_id)
-            if company_id
-            else self.env.company
-        )
-        r_date = report_date or fields.Date.today()
-
-        Header = self.env["idil.chart.account.header"]
-        SubHeader = self.env["idil.chart.account.subheader"]
-        Account = self.env["idil.chart.account"]
-
-        def acc_signed_usd(acc):
-            dr, cr = acc.get_dr_cr_balance_usd(r_date, company.id)
-            return (dr or 0.0) - (cr or 0.0)
-
-        def is_cogs(acc):
-            """
-            Strict Logic: Account is COGS only if Type is COGS.
-            Safety: Explicitly Exclude common OPEX names even if Type is COGS.
-            """
-            sh_name = (acc.subheader_id.name or "").lower()
-            if any(
-                x in sh_name
-                for x in [
-                    "rent",
-                    "utility",
-                    "utilities",
-                    "salary",
-                    "payroll",
-                    "commission",
-                    "admin",
-                    "operating",
-                    "expense",
-                ]
-            ):
-                return False
-            return getattr(acc, "account_type", None) in ("cogs", "COGS")
-
-        def build_sections(prefixes, mode="income", filter_fn=None):
-            """
-            Flattens the report structure: Group by SubHeader (Type) directly.
-            prefixes: list of strings, e.g. ['4'] or ['5', '6', '7']
-            """
-            flat_types = []
-            grand_total = 0.0
-
-            # 1. Match Headers by prefix
-            domain = ["|"] * (len(prefixes) - 1) + [
-                ("code", "=like", p + "%") for p in prefixes
-            ]
-            if len(prefixes) == 1:
-                domain = [("code", "=like", prefixes[0] + "%")]
-
-            headers = Header.search(domain, order="code")
-
-            for h in headers:
-                subs = SubHeader.search([("header_id", "=", h.id)], order="name")
-                for s in subs:
-                    t_block = {"name": s.name, "lines": [], "subtotal": 0.0}
-
-                    accs = Account.search(
-                        [("subheader_id", "=", s.id), ("company_id", "=", company.id)],
-                        order="code",
-                    )
-
-                    for acc in accs:
-                        if filter_fn and not filter_fn(acc):
-                            continue
-
-                        signed = acc_signed_usd(acc)
-                        amount = (-signed) if mode == "income" else signed
-
-                        if abs(amount) > 0.001:
-                            t_block["lines"].append(
-                                {
-                                    "code": acc.code or "",
-                                    "name": acc.name or "",
-                                    "amount": "${:,.3f}".format(amount),
-                                    "amount_raw": amount,
-                                }
-                            )
-                            t_block["subtotal"] += amount
-
-                    if t_block["lines"]:
-                        t_block["subtotal_fmt"] = "${:,.3f}".format(t_block["subtotal"])
-                        flat_types.append(t_block)
-                        grand_total += t_block["subtotal"]
-
-            return flat_types, grand_total
-
-        # 1. Income (4xxx)
-        income_data, total_income = build_sections(["4"], mode="income")
+        with track_report(self.env, "income_statement_advanced") as stats:
+            company = (
+                self.env["res.company"].browse(company_id)
+                if company_id
+                else self.env.company
+            )
+            r_date = report_date or fields.Date.today()
 
-        # 2. COGS (5-9xxx where is_cogs is True)
-        expense_prefixes = ["5", "6", "7", "8", "9"]
-        cogs_data, total_cogs = build_sections(
-            expense_prefixes, mode="expense", filter_fn=is_cogs
-        )
+            # 1. Income (4xxx)
+            income_data, total_income = self._build_income_sections(
+                company.id, r_date, ["4"], mode="income"
+            )
 
-        # 3. Gross Profit
-        gross_profit = total_income - total_cogs
-        gross_profit_fmt = "${:,.3f}".format(gross_profit)
+            # 2. COGS (5-9xxx where is_cogs is True)
+            expense_prefixes = ["5", "6", "7", "8", "9"]
+            cogs_data, total_cogs = self._build_income_sections(
+                company.id,
+                r_date,
+                expense_prefixes,
+                mode="expense",
+                filter_fn=self._is_cogs_account,
+            )
 
-        # 4. Operating Expenses (5-9xxx where is_cogs is False)
-        opex_data, total_opex = build_sections(
-            expense_prefixes, mode="expense", filter_fn=lambda a: not is_cogs(a)
-        )
+            # 3. Gross Profit
+            gross_profit = total_income - total_cogs
+            gross_profit_fmt = "${:,.3f}".format(gross_profit)
+
+            # 4. Operating Expenses (5-9xxx where is_cogs is False)
+            opex_data, total_opex = self._build_income_sections(
+                company.id,
+                r_date,
+                expense_prefixes,
+                mode="expense",
+                filter_fn=lambda a: not self._is_cogs_account(a),
+            )
 
-        # 5. Net Profit
-        net_profit = gross_profit - total_opex
-        net_profit_fmt = "${:,.3f}".format(net_profit)
+            # 5. Net Profit
+            net_profit = gross_profit - total_opex
+            net_profit_fmt = "${:,.3f}".format(net_profit)
 
         # Return flattened structure directly accessible by template
         return {
@@ -436,11 +497,64 @@ class AccountHeader(models.Model):
             "total_operating_expenses": "${:,.3f}".format(total_opex),
             "net_profit_formatted": net_profit_fmt,
             "net_profit": net_profit,
+            "stats": stats,
         }
 
+    # SQL pieces of the advanced statement/cash-flow reports. Amounts are cast
+    # to float8 so the arithmetic matches the former per-line Python loops.
+    _USD_LINE_JOINS = """
+        JOIN idil_chart_account ca ON ca.id = bl.account_number
+        LEFT JOIN res_currency cur ON cur.id = COALESCE(bl.currency_id, ca.currency_id)
+        LEFT JOIN LATERAL (
+            SELECT r.rate
+              FROM res_currency_rate r
+             WHERE NULLIF(bl.rate, 0) IS NULL
+               AND cur.name IS DISTINCT FROM 'USD'
+               AND r.currency_id = cur.id
+               AND r.name <= bl.transaction_date
+             ORDER BY r.name DESC
+             LIMIT 1
+        ) fx ON TRUE
+    """
+    _USD_LINE_RATE = """
+        CASE WHEN cur.name = 'USD' THEN 1.0::float8
+             ELSE COALESCE(NULLIF(COALESCE(NULLIF(bl.rate, 0), fx.rate), 0), 1)::float8
+        END
+    """
+    _USD_LINE_MISSING_RATE = """
+        (cur.name IS DISTINCT FROM 'USD' AND NULLIF(bl.rate, 0) IS NULL AND fx.rate IS NULL)
+    """
+
+    def _raise_missing_statement_rate(self, where, params):
+        """Re-raise the conversion error for the first line without a rate."""
+        self.env.cr.execute(
+            f"""
+            SELECT cur.id, bl.transaction_date
+              FROM idil_transaction_bookingline bl
+              {self._USD_LINE_JOINS}
+             WHERE {where} AND {self._USD_LINE_MISSING_RATE}
+             ORDER BY bl.transaction_date, bl.id
+             LIMIT 1
+            """,
+            params,
+        )
+        row = self.env.cr.fetchone()
+        if row:
+            self.env["idil.chart.account"]._get_conversion_rate(row[0], row[1])
+
     @api.model
     def get_account_statement_advanced_data(
         self, account_id, start_date, end_date, company_id
+    ):
+        with track_report(self.env, "account_statement_advanced") as stats:
+            report_data = self._get_account_statement_advanced_data(
+                account_id, start_date, end_date, company_id
+            )
+        report_data["stats"] = stats
+        return report_data
+
+    def _get_account_statement_advanced_data(
+        self, account_id, start_date, end_date, company_id
     ):
         account = self.env["idil.chart.account"].browse(account_id)
         company = (
@@ -448,42 +562,68 @@ class AccountHeader(models.Model):
             if company_id
             else self.env.company
         )
+        self.env["idil.transaction_bookingline"].flush_model()
+        self.env["idil.transaction_booking"].flush_model(["transaction_number"])
+        cr = self.env.cr
+        rate = self._USD_LINE_RATE
 
         # Opening Balance computation in USD
-        opening_transactions = self.env["idil.transaction_bookingline"].search(
-            [
-                ("account_number", "=", account.id),
-                ("transaction_date", "<", start_date),
-                ("company_id", "=", company.id),
-            ]
+        opening_where = """
+            bl.account_number = %(account)s
+            AND bl.transaction_date < %(start)s
+            AND bl.company_id = %(company)s
+        """
+        params = {
+            "account": account.id,
+            "company": company.id,
+            "start": start_date,
+            "end": end_date,
+        }
+        self._raise_missing_statement_rate(opening_where, params)
+        cr.execute(
+            f"""
+            SELECT COALESCE(SUM(COALESCE(bl.dr_amount, 0)::float8 / {rate}), 0),
+                   COALESCE(SUM(COALESCE(bl.cr_amount, 0)::float8 / {rate}), 0)
+              FROM idil_transaction_bookingline bl
+              {self._USD_LINE_JOINS}
+             WHERE {opening_where}
+            """,
+            params,
         )
-
-        opening_dr = 0
-        opening_cr = 0
-        for trx in opening_transactions:
-            rate = (
-                trx.rate
-                or account._get_conversion_rate(
-                    trx.currency_id.id, trx.transaction_date
-                )
-                or 1.0
-            )
-            if trx.currency_id.name == "USD":
-                rate = 1.0
-            opening_dr += trx.dr_amount / rate
-            opening_cr += trx.cr_amount / rate
-
+        opening_dr, opening_cr = cr.fetchone()
         opening_balance = opening_dr - opening_cr
 
-        # Period Transactions
-        transactions = self.env["idil.transaction_bookingline"].search(
-            [
-                ("account_number", "=", account.id),
-                ("transaction_date", ">=", start_date),
-                ("transaction_date", "<=", end_date),
-                ("company_id", "=", company.id),
-            ],
-            order="transaction_date asc, id asc",
+        # Period Transactions, running balance via window function
+        period_where = """
+            bl.account_number = %(account)s
+            AND bl.transaction_date >= %(start)s
+            AND bl.transaction_date <= %(end)s
+            AND bl.company_id = %(company)s
+        """
+        self._raise_missing_statement_rate(period_where, params)
+        cr.execute(
+            f"""
+            SELECT t.transaction_date, t.booking_id, t.transaction_number,
+                   t.description, t.dr_usd, t.cr_usd,
+                   SUM(t.dr_usd - t.cr_usd) OVER (
+                       ORDER BY t.transaction_date, t.id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+                   ) AS movement
+              FROM (
+                SELECT bl.id, bl.transaction_date, bl.description,
+                       bl.transaction_booking_id AS booking_id,
+                       tb.transaction_number,
+                       COALESCE(bl.dr_amount, 0)::float8 / {rate} AS dr_usd,
+                       COALESCE(bl.cr_amount, 0)::float8 / {rate} AS cr_usd
+                  FROM idil_transaction_bookingline bl
+                  {self._USD_LINE_JOINS}
+                  LEFT JOIN idil_transaction_booking tb
+                         ON tb.id = bl.transaction_booking_id
+                 WHERE {period_where}
+              ) t
+             ORDER BY t.transaction_date, t.id
+            """,
+            params,
         )
 
         lines = []
@@ -491,33 +631,19 @@ class AccountHeader(models.Model):
         total_dr = 0
         total_cr = 0
 
-        for trx in transactions:
-            rate = (
-                trx.rate
-                or account._get_conversion_rate(
-                    trx.currency_id.id, trx.transaction_date
-                )
-                or 1.0
-            )
-            if trx.currency_id.name == "USD":
-                rate = 1.0
-
-            dr_usd = trx.dr_amount / rate
-            cr_usd = trx.cr_amount / rate
-            running_balance += dr_usd - cr_usd
+        for trx_date, booking_id, number, description, dr_usd, cr_usd, movement in (
+            cr.fetchall()
+        ):
+            running_balance = opening_balance + movement
 
             total_dr += dr_usd
             total_cr += cr_usd
 
             lines.append(
                 {
-                    "date": trx.transaction_date,
-                    "ref": (
-                        trx.transaction_booking_id.transaction_number
-                        if trx.transaction_booking_id
-                        else ""
-                    ),
-                    "description": trx.description or "",
+                    "date": trx_date,
+                    "ref": (number or 0) if booking_id else "",
+                    "description": description or "",
                     "debit": "${:,.3f}".format(dr_usd),
                     "credit": "${:,.3f}".format(cr_usd),
                     "balance": "${:,.3f}".format(running_balance),
@@ -540,38 +666,111 @@ class AccountHeader(models.Model):
             "report_date": fields.Date.today(),
         }
 
+    @api.model
+    def _classify_cash_flow_account(self, other_account):
+        """Cash-flow category of a counter-account (operating/investing/financing)."""
+        cat = "operating"
+        if other_account.FinancialReporting == "PL":
+            cat = "operating"
+        elif other_account.FinancialReporting == "BS":
+            code = other_account.code or ""
+            name = (other_account.name or "").lower()
+            if code.startswith(("15", "16")) or any(
+                w in name for w in ["equipment", "machinery", "vehicle", "building"]
+            ):
+                cat = "investing"
+            elif code.startswith("3") or any(
+                w in name
+                for w in ["equity", "capital", "loan", "drawing", "dividend"]
+            ):
+                cat = "financing"
+        return cat
+
     @api.model
     def get_cash_flow_advanced_data(self, company_id, start_date, end_date):
+        with track_report(self.env, "cash_flow_advanced") as stats:
+            report_data = self._get_cash_flow_advanced_data(
+                company_id, start_date, end_date
+            )
+        report_data["stats"] = stats
+        return report_data
+
+    def _get_cash_flow_advanced_data(self, company_id, start_date, end_date):
         company = (
             self.env["res.company"].browse(company_id)
             if company_id
             else self.env.company
         )
-        usd_currency = self.env.ref("base.USD")
+        Account = self.env["idil.chart.account"]
 
         # ==========================================================
         # 1) CASH FLOW (your original logic)
         # ==========================================================
 
         # 1. Get Cash Accounts
-        cash_accounts = self.env["idil.chart.account"].search(
+        cash_accounts = Account.search(
             [
                 ("account_type", "in", ["cash", "bank_transfer"]),
                 ("company_id", "=", company.id),
             ]
         )
-        cash_account_ids = cash_accounts.ids
-
-        # 2. Fetch Transactions for Cash Accounts
-        domain = [
-            ("account_number", "in", cash_account_ids),
-            ("transaction_date", ">=", start_date),
-            ("transaction_date", "<=", end_date),
-            ("company_id", "=", company.id),
-        ]
-        lines = self.env["idil.transaction_bookingline"].search(domain)
-
-        # 3. Categorize
+
+        # 2. Aggregate the cash-account lines per (counter-account, direction).
+        #    The counter-account of a booking is its largest non-cash line
+        #    (ties: highest id); bookings touching only cash accounts are
+        #    internal transfers and are skipped.
+        self.env["idil.transaction_bookingline"].flush_model()
+        flows = []
+        if cash_accounts:
+            self.env.cr.execute(
+                f"""
+                WITH booking_other AS (
+                    SELECT DISTINCT ON (obl.transaction_booking_id)
+                           obl.transaction_booking_id AS booking_id,
+                           obl.account_number AS other_account_id
+                      FROM idil_transaction_bookingline obl
+                      JOIN idil_chart_account oca ON oca.id = obl.account_number
+                     WHERE obl.transaction_booking_id IN (
+                               SELECT transaction_booking_id
+                                 FROM idil_transaction_bookingline
+                                WHERE account_number IN %(cash)s
+                                  AND transaction_date >= %(start)s
+                                  AND transaction_date <= %(end)s
+                                  AND company_id = %(company)s)
+                       AND COALESCE(oca.account_type IN ('cash', 'bank_transfer'), false) = false
+                     ORDER BY obl.transaction_booking_id,
+                              ABS(COALESCE(obl.dr_amount, 0) - COALESCE(obl.cr_amount, 0)) DESC,
+                              obl.id DESC
+                ),
+                flow AS (
+                    SELECT bl.id,
+                           bo.other_account_id,
+                           (COALESCE(bl.dr_amount, 0) - COALESCE(bl.cr_amount, 0))::float8
+                               / {self._USD_LINE_RATE} AS amount_usd
+                      FROM idil_transaction_bookingline bl
+                      JOIN booking_other bo ON bo.booking_id = bl.transaction_booking_id
+                      {self._USD_LINE_JOINS}
+                     WHERE bl.account_number IN %(cash)s
+                       AND bl.transaction_date >= %(start)s
+                       AND bl.transaction_date <= %(end)s
+                       AND bl.company_id = %(company)s
+                       AND ABS(COALESCE(bl.dr_amount, 0) - COALESCE(bl.cr_amount, 0)) >= 0.000001
+                )
+                SELECT other_account_id, amount_usd > 0 AS is_inflow,
+                       SUM(ABS(amount_usd)), MAX(id)
+                  FROM flow
+                 GROUP BY other_account_id, amount_usd > 0
+                """,
+                {
+                    "cash": tuple(cash_accounts.ids),
+                    "start": start_date,
+                    "end": end_date,
+                    "company": company.id,
+                },
+            )
+            flows = self.env.cr.fetchall()
+
+        # 3. Categorize (classification precomputed once per counter-account)
         categories = {
             "operating": {
                 "inflows": {},
@@ -592,91 +791,27 @@ class AccountHeader(models.Model):
                 "total_out": 0.0,
             },
         }
+        other_accounts = Account.browse({f[0] for f in flows})
+        classification = {
+            acc.id: (self._classify_cash_flow_account(acc), acc.name or "Unclassified")
+            for acc in other_accounts
+        }
 
-        def to_usd(amount, line):
-            """Convert line amount to USD if needed."""
-            if not amount:
-                return 0.0
-
-            line_currency = line.currency_id or (
-                line.account_number.currency_id if line.account_number else None
-            )
-            if not line_currency or line_currency.id == usd_currency.id:
-                return amount
-
-            booking = line.transaction_booking_id
-            tx_rate = (
-                booking.rate
-                or self._get_conversion_rate(line_currency.id, line.transaction_date)
-                or 1.0
-            )
-
-            # ASSUMPTION: tx_rate = (local per 1 USD) e.g. SL per USD
-            # local_amount / rate = USD
-            return amount / tx_rate
-
-        for line in lines:
-            booking = line.transaction_booking_id
-            if not booking:
-                continue
-
-            # Skip internal transfers (cash-to-cash)
-            all_accounts = booking.booking_lines.mapped("account_number")
-            if all(
-                acc and acc.account_type in ["cash", "bank_transfer"]
-                for acc in all_accounts
-            ):
-                continue
-
-            raw_amount = (line.dr_amount or 0.0) - (line.cr_amount or 0.0)
-            if abs(raw_amount) < 0.000001:
-                continue
-
-            amount_usd = to_usd(raw_amount, line)
-            is_inflow = amount_usd > 0
-
-            other_lines = booking.booking_lines.filtered(
-                lambda bl: bl.account_number
-                and bl.account_number.account_type not in ["cash", "bank_transfer"]
-            )
-            if not other_lines:
-                continue
-
-            def other_line_strength(bl):
-                return abs((bl.dr_amount or 0.0) - (bl.cr_amount or 0.0))
-
-            main_other = max(other_lines, key=other_line_strength)
-            other_account = main_other.account_number
-
-            # Classify
-            cat = "operating"
-            if other_account.FinancialReporting == "PL":
-                cat = "operating"
-            elif other_account.FinancialReporting == "BS":
-                code = other_account.code or ""
-                name = (other_account.name or "").lower()
-                if code.startswith(("15", "16")) or any(
-                    w in name for w in ["equipment", "machinery", "vehicle", "building"]
-                ):
-                    cat = "investing"
-                elif code.startswith("3") or any(
-                    w in name
-                    for w in ["equity", "capital", "loan", "drawing", "dividend"]
-                ):
-                    cat = "financing"
-
-            label = other_account.name or "Unclassified"
-            amt = abs(amount_usd)
-
-            if is_inflow:
-                categories[cat]["inflows"][label] = (
-                    categories[cat]["inflows"].get(label, 0.0) + amt
-                )
+        # Labels keep the order in which the newest line first reached them
+        buckets = {}
+        for other_account_id, is_inflow, amt, last_line_id in flows:
+            cat, label = classification[other_account_id]
+            key = (cat, "inflows" if is_inflow else "outflows", label)
+            amount, last_id = buckets.get(key, (0.0, 0))
+            buckets[key] = (amount + amt, max(last_id, last_line_id))
+
+        for (cat, direction, label), (amt, _last_id) in sorted(
+            buckets.items(), key=lambda item: -item[1][1]
+        ):
+            categories[cat][direction][label] = amt
+            if direction == "inflows":
                 categories[cat]["total_in"] += amt
             else:
-                categories[cat]["outflows"][label] = (
-                    categories[cat]["outflows"].get(label, 0.0) + amt
-                )
                 categories[cat]["total_out"] += amt
 
         def pack_cat(slug):
@@ -722,101 +857,21 @@ class AccountHeader(models.Model):
         # 2) INCOME STATEMENT (Refined Logic)
         # ==========================================================
 
-        Header = self.env["idil.chart.account.header"]
-        SubHeader = self.env["idil.chart.account.subheader"]
-        Account = self.env["idil.chart.account"]
-
         is_report_date = end_date
 
-        def acc_signed_usd(acc):
-            dr, cr = acc.get_dr_cr_balance_usd(is_report_date, company.id)
-            return (dr or 0.0) - (cr or 0.0)
-
-        def is_cogs(acc):
-            """
-            Strict Logic: Account is COGS only if Type is COGS.
-            Safety: Explicitly Exclude common OPEX names even if Type is COGS.
-            """
-            sh_name = (acc.subheader_id.name or "").lower()
-            # 1. Force Exclusion (Safety override)
-            if any(
-                x in sh_name
-                for x in [
-                    "rent",
-                    "utility",
-                    "utilities",
-                    "salary",
-                    "payroll",
-                    "commission",
-                    "admin",
-                    "operating",
-                    "expense",
-                ]
-            ):
-                return False
-
-            # 2. Strict Check
-            return getattr(acc, "account_type", None) in ("cogs", "COGS")
-
-        def build_sections(prefixes, mode="income", filter_fn=None):
-            """
-            Flattens the report structure: Group by SubHeader (Type) directly.
-            prefixes: list of strings, e.g. ['4'] or ['5', '6', '7']
-            """
-            flat_types = []
-            grand_total = 0.0
-
-            # 1. Match Headers by prefix
-            domain = ["|"] * (len(prefixes) - 1) + [
-                ("code", "=like", p + "%") for p in prefixes
-            ]
-            if len(prefixes) == 1:
-                domain = [("code", "=like", prefixes[0] + "%")]
-
-            headers = Header.search(domain, order="code")
-
-            for h in headers:
-                subs = SubHeader.search([("header_id", "=", h.id)], order="name")
-                for s in subs:
-                    t_block = {"name": s.name, "lines": [], "subtotal": 0.0}
-
-                    accs = Account.search(
-                        [("subheader_id", "=", s.id), ("company_id", "=", company.id)],
-                        order="code",
-                    )
-
-                    for acc in accs:
-                        if filter_fn and not filter_fn(acc):
-                            continue
-
-                        signed = acc_signed_usd(acc)
-                        amount = (-signed) if mode == "income" else signed
-
-                        if abs(amount) > 0.001:
-                            t_block["lines"].append(
-                                {
-                                    "code": acc.code or "",
-                                    "name": acc.name or "",
-                                    "amount": "${:,.3f}".format(amount),
-                                    "amount_raw": amount,
-                                }
-                            )
-                            t_block["subtotal"] += amount
-
-                    if t_block["lines"]:
-                        t_block["subtotal_fmt"] = "${:,.3f}".format(t_block["subtotal"])
-                        flat_types.append(t_block)
-                        grand_total += t_block["subtotal"]
-
-            return flat_types, grand_total
-
         # 1. Income (4xxx)
-        income_data, total_income = build_sections(["4"], mode="income")
+        income_data, total_income = self._build_income_sections(
+            company.id, is_report_date, ["4"], mode="income"
+        )
 
         # 2. COGS (5-9xxx where is_cogs is True)
         expense_prefixes = ["5", "6", "7", "8", "9"]
-        cogs_data, total_cogs = build_sections(
-            expense_prefixes, mode="expense", filter_fn=is_cogs
+        cogs_data, total_cogs = self._build_income_sections(
+            company.id,
+            is_report_date,
+            expense_prefixes,
+            mode="expense",
+            filter_fn=self._is_cogs_account,
         )
 
         # 3. Gross Profit
@@ -824,8 +879,12 @@ class AccountHeader(models.Model):
         gross_profit_fmt = "${:,.3f}".format(gross_profit)
 
         # 4. Operating Expenses (5-9xxx where is_cogs is False)
-        opex_data, total_opex = build_sections(
-            expense_prefixes, mode="expense", filter_fn=lambda a: not is_cogs(a)
+        opex_data, total_opex = self._build_income_sections(
+            company.id,
+            is_report_date,
+            expense_prefixes,
+            mode="expense",
+            filter_fn=lambda a: not self._is_cogs_account(a),
         )
 
         # 5. Net Profit
@@ -1228,8 +1287,10 @@ class Account(models.Model):
     # Add currency field
     currency_id = fields.Many2one("res.currency", string="Currency", required=True)
 
-    balance = fields.Float(
-        string="Current Balance", compute="_compute_balance", store=True
+    # Maintained by the idil.account.balance trigger on booking lines.
+    balance = fields.Float(string="Current Balance", readonly=True, copy=False)
+    balance_ids = fields.One2many(
+        "idil.account.balance", "account_id", string="Running Balances"
     )
 
     transaction_bookingline_ids = fields.One2many(
@@ -1318,52 +1379,44 @@ class Account(models.Model):
                         }
                     )
 
-    @api.depends(
-        "transaction_bookingline_ids.dr_amount", "transaction_bookingline_ids.cr_amount"
-    )
-    def _compute_balance(self):
-        for account in self:
-            # Clear the balance before calculation
-            account.balance = 0
-            debit_sum = sum(
-                account.transaction_bookingline_ids.filtered(
-                    lambda l: l.transaction_type == "dr"
-                ).mapped("dr_amount")
-            )
-            credit_sum = sum(
-                account.transaction_bookingline_ids.filtered(
-                    lambda l: l.transaction_type == "cr"
-                ).mapped("cr_amount")
-            )
-            account.balance = debit_sum - credit_sum
-
-    @api.model
-    def read_group(
-        self, domain, fields, groupby, offset=0, limit=None, orderby=False, lazy=True
-    ):
-        if "balance" in fields:
-            fields.remove("balance")
-        res = super(Account, self).read_group(
-            domain, fields, groupby, offset, limit, orderby, lazy
-        )
-        if "balance" not in fields:
-            fields.append("balance")
-        if "balance" in fields:
-            for line in res:
-                if "__domain" in line:
-                    accounts = self.search(line["__domain"])
-                    # Ensure balances are computed
-                    accounts._compute_balance()
-                    balance = sum(account.balance for account in accounts)
-                    line["balance"] = balance
-        return res
+    def action_verify_balance(self):
+        """Check the running balances of these accounts against the raw lines."""
+        mismatches = self.env["idil.account.balance"].verify(self.ids or None)
+        if mismatches:
+            accounts = self.browse({m["account_id"] for m in mismatches})
+            message = _("%(count)s account(s) out of sync: %(codes)s") % {
+                "count": len(accounts),
+                "codes": ", ".join(a.code for a in accounts[:20]),
+            }
+            level = "warning"
+        else:
+            message = _("Running balances match the booking lines.")
+            level = "success"
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Balance Verification"),
+                "message": message,
+                "type": level,
+                "sticky": bool(mismatches),
+            },
+        }
 
-    @api.model
-    def read(self, fields=None, load="_classic_read"):
-        res = super(Account, self).read(fields, load)
-        for record in self:
-            record._compute_balance()
-        return res
+    def action_rebuild_balance(self):
+        """Recompute the running balances of these accounts from the raw lines."""
+        self.env["idil.account.balance"].rebuild(self.ids or None)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Balance Rebuild Complete"),
+                "message": _("Rebuilt running balances for %s account(s).")
+                % (len(self) or _("all")),
+                "type": "success",
+                "sticky": False,
+            },
+        }
 
     def name_get(self):
         result = []
@@ -1415,27 +1468,52 @@ class Account(models.Model):
 
     def get_balance_as_of_date(self, date):
         self.ensure_one()  # Ensures this is called on a single record
-        transactions = self.env["idil.transaction_bookingline"].search(
-            [
-                ("account_number", "=", self.id),
-                (
-                    "transaction_date",
-                    "<=",
-                    date,
-                ),  # Filter transactions up to the specified date
-            ]
+        totals = self.get_ledger_totals_as_of(date)[self.id]
+        return abs(totals["typed_dr"] - totals["typed_cr"])
+
+    def get_ledger_totals_as_of(self, date, company_id=None):
+        """
+        Batch as-of-date totals for all accounts in self, served from the
+        month-end snapshots plus the lines posted after them.
+        Returns {account_id: totals} (see idil.account.balance.snapshot).
+        """
+        return self.env["idil.account.balance.snapshot"].get_totals_as_of(
+            self.ids, date, company_id
         )
-        debit = sum(
-            transaction.dr_amount
-            for transaction in transactions
-            if transaction.transaction_type == "dr"
+
+    @api.model
+    def _usd_balance_from_totals(self, totals):
+        """Average-rate USD (dr, cr) of an account from its ledger totals."""
+        avg_rate = (
+            totals["fx_weighted"] / totals["fx_movement"]
+            if totals["fx_movement"]
+            else 1.0
         )
-        credit = sum(
-            transaction.cr_amount
-            for transaction in transactions
-            if transaction.transaction_type == "cr"
+
+        # company currency part stays as-is
+        company_net = totals["company_dr"] - totals["company_cr"]
+
+        # foreign currency part: convert NET balance once
+        foreign_net = totals["foreign_dr"] - totals["foreign_cr"]
+        foreign_net_usd = foreign_net / avg_rate if avg_rate else foreign_net
+
+        final_balance = company_net + foreign_net_usd
+
+        if final_balance >= 0:
+            return final_balance, 0.0
+        else:
+            return 0.0, abs(final_balance)
+
+    def get_dr_cr_balances_usd(self, date, company_id):
+        """Batch get_dr_cr_balance_usd: {account_id: (dr, cr)}."""
+        totals = self.get_ledger_totals_as_of(date, company_id)
+        self.env["idil.account.balance.snapshot"]._check_missing_rates(
+            self, totals, date
         )
-        return abs(debit - credit)
+        return {
+            account_id: self._usd_balance_from_totals(account_totals)
+            for account_id, account_totals in totals.items()
+        }
 
     @api.model
     def get_balance_as_of_date_for_bs(self, date, company_id):
@@ -1450,103 +1528,19 @@ class Account(models.Model):
         """
         self.ensure_one()
 
-        transactions = self.env["idil.transaction_bookingline"].search(
-            [
-                ("account_number", "=", self.id),
-                ("transaction_date", "<=", date),
-                ("company_id", "=", company_id),
-            ]
+        totals = self.get_ledger_totals_as_of(date, company_id)
+        self.env["idil.account.balance.snapshot"]._check_missing_rates(
+            self, totals, date
         )
 
-        total_debit_usd = 0.0
-        total_credit_usd = 0.0
-
-        company = self.env["res.company"].browse(company_id)
-        company_currency = company.currency_id
-
-        for transaction in transactions:
-            currency = transaction.currency_id or company_currency
-
-            if currency.id == company_currency.id:
-                rate = 1.0
-            else:
-                rate = transaction.rate or self._get_conversion_rate(
-                    currency.id, transaction.transaction_date
-                )
-
-            if not rate or rate == 0:
-                rate = 1.0
-
-            total_debit_usd += (transaction.dr_amount or 0.0) / rate
-            total_credit_usd += (transaction.cr_amount or 0.0) / rate
-
         return (
-            float_round(total_debit_usd, precision_digits=2),
-            float_round(total_credit_usd, precision_digits=2),
+            float_round(totals[self.id]["hist_dr_usd"], precision_digits=2),
+            float_round(totals[self.id]["hist_cr_usd"], precision_digits=2),
         )
 
     def get_dr_cr_balance_usd(self, date, company_id):
         self.ensure_one()
-
-        transactions = self.env["idil.transaction_bookingline"].search(
-            [
-                ("account_number", "=", self.id),
-                ("transaction_date", "<=", date),
-                ("company_id", "=", company_id),
-            ]
-        )
-
-        total_company_debit = 0.0
-        total_company_credit = 0.0
-        total_foreign_debit = 0.0
-        total_foreign_credit = 0.0
-
-        weighted_amount_total = 0.0
-        weighted_rate_total = 0.0
-
-        company = self.env["res.company"].browse(company_id)
-        company_currency = company.currency_id
-
-        for transaction in transactions:
-            currency = transaction.currency_id or company_currency
-            dr = transaction.dr_amount or 0.0
-            cr = transaction.cr_amount or 0.0
-
-            if currency.id == company_currency.id:
-                total_company_debit += dr
-                total_company_credit += cr
-            else:
-                total_foreign_debit += dr
-                total_foreign_credit += cr
-
-                rate = transaction.rate or self._get_conversion_rate(
-                    currency.id, transaction.transaction_date
-                )
-
-                movement = abs(dr) + abs(cr)
-                if rate and rate > 0 and movement:
-                    weighted_amount_total += movement
-                    weighted_rate_total += movement * rate
-
-        avg_rate = (
-            weighted_rate_total / weighted_amount_total
-            if weighted_amount_total
-            else 1.0
-        )
-
-        # company currency part stays as-is
-        company_net = total_company_debit - total_company_credit
-
-        # foreign currency part: convert NET balance once
-        foreign_net = total_foreign_debit - total_foreign_credit
-        foreign_net_usd = foreign_net / avg_rate if avg_rate else foreign_net
-
-        final_balance = company_net + foreign_net_usd
-
-        if final_balance >= 0:
-            return final_balance, 0.0
-        else:
-            return 0.0, abs(final_balance)
+        return self.get_dr_cr_balances_usd(date, company_id)[self.id]
 
     # def get_dr_cr_balance_usd(self, date, company_id):
     #     self.ensure_one()
@@ -1640,34 +1634,14 @@ class Account(models.Model):
 
     @api.model
     def _get_conversion_rate(self, from_currency_id, date):
-        # Get the currency models
-        from_currency = self.env["res.currency"].browse(from_currency_id)
-        to_currency = self.env.ref(
-            "base.USD"
-        )  # Assuming USD is the to_currency, adjust as needed
-
-        # Ensure currencies are valid
-        if not from_currency or not to_currency:
-            raise UserError(_("Invalid currency provided"))
-
-        # Get the currency rate model
-        currency_rate = self.env["res.currency.rate"]
-
-        # Search for the conversion rate
-        # We should filter by 'currency_id' (the currency field) and not 'rate_currency_id'
-        rate_record = currency_rate.search(
-            [("currency_id", "=", from_currency.id), ("name", "<=", date)],
-            limit=1,
-            order="name desc",
-        )
-
-        if not rate_record:
+        rate = self.env["idil.currency.rate.service"].get_rate(from_currency_id, date)
+        if rate is None:
+            from_currency = self.env["res.currency"].browse(from_currency_id)
             raise UserError(
                 _("Conversion rate not found for %s to %s as of %s")
-                % (from_currency.name, to_currency.name, date)
+                % (from_currency.name, self.env.ref("base.USD").name, date)
             )
-
-        return rate_record.rate
+        return rate
 
 
 class AccountBalanceReport(models.TransientModel):
@@ -1690,25 +1664,11 @@ class AccountBalanceReport(models.TransientModel):
 
     @api.depends("account_id")
     def _compute_balance(self):
+        balances = self.env["idil.account.balance"].get_balances(
+            self.account_id.ids
+        )
         for report in self:
-            # Initialize balance to 0 for each report entry
-            report.balance = 0
-            # Find transactions related to this account_code
-            transactions = self.env["idil.transaction_bookingline"].search(
-                [("account_number", "=", report.account_id.id)]
-            )
-            debit = sum(
-                transactions.filtered(lambda r: r.transaction_type == "dr").mapped(
-                    "dr_amount"
-                )
-            )
-            credit = sum(
-                transactions.filtered(lambda r: r.transaction_type == "cr").mapped(
-                    "cr_amount"
-                )
-            )
-            # Calculate balance
-            report.balance = abs(debit - credit)
+            report.balance = abs(balances.get(report.account_id.id, 0.0))
 
     @api.model
     def generate_account_balances_report(self):
@@ -0,0 +1,183 @@
+from bisect import bisect_right
+
+from odoo import models, fields, api, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Scope keys of a cached rate history
+ALL_COMPANIES = None  # every res.currency.rate row of the currency
+SHARED_RATES = False  # rows without a company
+
+# cr.cache / cr.postcommit.data key of the rate version
+VERSION_KEY = "idil.currency.rate.version"
+
+
+class CurrencyRateService(models.AbstractModel):
+    """
+    Memoized res.currency.rate lookups.
+
+    The rate history of a currency is loaded once per scope into two sorted
+    tuples (dates, rates) held in the registry ormcache, and (currency, date)
+    lookups are answered with a bisect, one at a time or for a whole
+    recordset of booking lines. Cached histories are keyed on a rate
+    version kept in a database sequence: any change to res.currency.rate or
+    to an idil.currency.exchange bumps it, so every worker reloads the rates
+    without the other registry caches being cleared.
+    """
+
+    _name = "idil.currency.rate.service"
+    _description = "Currency Rate Lookup Service"
+
+    def init(self):
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS idil_currency_rate_version_seq")
+
+    @api.model
+    def _get_rate_version(self):
+        """Rate version, read once per transaction."""
+        cr = self.env.cr
+        if VERSION_KEY not in cr.cache:
+            cr.execute("SELECT last_value FROM idil_currency_rate_version_seq")
+            cr.cache[VERSION_KEY] = cr.fetchone()[0]
+            # read it again in the next transaction of this cursor
+            cr.postcommit.add(lambda: cr.cache.pop(VERSION_KEY, None))
+            cr.postrollback.add(lambda: cr.cache.pop(VERSION_KEY, None))
+        return cr.cache[VERSION_KEY]
+
+    @api.model
+    @tools.ormcache("currency_id", "scope", "version")
+    def _get_rate_history(self, currency_id, scope=ALL_COMPANIES, version=0):
+        """(dates, rates) of a currency, ascending by date, for one scope."""
+        query = "SELECT name, rate FROM res_currency_rate WHERE currency_id = %s"
+        params = [currency_id]
+        if scope is SHARED_RATES:
+            query += " AND company_id IS NULL"
+        elif scope is not ALL_COMPANIES:
+            query += " AND company_id = %s"
+            params.append(scope)
+        query += " ORDER BY name, id"
+        self.env["res.currency.rate"].flush_model(["name", "rate", "currency_id", "company_id"])
+        self.env.cr.execute(query, params)
+        rows = self.env.cr.fetchall()
+        return tuple(r[0] for r in rows), tuple(r[1] for r in rows)
+
+    @api.model
+    def get_rate(self, currency_id, date, scope=ALL_COMPANIES):
+        """Latest rate of currency_id on or before date, or None."""
+        if not currency_id:
+            return None
+        date = fields.Date.to_date(date) if date else fields.Date.today()
+        dates, rates = self._get_rate_history(currency_id, scope, self._get_rate_version())
+        idx = bisect_right(dates, date) - 1
+        return rates[idx] if idx >= 0 else None
+
+    @api.model
+    def get_document_rate(self, currency, date, company):
+        """
+        Rate for a document of company: same precedence as the former
+        `company_id in (company, False)` search ordered by
+        "company_id desc, name desc", i.e. shared rates first.
+        """
+        if not currency:
+            return 0.0
+        rate = self.get_rate(currency.id, date, SHARED_RATES)
+        if rate is None and company:
+            rate = self.get_rate(currency.id, date, company.id)
+        return rate or 0.0
+
+    @api.model
+    def get_line_rates(self, lines, usd_currency=None):
+        """
+        {line_id: rate} for booking lines: the frozen line rate, else the
+        latest rate of the line currency; USD lines (or no currency) are 1.0.
+        Missing rates come back as None. The version is read once and each
+        currency history is loaded once for the whole recordset.
+        """
+        usd_currency = usd_currency or self.env.ref("base.USD")
+        version = self._get_rate_version()
+        histories = {}
+        result = {}
+        for line in lines:
+            currency = line.currency_id
+            if not currency or currency.id == usd_currency.id:
+                result[line.id] = 1.0
+                continue
+            if line.rate:
+                result[line.id] = line.rate
+                continue
+            if currency.id not in histories:
+                histories[currency.id] = self._get_rate_history(
+                    currency.id, ALL_COMPANIES, version
+                )
+            dates, rates = histories[currency.id]
+            date = fields.Date.to_date(line.transaction_date) or fields.Date.today()
+            idx = bisect_right(dates, date) - 1
+            result[line.id] = rates[idx] if idx >= 0 else None
+        return result
+
+    @api.model
+    def convert_lines_to_usd(self, lines):
+        """{line_id: (dr_usd, cr_usd)} for a whole recordset of booking lines."""
+        rates = self.get_line_rates(lines)
+        result = {}
+        for line in lines:
+            rate = rates[line.id] or 1.0
+            result[line.id] = (
+                (line.dr_amount or 0.0) / rate,
+                (line.cr_amount or 0.0) / rate,
+            )
+        return result
+
+    @api.model
+    def invalidate(self):
+        """
+        Bump the rate version now, so this transaction reads its own changes,
+        and again once it ends: other workers may have cached the rates as
+        they were before the commit (or the rollback) under the first bump.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT nextval('idil_currency_rate_version_seq')")
+        cr.cache.pop(VERSION_KEY, None)
+        if not cr.postcommit.data.get(VERSION_KEY):
+            cr.postcommit.data[VERSION_KEY] = True
+            registry = self.env.registry
+
+            def bump():
+                cr.postcommit.data.pop(VERSION_KEY, None)
+                # sequences are not transactional: a short cursor is enough
+                with registry.cursor() as new_cr:
+                    new_cr.execute("SELECT nextval('idil_currency_rate_version_seq')")
+
+            cr.postcommit.add(bump)
+            cr.postrollback.add(bump)
+
+
+class CurrencyRate(models.Model):
+    _inherit = "res.currency.rate"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._on_rate_change()
+        return records
+
+    def write(self, vals):
+        relevant = {"rate", "name", "currency_id", "company_id"}.intersection(vals)
+        if relevant:
+            self._on_rate_change()
+        res = super().write(vals)
+        if relevant:
+            self._on_rate_change()
+        return res
+
+    def unlink(self):
+        self._on_rate_change()
+        return super().unlink()
+
+    def _on_rate_change(self):
+        if not self:
+            return
+        self.env["idil.currency.rate.service"].invalidate()
+        self.env["idil.account.balance.snapshot"].sudo().invalidate_currency(
+            self.currency_id.ids, min(self.mapped("name"))
+        )
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
 
 
@@ -42,10 +44,13 @@ class Customer(models.Model):
         "customer_id",  # Field in the sale order model that links back to customer
         string="Sale Orders",
     )
+    sales_receipt_ids = fields.One2many(
+        "idil.sales.receipt", "customer_id", string="Sales Receipts"
+    )
     customer_balance = fields.Float(
         string="Customer Balance",
         compute="_compute_total_receipt_due",
-        store=False,  # set to True if you want to store the result in the database
+        store=True,  # kept up to date by the receipts, so lists can sort/filter on it
     )
 
     # Relation field to display related sale orders (transactions)
@@ -71,24 +76,32 @@ class Customer(models.Model):
         string="Journal Entries",
     )
 
-    @api.depends("sale_order_ids")
+    @api.depends("sales_receipt_ids.remaining_amount", "sales_receipt_ids.payment_status")
     def _compute_total_receipt_due(self):
+        # One grouped query for every customer in self
+        groups = self.env["idil.sales.receipt"].read_group(
+            [("customer_id", "in", self._origin.ids), ("payment_status", "!=", "paid")],
+            ["remaining_amount:sum"],
+            ["customer_id"],
+        )
+        totals = {g["customer_id"][0]: g["remaining_amount"] or 0.0 for g in groups}
         for rec in self:
-            total_due = 0.0
-            receipts = self.env["idil.sales.receipt"].search(
-                [("customer_id", "=", rec.id), ("payment_status", "!=", "paid")]
-            )
-            total_due = sum(receipts.mapped("remaining_amount"))
-            rec.customer_balance = total_due
+            rec.customer_balance = totals.get(rec._origin.id, 0.0)
+
+    def _get_sale_order_balances(self, include_cancelled=True):
+        """{customer_id: summed balance_due} over the sale orders of self."""
+        balances = defaultdict(float)
+        # The orders of all customers are read in one prefetched batch
+        for order in self.sale_order_ids:
+            if include_cancelled or order.state != "cancel":
+                balances[order.customer_id.id] += order.balance_due
+        return balances
 
     @api.depends("sale_order_ids.balance_due", "sale_order_ids.state")
     def _compute_customer_balance(self):
+        balances = self._get_sale_order_balances(include_cancelled=False)
         for rec in self:
-            balance = 0.0
-            for order in rec.sale_order_ids:
-                if order.state != "cancel":
-                    balance += order.balance_due
-            rec.customer_balance = balance
+            rec.customer_balance = balances[rec.id]
 
     @api.depends("cusotmer_payment_ids.amount")
     def _compute_customer_payment_balance(self):
@@ -97,8 +110,6 @@ class Customer(models.Model):
         associated with the customer. This method is triggered when the amount in customer payment
         ids changes.
         """
+        balances = self._get_sale_order_balances()
         for rec in self:
-            balance = 0.0
-            for order in rec.sale_order_ids:
-                balance += order.balance_due
-            rec.customer_balance = balance
+            rec.customer_Payment_balance = balances[rec.id]
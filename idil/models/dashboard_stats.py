@@ -1,94 +1,209 @@
-from odoo import models, fields, api
+import time
+from decimal import Decimal
+
+from odoo import models, fields, api, _
 from datetime import datetime, timedelta
 from collections import defaultdict
 
+KPI_CACHE_TTL = 60  # seconds
+
+# {(dbname, company ids, group ids): (expires at, stats)}, per worker
+_kpi_cache = {}
+
+# Models read by the KPI query of get_dashboard_stats
+KPI_MODELS = (
+    'idil.purchase_order',
+    'idil.vendor_transaction',
+    'idil.purchase_return',
+    'idil.item.movement',
+    'idil.item',
+    'idil.vendor.registration',
+    'idil.stock.adjustment',
+    'idil.sale.order',
+    'idil.customer.registration',
+    'idil.sale.return',
+    'idil.sales.receipt',
+    'idil.customer.sale.order',
+)
+
+
 class IdilDashboard(models.Model):
     _name = 'idil.dashboard'
     _description = 'Idil Dashboard Logic'
 
     @api.model
-    def get_dashboard_stats(self):
+    def _kpi_scope(self, model_name, alias):
         """
-        Fetch statistics for the Inventory Dashboard.
+        SQL filter matching search([]) on model_name: active records of the
+        current companies (records without company included).
         """
-        # 1. KPI Counts
-        purchase_count = self.env['idil.purchase_order'].search_count([]) # Assuming model name
-        vendor_trx_count = self.env['idil.vendor_transaction'].search_count([])
-        purchase_return_count = self.env['idil.purchase_return'].search_count([])
-        product_count = self.env['idil.item'].search_count([]) # Assuming 'idil.item' is the product model
+        model = self.env[model_name]
+        clauses = []
+        active = model._fields.get('active')
+        if active and active.store:
+            clauses.append(f"{alias}.active")
+        company = model._fields.get('company_id')
+        if company and company.store:
+            clauses.append(
+                f"({alias}.company_id IS NULL OR {alias}.company_id IN %(company_ids)s)"
+            )
+        return " AND ".join(clauses) or "TRUE"
 
-        # 2. Financial & Actionable Metrics
-        # Total Spend (Confirmed Orders)
-        total_spend = sum(self.env['idil.purchase_order'].search([('state', '=', 'confirmed')]).mapped('amount'))
-        
-        # Pending Approvals
-        pending_count = self.env['idil.purchase_order'].search_count([('state', '=', 'pending')])
-        
-        # Total Stock Value (Quantity * Cost Price)
-        items = self.env['idil.item'].search([])
-        stock_value = sum(item.quantity * item.cost_price for item in items)
-        
-        # Low Stock Alerts (Quantity < 10)
-        low_stock_count = self.env['idil.item'].search_count([('quantity', '<', 10)])
+    @api.model
+    def _invalidate_kpi_cache(self):
+        """Drop the cached KPIs of this database once the transaction commits."""
+        postcommit = self.env.cr.postcommit
+        if postcommit.data.get('idil.dashboard.kpi'):
+            return  # already scheduled in this transaction
+        postcommit.data['idil.dashboard.kpi'] = True
+        dbname = self.env.cr.dbname
 
-        # 3. Comprehensive Metrics (Vendors, Payments, Adjustments)
-        # Active Vendors
-        vendor_count = self.env['idil.vendor.registration'].search_count([('active', '=', True)])
-        
-        # Vendor Payments
-        vendor_transactions = self.env['idil.vendor_transaction'].search([])
-        total_paid = sum(vendor_transactions.mapped('paid_amount'))
-        total_payable = sum(vendor_transactions.mapped('remaining_amount'))
-        
-        # Stock Adjustments
-        adjustment_count = self.env['idil.stock.adjustment'].search_count([])
-        adjustment_value = sum(self.env['idil.stock.adjustment'].search([]).mapped('total_amount'))
+        def invalidate():
+            for key in [key for key in _kpi_cache if key[0] == dbname]:
+                _kpi_cache.pop(key, None)
 
-        return {
-            'purchase_count': purchase_count,
-            'vendor_trx_count': vendor_trx_count,
-            'purchase_return_count': purchase_return_count,
-            'product_count': product_count,
-            'total_spend': total_spend,
-            'pending_count': pending_count,
-            'stock_value': stock_value,
-            'low_stock_count': low_stock_count,
-            'vendor_count': vendor_count,
-            'total_paid': total_paid,
-            'total_payable': total_payable,
-            'adjustment_count': adjustment_count,
-            'adjustment_value': adjustment_value,
-            # Sales Metrics
-            'total_sales': sum(self.env['idil.sale.order'].search([('state', '=', 'confirmed')]).mapped('order_total')),
-            'active_customers': self.env['idil.customer.registration'].search_count([('status', '=', True)]),
-            'pending_sales_orders': self.env['idil.sale.order'].search_count([('state', '=', 'draft')]),
-            'sales_returns_count': self.env['idil.sale.return'].search_count([]),
-            'total_sales_receipts': sum(self.env['idil.sales.receipt'].search([('payment_status', '=', 'paid')]).mapped('paid_amount')),
-            'customer_orders_count': self.env['idil.customer.sale.order'].search_count([]),
+        postcommit.add(invalidate)
+
+    @api.model
+    def get_dashboard_stats(self):
+        """
+        Fetch statistics for the Inventory Dashboard.
+
+        All KPIs come from one SQL statement aggregating each table once,
+        and are kept KPI_CACHE_TTL seconds per set of companies and groups;
+        posting a booking line drops the cache. Read access to every model
+        is checked first, but record rules are not applied: records are only
+        filtered on the current companies.
+        """
+        for model_name in KPI_MODELS:
+            self.env[model_name].check_access_rights('read')
+        key = (
+            self.env.cr.dbname,
+            tuple(sorted(self.env.companies.ids)),
+            tuple(sorted(self.env.user.groups_id.ids)),
+        )
+        cached = _kpi_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return dict(cached[1])
+
+        self.env.flush_all()
+        scope = self._kpi_scope
+        query = f"""
+            WITH po AS (
+                SELECT COUNT(*) AS purchase_count,
+                       COALESCE(SUM(po.amount) FILTER (WHERE po.state = 'confirmed'), 0) AS total_spend,
+                       COUNT(*) FILTER (WHERE po.state = 'pending') AS pending_count
+                  FROM idil_purchase_order po
+                 WHERE {scope('idil.purchase_order', 'po')}
+            ), vt AS (
+                SELECT COUNT(*) AS vendor_trx_count,
+                       COALESCE(SUM(vt.paid_amount), 0) AS total_paid,
+                       COALESCE(SUM(vt.remaining_amount), 0) AS total_payable
+                  FROM idil_vendor_transaction vt
+                 WHERE {scope('idil.vendor_transaction', 'vt')}
+            ), pr AS (
+                SELECT COUNT(*) AS purchase_return_count
+                  FROM idil_purchase_return pr
+                 WHERE {scope('idil.purchase_return', 'pr')}
+            ), stock AS (
+                -- same rule as idil.item.quantity: sum of the in/out movements
+                SELECT m.item_id, ROUND(SUM(m.quantity)::numeric, 5) AS qty
+                  FROM idil_item_movement m
+                 WHERE m.movement_type IN ('in', 'out')
+                 GROUP BY m.item_id
+            ), it AS (
+                SELECT COUNT(*) AS product_count,
+                       COALESCE(SUM(COALESCE(s.qty, 0) * it.cost_price), 0) AS stock_value,
+                       COUNT(*) FILTER (WHERE COALESCE(s.qty, 0) < 10) AS low_stock_count
+                  FROM idil_item it
+                  LEFT JOIN stock s ON s.item_id = it.id
+                 WHERE {scope('idil.item', 'it')}
+            ), vr AS (
+                SELECT COUNT(*) AS vendor_count
+                  FROM idil_vendor_registration vr
+                 WHERE {scope('idil.vendor.registration', 'vr')}
+            ), sa AS (
+                SELECT COUNT(*) AS adjustment_count,
+                       COALESCE(SUM(sa.total_amount), 0) AS adjustment_value
+                  FROM idil_stock_adjustment sa
+                 WHERE {scope('idil.stock.adjustment', 'sa')}
+            ), so AS (
+                SELECT COALESCE(SUM(so.order_total) FILTER (WHERE so.state = 'confirmed'), 0) AS total_sales,
+                       COUNT(*) FILTER (WHERE so.state = 'draft') AS pending_sales_orders
+                  FROM idil_sale_order so
+                 WHERE {scope('idil.sale.order', 'so')}
+            ), cu AS (
+                SELECT COUNT(*) AS active_customers
+                  FROM idil_customer_registration cu
+                 WHERE cu.status AND {scope('idil.customer.registration', 'cu')}
+            ), sr AS (
+                SELECT COUNT(*) AS sales_returns_count
+                  FROM idil_sale_return sr
+                 WHERE {scope('idil.sale.return', 'sr')}
+            ), rc AS (
+                SELECT COALESCE(SUM(rc.paid_amount) FILTER (WHERE rc.payment_status = 'paid'), 0)
+                           AS total_sales_receipts
+                  FROM idil_sales_receipt rc
+                 WHERE {scope('idil.sales.receipt', 'rc')}
+            ), cso AS (
+                SELECT COUNT(*) AS customer_orders_count
+                  FROM idil_customer_sale_order cso
+                 WHERE {scope('idil.customer.sale.order', 'cso')}
+            )
+            SELECT * FROM po, vt, pr, it, vr, sa, so, cu, sr, rc, cso
+        """
+        self.env.cr.execute(query, {'company_ids': key[1] or (0,)})
+        stats = {
+            name: float(value) if isinstance(value, Decimal) else value
+            for name, value in self.env.cr.dictfetchone().items()
         }
+        _kpi_cache[key] = (time.monotonic() + KPI_CACHE_TTL, stats)
+        return dict(stats)
+
+    @api.model
+    def _sales_facts(self, select, joins="", where="TRUE", group_by=None,
+                     order_by=None, limit=None, params=None):
+        """
+        Aggregate the idil.sales.daily.fact rows ("f") of the current
+        companies. The fact table follows the sales orders and returns, so
+        the widgets below never scan the documents themselves.
+        """
+        self.env['idil.sales.daily.fact'].flush_model()
+        query = f"""
+            SELECT {select}
+              FROM idil_sales_daily_fact f
+              {joins}
+             WHERE {self._kpi_scope('idil.sales.daily.fact', 'f')} AND {where}
+        """
+        if group_by:
+            query += f" GROUP BY {group_by}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        if limit:
+            query += " LIMIT %(limit)s"
+        self.env.cr.execute(query, dict(
+            params or {},
+            company_ids=tuple(self.env.companies.ids) or (0,),
+            limit=limit,
+        ))
+        return self.env.cr.dictfetchall()
 
     @api.model
     def get_top_products(self, limit=10):
         """
         Get top-selling products by quantity and revenue.
         """
-        query = """
-            SELECT 
-                p.id,
-                p.name,
-                SUM(sol.quantity) as total_qty,
-                SUM(sol.quantity * sol.price_unit) as total_revenue
-            FROM idil_sale_order_line sol
-            JOIN idil_item p ON p.id = sol.product_id
-            JOIN idil_sale_order so ON so.id = sol.order_id
-            WHERE so.state = 'confirmed'
-            GROUP BY p.id, p.name
-            ORDER BY total_revenue DESC
-            LIMIT %s
-        """
-        self.env.cr.execute(query, (limit,))
-        results = self.env.cr.dictfetchall()
-        
+        results = self._sales_facts(
+            """p.id, p.name,
+               SUM(f.qty_sold) AS total_qty,
+               SUM(f.revenue) AS total_revenue""",
+            joins="JOIN my_product_product p ON p.id = f.product_id",
+            where="f.qty_sold <> 0",
+            group_by="p.id, p.name",
+            order_by="total_revenue DESC",
+            limit=limit,
+        )
+
         return {
             'labels': [r['name'] for r in results],
             'quantities': [float(r['total_qty'] or 0) for r in results],
@@ -102,25 +217,20 @@ class IdilDashboard(models.Model):
         """
         if not date:
             date = fields.Date.today()
-        
-        # Query to get hourly sales
-        query = """
-            SELECT 
-                EXTRACT(HOUR FROM order_date) as hour,
-                COUNT(*) as order_count,
-                SUM(order_total) as total_sales
-            FROM idil_sale_order
-            WHERE DATE(order_date) = %s
-            AND state = 'confirmed'
-            GROUP BY EXTRACT(HOUR FROM order_date)
-            ORDER BY hour
-        """
-        self.env.cr.execute(query, (date,))
-        results = self.env.cr.dictfetchall()
-        
+
+        results = self._sales_facts(
+            """f.hour,
+               SUM(f.order_count) AS order_count,
+               SUM(f.order_total) AS total_sales""",
+            where="f.date = %(date)s AND f.order_count <> 0",
+            group_by="f.hour",
+            order_by="f.hour",
+            params={'date': date},
+        )
+
         # Fill in missing hours with 0
         hourly_data = {int(r['hour']): float(r['total_sales'] or 0) for r in results}
-        
+
         return {
             'labels': [f"{h:02d}:00" for h in range(24)],
             'data': [hourly_data.get(h, 0) for h in range(24)],
@@ -129,25 +239,20 @@ class IdilDashboard(models.Model):
     @api.model
     def get_sales_by_category(self):
         """
-        Get sales breakdown by product (Top 5 products).
-        Note: Items don't have categories, so we group by product instead.
+        Get sales breakdown by product category (Top 5 categories).
         """
-        query = """
-            SELECT 
-                p.name as category,
-                SUM(sol.quantity * sol.price_unit) as total_sales,
-                SUM(sol.quantity) as total_qty
-            FROM idil_sale_order_line sol
-            JOIN idil_item p ON p.id = sol.product_id
-            JOIN idil_sale_order so ON so.id = sol.order_id
-            WHERE so.state = 'confirmed'
-            GROUP BY p.name
-            ORDER BY total_sales DESC
-            LIMIT 5
-        """
-        self.env.cr.execute(query)
-        results = self.env.cr.dictfetchall()
-        
+        results = self._sales_facts(
+            """COALESCE(c.name, %(uncategorized)s) AS category,
+               SUM(f.revenue) AS total_sales,
+               SUM(f.qty_sold) AS total_qty""",
+            joins="LEFT JOIN product_category c ON c.id = f.category_id",
+            where="f.qty_sold <> 0",
+            group_by="f.category_id, c.name",
+            order_by="total_sales DESC",
+            limit=5,
+            params={'uncategorized': _('Uncategorized')},
+        )
+
         return {
             'labels': [r['category'] for r in results],
             'data': [float(r['total_sales'] or 0) for r in results],
@@ -159,22 +264,18 @@ class IdilDashboard(models.Model):
         """
         Get top salespeople by total sales.
         """
-        query = """
-            SELECT 
-                sp.name as salesperson,
-                COUNT(DISTINCT so.id) as order_count,
-                SUM(so.order_total) as total_sales,
-                SUM(so.commission_amount) as total_commission
-            FROM idil_sale_order so
-            JOIN idil_sales_sales_personnel sp ON sp.id = so.sales_person_id
-            WHERE so.state = 'confirmed'
-            GROUP BY sp.id, sp.name
-            ORDER BY total_sales DESC
-            LIMIT %s
-        """
-        self.env.cr.execute(query, (limit,))
-        results = self.env.cr.dictfetchall()
-        
+        results = self._sales_facts(
+            """sp.name AS salesperson,
+               SUM(f.order_count) AS order_count,
+               SUM(f.order_total) AS total_sales,
+               SUM(f.commission_amount) AS total_commission""",
+            joins="JOIN idil_sales_sales_personnel sp ON sp.id = f.sales_person_id",
+            where="f.order_count <> 0",
+            group_by="sp.id, sp.name",
+            order_by="total_sales DESC",
+            limit=limit,
+        )
+
         return {
             'labels': [r['salesperson'] for r in results],
             'sales': [float(r['total_sales'] or 0) for r in results],
@@ -189,39 +290,32 @@ class IdilDashboard(models.Model):
         Critical for bakery operations!
         """
         # Returns in the last 30 days
-        date_from = fields.Date.today() - timedelta(days=30)
-        
-        returns = self.env['idil.sale.return'].search([
-            ('return_date', '>=', date_from),
-            ('state', '=', 'confirmed')
-        ])
-        
-        total_wastage_value = sum(returns.mapped('total_subtotal'))
-        total_wastage_items = self.env['idil.sale.return.line'].search_count([
-            ('return_id', 'in', returns.ids)
-        ])
-        
+        params = {'date_from': fields.Date.today() - timedelta(days=30)}
+        where = "f.date >= %(date_from)s AND f.return_count + f.return_line_count <> 0"
+
+        totals = self._sales_facts(
+            """COALESCE(SUM(f.return_value), 0) AS total_value,
+               COALESCE(SUM(f.return_line_count), 0) AS total_items""",
+            where=where,
+            params=params,
+        )[0]
+
         # Get top wasted products
-        query = """
-            SELECT 
-                p.name,
-                SUM(srl.returned_quantity) as qty,
-                SUM(srl.returned_quantity * srl.price_unit) as value
-            FROM idil_sale_return_line srl
-            JOIN idil_item p ON p.id = srl.product_id
-            JOIN idil_sale_return sr ON sr.id = srl.return_id
-            WHERE sr.state = 'confirmed'
-            AND sr.return_date >= %s
-            GROUP BY p.name
-            ORDER BY value DESC
-            LIMIT 5
-        """
-        self.env.cr.execute(query, (date_from,))
-        top_wasted = self.env.cr.dictfetchall()
-        
+        top_wasted = self._sales_facts(
+            """p.name,
+               SUM(f.qty_returned) AS qty,
+               SUM(f.return_value) AS value""",
+            joins="JOIN my_product_product p ON p.id = f.product_id",
+            where=where,
+            group_by="p.name",
+            order_by="value DESC",
+            limit=5,
+            params=params,
+        )
+
         return {
-            'total_value': total_wastage_value,
-            'total_items': total_wastage_items,
+            'total_value': float(totals['total_value']),
+            'total_items': int(totals['total_items']),
             'top_products': {
                 'labels': [r['name'] for r in top_wasted],
                 'quantities': [float(r['qty'] or 0) for r in top_wasted],
@@ -235,23 +329,15 @@ class IdilDashboard(models.Model):
         Get pre-order statistics.
         Assuming idil.customer.sale.order represents pre-orders.
         """
-        pending_preorders = self.env['idil.customer.sale.order'].search_count([
-            ('state', '=', 'draft')
-        ])
-        
-        confirmed_preorders = self.env['idil.customer.sale.order'].search_count([
-            ('state', '=', 'confirmed')
-        ])
-        
-        preorder_value = sum(
-            self.env['idil.customer.sale.order'].search([
-                ('state', '=', 'draft')
-            ]).mapped('order_total')
+        groups = self.env['idil.customer.sale.order']._read_group(
+            [('state', 'in', ['draft', 'confirmed'])],
+            ['state'],
+            ['__count', 'order_total:sum'],
         )
-        
+        by_state = {state: (count, total) for state, count, total in groups}
+
         return {
-            'pending': pending_preorders,
-            'confirmed': confirmed_preorders,
-            'total_value': preorder_value,
+            'pending': by_state.get('draft', (0, 0.0))[0],
+            'confirmed': by_state.get('confirmed', (0, 0.0))[0],
+            'total_value': by_state.get('draft', (0, 0.0))[1] or 0.0,
         }
-
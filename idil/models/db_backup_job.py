@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import json
+import time
+import zipfile
+import tempfile
+import subprocess
+import logging
+from datetime import datetime
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 5  # seconds between two progress updates
+
+# Leading bytes of formats that are already compressed; deflating them again
+# only burns CPU, so they are stored as-is in the archive.
+COMPRESSED_SIGNATURES = (
+    b"\x89PNG",  # png
+    b"\xff\xd8\xff",  # jpeg
+    b"GIF8",  # gif
+    b"RIFF",  # webp, wav, avi
+    b"PK\x03\x04",  # zip, docx, xlsx, odt
+    b"\x1f\x8b",  # gzip
+    b"BZh",  # bzip2
+    b"\xfd7zXZ",  # xz
+    b"7z\xbc\xaf",  # 7z
+    b"%PDF",  # pdf
+    b"ID3",  # mp3
+    b"wOF2",  # woff2
+)
+
+
+# Odoo stores attachments content-addressed: <sha1[:2]>/<sha1>
+CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{2})/(\1[0-9a-f]{38})$")
+
+
+def _object_fingerprint(rel_path, full_path):
+    """
+    Identity of a filestore object for the incremental manifests: the sha1
+    in its name for content-addressed files, size and mtime otherwise.
+    """
+    match = CONTENT_ADDRESSED.match(rel_path)
+    if match:
+        return match.group(2)
+    st = os.stat(full_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _is_compressed(path):
+    """True when the file starts with the signature of a compressed format."""
+    with open(path, "rb") as f:
+        head = f.read(12)
+    return head.startswith(COMPRESSED_SIGNATURES) or head[4:8] == b"ftyp"  # mp4/mov
+
+
+class BizcoreDbBackupJob(models.Model):
+    """
+    Database backup running in the background.
+
+    The job streams `pg_dump -Fc` output and the filestore into a ZIP that is
+    written straight into a multipart upload of the storage backend: there is
+    no intermediate file, the dump (already compressed) and compressed
+    attachments are stored rather than deflated, and pg_dump, the archiver
+    and the upload workers run side by side. Progress is committed every few
+    seconds so it can be followed from the job form.
+
+    Every backup also writes a manifest, stored as "<name>.manifest.json"
+    next to the archive: the list of backups of its chain and, for every
+    filestore object, its fingerprint and the backup that holds its content.
+    An incremental backup loads the manifest of the last finished backup and
+    only archives the objects that are new or changed since then; restoring
+    it pulls each object from the backup the manifest points to.
+    """
+
+    _name = "bizcore.db.backup.job"
+    _description = "Database Backup Job"
+    _order = "id desc"
+
+    name = fields.Char(string="Backup File Name", required=True, readonly=True)
+    storage_backend = fields.Selection(
+        [("oci", "OCI Object Storage"), ("local", "Local Directory")],
+        string="Storage",
+        required=True,
+        default="oci",
+        readonly=True,
+    )
+    state = fields.Selection(
+        [
+            ("queued", "Queued"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        string="Status",
+        default="queued",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    backup_type = fields.Selection(
+        [("full", "Full"), ("incremental", "Incremental")],
+        string="Type",
+        required=True,
+        default="full",
+        readonly=True,
+    )
+    parent_id = fields.Many2one(
+        "bizcore.db.backup.job", string="Based On", readonly=True, ondelete="restrict"
+    )
+    manifest_name = fields.Char(string="Manifest", readonly=True)
+    objects_total = fields.Integer(string="Filestore Objects", readonly=True)
+    progress = fields.Char(string="Progress", readonly=True)
+    archive_mb = fields.Float(string="Uploaded (MB)", digits=(16, 1), readonly=True)
+    files_done = fields.Integer(string="Files Archived", readonly=True)
+    started_at = fields.Datetime(string="Started", readonly=True)
+    finished_at = fields.Datetime(string="Finished", readonly=True)
+    error = fields.Text(string="Error", readonly=True)
+    user_id = fields.Many2one(
+        "res.users",
+        string="Requested By",
+        default=lambda self: self.env.user,
+        readonly=True,
+    )
+
+    @api.constrains("name")
+    def _check_name(self):
+        # The name becomes a file/object name in the backup storage
+        for job in self:
+            if (
+                not job.name
+                or os.path.basename(job.name) != job.name
+                or job.name in (".", "..")
+                or "\\" in job.name
+            ):
+                raise ValidationError(
+                    _("The backup file name must be a plain file name: %s") % job.name
+                )
+
+    @api.model
+    def enqueue(self, backend, name=None, backup_type="full"):
+        """Queue a streaming backup and wake the cron up to run it."""
+        job = self.create(
+            {
+                "name": name
+                or f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                "storage_backend": backend,
+                "backup_type": backup_type,
+            }
+        )
+        cron = self.env.ref("idil.ir_cron_bizcore_db_backup_job", raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return job
+
+    @api.model
+    def _cron_run_jobs(self):
+        while True:
+            self.env.cr.execute(
+                """
+                SELECT id FROM bizcore_db_backup_job
+                 WHERE state = 'queued'
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+                """
+            )
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            self.browse(row[0])._run()
+
+    def _run(self):
+        self.ensure_one()
+        self.write(
+            {
+                "state": "running",
+                "started_at": fields.Datetime.now(),
+                "progress": _("Starting"),
+            }
+        )
+        self.env.cr.commit()
+        try:
+            self._stream_backup()
+        except Exception as e:
+            _logger.exception("Backup job %s failed", self.name)
+            self.env.cr.rollback()
+            self.write(
+                {
+                    "state": "failed",
+                    "finished_at": fields.Datetime.now(),
+                    "error": str(e),
+                }
+            )
+        else:
+            self.write(
+                {
+                    "state": "done",
+                    "finished_at": fields.Datetime.now(),
+                    "progress": _("Completed"),
+                }
+            )
+        self.env.cr.commit()
+
+    def _report(self, message, upload, force=False):
+        """Commit the progress of the job, at most every PROGRESS_INTERVAL."""
+        now = time.monotonic()
+        if not force and now - getattr(upload, "reported_at", 0.0) < PROGRESS_INTERVAL:
+            return
+        upload.reported_at = now
+        self.write(
+            {
+                "progress": message,
+                "archive_mb": upload.bytes_written / (1024.0 * 1024.0),
+            }
+        )
+        self.env.cr.commit()
+
+    def _stream_backup(self):
+        Wizard = self.env["bizcore.db.backup.wizard"]
+        dbname = self.env.cr.dbname
+        filestore_dir = Wizard._get_filestore_dir(dbname)
+        if not os.path.isdir(filestore_dir):
+            raise UserError(
+                _("Filestore not found for DB '%s': %s") % (dbname, filestore_dir)
+            )
+
+        storage = Wizard._get_backup_storage(self.storage_backend)
+        parent_manifest = None
+        if self.backup_type == "incremental":
+            parent_manifest = self._load_parent_manifest(storage, dbname)
+        manifest = {
+            "version": 1,
+            "database": dbname,
+            "backups": (parent_manifest["backups"] if parent_manifest else [])
+            + [self.name],
+            "objects": {},
+        }
+
+        with storage.open_upload(self.name) as upload:
+            with zipfile.ZipFile(upload, "w", allowZip64=True) as archive:
+                self._stream_dump(archive, upload, dbname)
+                self._stream_filestore(
+                    archive, upload, filestore_dir, manifest, parent_manifest
+                )
+                archive.writestr("manifest.json", json.dumps(manifest))
+            self._report(_("Finishing upload"), upload, force=True)
+
+        manifest_name = self.name + ".manifest.json"
+        with storage.open_upload(manifest_name) as upload:
+            upload.write(json.dumps(manifest).encode())
+        self.write(
+            {
+                "manifest_name": manifest_name,
+                "objects_total": len(manifest["objects"]),
+            }
+        )
+
+    def _load_parent_manifest(self, storage, dbname):
+        """Manifest of the last finished backup, or None (then run full)."""
+        parent = self.search(
+            [
+                ("state", "=", "done"),
+                ("storage_backend", "=", self.storage_backend),
+                ("manifest_name", "!=", False),
+                ("id", "!=", self.id),
+            ],
+            limit=1,
+        )
+        manifest = None
+        if parent:
+            with storage.open_download(parent.manifest_name) as f:
+                manifest = json.load(f)
+        if not manifest or manifest.get("database") != dbname:
+            _logger.info("No previous backup of %s, %s runs as a full backup", dbname, self.name)
+            self.backup_type = "full"
+            return None
+        self.parent_id = parent
+        return manifest
+
+    def _stream_dump(self, archive, upload, dbname):
+        Wizard = self.env["bizcore.db.backup.wizard"]
+        db_host, db_port, db_user, db_password = Wizard._get_pg_config()
+        pg_dump = Wizard._get_tool("pg_dump_path", "pg_dump")
+
+        env = os.environ.copy()
+        env["PGPASSWORD"] = db_password
+        cmd = [
+            pg_dump,
+            "-Fc",
+            "-h",
+            db_host,
+            "-p",
+            str(db_port),
+            "-U",
+            db_user,
+            dbname,
+        ]
+        _logger.warning("EXECUTING pg_dump: %s", cmd)
+
+        # pg_dump -Fc output is already compressed
+        info = zipfile.ZipInfo("db.dump", date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(
+                cmd, env=env, stdout=subprocess.PIPE, stderr=stderr
+            )
+            try:
+                with archive.open(info, "w", force_zip64=True) as member:
+                    while True:
+                        chunk = proc.stdout.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        member.write(chunk)
+                        self._report(_("Dumping database"), upload)
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+            if returncode:
+                stderr.seek(0)
+                raise UserError(
+                    _("Database dump failed: %s")
+                    % stderr.read().decode(errors="replace")
+                )
+
+    def _stream_filestore(self, archive, upload, filestore_dir, manifest, parent_manifest):
+        filestore_root = os.path.join(config["data_dir"], "filestore")
+        parent_objects = parent_manifest["objects"] if parent_manifest else {}
+        this_backup = len(manifest["backups"]) - 1
+        files_done = 0
+        for root, dirs, files in os.walk(filestore_dir):
+            dirs.sort()
+            for f in sorted(files):
+                full_path = os.path.join(root, f)
+                rel = os.path.relpath(full_path, filestore_dir).replace(os.sep, "/")
+                fingerprint = _object_fingerprint(rel, full_path)
+                previous = parent_objects.get(rel)
+                if previous and previous[0] == fingerprint:
+                    # Unchanged since the previous backup: keep pointing at it
+                    manifest["objects"][rel] = previous
+                    continue
+                archive.write(
+                    full_path,
+                    arcname=os.path.join(
+                        "filestore", os.path.relpath(full_path, filestore_root)
+                    ),
+                    compress_type=(
+                        zipfile.ZIP_STORED
+                        if _is_compressed(full_path)
+                        else zipfile.ZIP_DEFLATED
+                    ),
+                )
+                manifest["objects"][rel] = [fingerprint, this_backup]
+                files_done += 1
+                if files_done % 100 == 0:
+                    self.files_done = files_done
+                    self._report(_("Archiving filestore"), upload)
+        self.files_done = files_done
+
+    def action_download(self):
+        self.ensure_one()
+        if self.state != "done":
+            raise UserError(_("This backup is not finished yet."))
+        Wizard = self.env["bizcore.db.backup.wizard"]
+        if self.storage_backend == "local":
+            storage = Wizard._get_backup_storage("local")
+            raise UserError(
+                _("This backup is stored on the server at: %s")
+                % storage.path(self.name)
+            )
+        return {
+            "type": "ir.actions.act_url",
+            "url": Wizard._generate_oci_download_url(self.name),
+            "target": "new",
+        }
@@ -0,0 +1,58 @@
+# Indexes backing the hot ledger and stock queries, created by the init() of
+# the model owning the table: {table: [(name, columns, where)]}.
+# scripts/index_benchmark.py times the main report queries with and without
+# them.
+HOT_INDEXES = {
+    "idil_transaction_bookingline": [
+        # balances, statements, budgets: account (+ company) over a date range
+        (
+            "idil_tbl_account_company_date_idx",
+            "(account_number, company_id, transaction_date)",
+            "",
+        ),
+        # company-wide reports over a date range (P&L, trial balance, summaries)
+        ("idil_tbl_company_date_idx", "(company_id, transaction_date)", ""),
+        # product cost: product value on its asset account
+        (
+            "idil_tbl_product_account_idx",
+            "(product_id, account_number)",
+            "WHERE product_id IS NOT NULL",
+        ),
+        (
+            "idil_tbl_item_account_idx",
+            "(item_id, account_number)",
+            "WHERE item_id IS NOT NULL",
+        ),
+        # lines of a booking (one2many reads, cascade deletes)
+        ("idil_tbl_booking_idx", "(transaction_booking_id)", ""),
+        # bank reconciliation only looks at the open lines of an account
+        (
+            "idil_tbl_unreconciled_idx",
+            "(account_number, company_id)",
+            "WHERE is_reconciled IS NOT TRUE",
+        ),
+    ],
+    "idil_item_movement": [
+        ("idil_item_movement_item_date_idx", "(item_id, date)", ""),
+        (
+            "idil_item_movement_source_idx",
+            "(item_id, source_warehouse_id, source_location_id, date)",
+            "WHERE source_location_id IS NOT NULL",
+        ),
+        (
+            "idil_item_movement_destination_idx",
+            "(item_id, destination_warehouse_id, destination_location_id, date)",
+            "WHERE destination_location_id IS NOT NULL",
+        ),
+    ],
+    "idil_product_movement": [
+        ("idil_product_movement_product_date_idx", "(product_id, date)", ""),
+    ],
+}
+
+
+def ensure_indexes(cr, table):
+    """Create the HOT_INDEXES of table that do not exist yet."""
+    for name, columns, where in HOT_INDEXES.get(table, []):
+        cr.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {columns} {where}")
+
@@ -206,9 +206,9 @@ class InternalTransfer(models.Model):
     # -------------------------
     def _create_internal_movements(self):
         """
-        Current logic uses GLOBAL item.quantity (not per location).
-        This means it reduces stock globally and ONLY logs destination.
-        If you want true warehouse stock, later we will implement location stock model.
+        Stock is checked at the source location on the transfer date, and the
+        movements record both locations so the location stock follows the
+        transfer. The global item.quantity is still updated as before.
         """
         self.ensure_one()
 
@@ -223,6 +223,17 @@ class InternalTransfer(models.Model):
 
         ref = f"IT/{self.name}"
 
+        # Re-read the source stock under lock; lines moving the same item
+        # draw on the same stock
+        key = (
+            self.source_warehouse_id.id,
+            self.source_location_id.id,
+            self.transfer_date,
+        )
+        availability = self.env["idil.item"].get_stock_availability(
+            self.line_ids.item_id.ids, [key], lock=True
+        )
+        requested = {}
         for l in self.line_ids:
             if not l.item_id or l.qty <= 0:
                 continue
@@ -230,10 +241,11 @@ class InternalTransfer(models.Model):
             item = l.item_id
             qty = l.qty
 
-            if (item.quantity or 0.0) < qty:
+            requested[item.id] = requested.get(item.id, 0.0) + qty
+            if availability[(item.id, key)] < requested[item.id]:
                 raise ValidationError(
                     _("Insufficient stock for '%s'. Available: %s, Requested: %s")
-                    % (item.name, item.quantity, qty)
+                    % (item.name, availability[(item.id, key)], requested[item.id])
                 )
 
             # Update GLOBAL stock (your current approach)
@@ -252,6 +264,10 @@ class InternalTransfer(models.Model):
                     "source": self.source_location_id.id,
                     "destination": self.destination_location_id.id,
                     "movement_type": "internal",
+                    "source_warehouse_id": self.source_warehouse_id.id,
+                    "source_location_id": self.source_location_id.id,
+                    "destination_warehouse_id": self.destination_warehouse_id.id,
+                    "destination_location_id": self.destination_location_id.id,
                     "related_document": f"idil.internal.transfer,{self.id}",
                     "reference": ref,  # if you have this field
                 }
@@ -339,10 +355,27 @@ class InternalTransferLine(models.Model):
         store=False,
     )
 
-    @api.depends("item_id")
+    @api.depends(
+        "item_id",
+        "transfer_id.source_warehouse_id",
+        "transfer_id.source_location_id",
+        "transfer_id.transfer_date",
+    )
     def _compute_available_qty(self):
+        # Stock at the source location on the transfer date, one query for all lines
+        keys = {
+            l: (
+                l.transfer_id.source_warehouse_id.id,
+                l.transfer_id.source_location_id.id,
+                l.transfer_id.transfer_date,
+            )
+            for l in self
+        }
+        availability = self.env["idil.item"].get_stock_availability(
+            self.item_id.ids, keys.values()
+        )
         for l in self:
-            l.available_qty = float(l.item_id.quantity or 0.0) if l.item_id else 0.0
+            l.available_qty = availability[(l.item_id.id, keys[l])] if l.item_id else 0.0
 
     @api.depends("available_qty", "qty")
     def _compute_stock_ok(self):
@@ -1,11 +1,14 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
 from datetime import datetime
+from collections import defaultdict
 
 import logging
 
 from odoo.tools import float_compare
 
+from .db_indexes import ensure_indexes
+
 _logger = logging.getLogger(__name__)
 
 
@@ -152,14 +155,11 @@ class item(models.Model):
 
     @api.depends("movement_ids.quantity", "movement_ids.movement_type")
     def _compute_stock_quantity(self):
+        # Internal transfers net out over the places, so the sum of the
+        # quants is IN + OUT of the whole history
+        totals = self.env["idil.stock.quant"].get_totals("item_id", self._origin.ids)
         for product in self:
-            qty_in = sum(
-                m.quantity for m in product.movement_ids if m.movement_type == "in"
-            )
-            qty_out = sum(
-                m.quantity for m in product.movement_ids if m.movement_type == "out"
-            )
-            product.quantity = round(qty_in + qty_out, 5)
+            product.quantity = round(totals.get(product._origin.id) or 0.0, 5)
 
     # Add a method to update currency_id for existing records
     def update_currency_id(self):
@@ -355,72 +355,94 @@ class item(models.Model):
                     body=f"Item {record.name} needs reordering. Current stock: {record.quantity}"
                 )
 
+    def action_verify_stock(self):
+        """Check the stock quants of these items against their movements."""
+        return self.env["idil.stock.quant"].action_verify(item_ids=self.ids or None)
+
+    def action_rebuild_stock(self):
+        """Recompute the stock quants of these items from their movements."""
+        return self.env["idil.stock.quant"].action_rebuild(item_ids=self.ids or None)
+
     def get_qty_in_location(self, warehouse_id, location_id, as_of_date=None):
         self.ensure_one()
         if not warehouse_id or not location_id:
             return 0.0
-
-        params = [self.id, warehouse_id, location_id, warehouse_id, location_id]
-
-        date_sql = ""
-        if as_of_date:
-            date_sql = " AND date <= %s "
-            params.append(as_of_date)
-
-        # ✅ Count stock in this location from BOTH sides, depending on how records are stored
+        key = (warehouse_id, location_id, as_of_date)
+        return self.get_stock_availability(self.ids, [key])[(self.id, key)]
+
+    @api.model
+    def get_stock_availability(self, item_ids, locations, lock=False):
+        """
+        Stock of several items at several places in one grouped query.
+
+        locations is an iterable of (warehouse_id, location_id, as_of_date)
+        keys, as_of_date being None for the current stock. Returns a
+        defaultdict(float) {(item_id, key): quantity}, rounded to 5 digits.
+
+        The current stock is read from idil.stock.quant; for a past date the
+        movements dated after it are taken off. With lock=True the quants
+        are locked first, so the caller can consume the stock it checked.
+        """
+        result = defaultdict(float)
+        # The same place and day may be passed as str or date
+        normalized = {
+            key: (key[0], key[1], fields.Date.to_date(key[2]) if key[2] else None)
+            for key in locations
+            if key[0] and key[1]
+        }
+        keys = list(set(normalized.values()))
+        item_ids = list(set(item_ids))
+        if not keys or not item_ids:
+            return result
+
+        Quant = self.env["idil.stock.quant"]
+        Quant._flush_sources()
+        if lock:
+            Quant.lock_item_quants(item_ids, [key[:2] for key in keys])
         self.env.cr.execute(
-            f"""
-            SELECT COALESCE(SUM(
-                CASE
-                    -- IN: sometimes saved in destination, sometimes in source
-                    WHEN movement_type = 'in'
-                        AND (
-                            (destination_warehouse_id = %s AND destination_location_id = %s)
-                            OR
-                            (destination_warehouse_id IS NULL AND destination_location_id IS NULL
-                            AND source_warehouse_id = %s AND source_location_id = %s)
-                        )
-                    THEN quantity
-
-                    -- OUT: normally saved on source (quantity is negative in your design)
-                    WHEN movement_type = 'out'
-                        AND source_warehouse_id = %s AND source_location_id = %s
-                    THEN quantity
-
-                    -- INTERNAL: remove from source, add to destination (supports both sign styles)
-                    WHEN movement_type = 'internal'
-                        AND source_warehouse_id = %s AND source_location_id = %s
-                    THEN -ABS(quantity)
-
-                    WHEN movement_type = 'internal'
-                        AND destination_warehouse_id = %s AND destination_location_id = %s
-                    THEN ABS(quantity)
-
-                    ELSE 0
-                END
-            ), 0)
-            FROM idil_item_movement
-            WHERE item_id = %s
-            {date_sql}
+            """
+            WITH wanted AS (
+                SELECT * FROM unnest(%(warehouses)s::int[], %(locations)s::int[],
+                                     %(dates)s::date[])
+                           AS w(warehouse_id, location_id, as_of_date)
+            )
+            SELECT q.item_id, w.warehouse_id, w.location_id, w.as_of_date,
+                   q.quantity - COALESCE(later.quantity, 0)
+              FROM wanted w
+              JOIN idil_stock_quant q
+                ON q.warehouse_id = w.warehouse_id
+               AND q.location_id = w.location_id
+               AND q.item_id = ANY(%(item_ids)s)
+              LEFT JOIN LATERAL (
+                SELECT SUM(pl.quantity) AS quantity
+                  FROM idil_item_movement m
+                 CROSS JOIN LATERAL idil_stock_move_places(
+                       m.movement_type, m.source_warehouse_id, m.source_location_id,
+                       m.destination_warehouse_id, m.destination_location_id,
+                       m.quantity) pl
+                 WHERE w.as_of_date IS NOT NULL
+                   AND m.item_id = q.item_id
+                   AND m.date > w.as_of_date
+                   AND pl.warehouse_id = w.warehouse_id
+                   AND pl.location_id = w.location_id
+              ) later ON TRUE
             """,
-            (
-                warehouse_id,
-                location_id,
-                warehouse_id,
-                location_id,
-                warehouse_id,
-                location_id,
-                warehouse_id,
-                location_id,
-                warehouse_id,
-                location_id,
-                self.id,
-                *([as_of_date] if as_of_date else []),
-            ),
+            {
+                "warehouses": [key[0] for key in keys],
+                "locations": [key[1] for key in keys],
+                "dates": [key[2] for key in keys],
+                "item_ids": item_ids,
+            },
         )
-        (bal,) = self.env.cr.fetchone()
-
-        return round(bal or 0.0, 5)
+        quantities = {
+            (item_id, (warehouse_id, location_id, as_of_date)): round(qty or 0.0, 5)
+            for item_id, warehouse_id, location_id, as_of_date, qty in self.env.cr.fetchall()
+        }
+        for key, place in normalized.items():
+            for item_id in item_ids:
+                if (item_id, place) in quantities:
+                    result[(item_id, key)] = quantities[(item_id, place)]
+        return result
 
 
 class ItemMovement(models.Model):
@@ -541,6 +563,9 @@ class ItemMovement(models.Model):
         tracking=True,
     )
 
+    def init(self):
+        ensure_indexes(self.env.cr, self._table)
+
     @api.constrains(
         "movement_type",
         "source_warehouse_id",
@@ -505,7 +505,7 @@ class MaterialRequestLine(models.Model):
 
     expiration_date = fields.Date(string="Expiration Date")
 
-    # Availability display (based on your idil.item.quantity global stock)
+    # Availability display (stock at the request warehouse/location)
     available_qty = fields.Float(
         string="Available Qty", compute="_compute_available_qty", store=False
     )
@@ -524,40 +524,20 @@ class MaterialRequestLine(models.Model):
         for l in self:
             l.suggested_cost_total = l.suggested_cost_price * l.requested_qty
 
-    @api.depends("item_id")  # You can add request fields if you want refresh on change
+    @api.depends(
+        "item_id", "request_id.warehouse_id", "request_id.location_id"
+    )
     def _compute_available_qty(self):
-        Move = self.env["idil.item.movement"].sudo()
+        # Stock at the request's warehouse/location, all lines in one query
+        keys = {
+            l: (l.request_id.warehouse_id.id, l.request_id.location_id.id, None)
+            for l in self
+        }
+        availability = self.env["idil.item"].get_stock_availability(
+            self.item_id.ids, keys.values()
+        )
         for l in self:
-            l.available_qty = 0.0
-            if not l.item_id:
-                continue
-
-            # Sum ONLY done movements
-            domain_base = [
-                ("item_id", "=", l.item_id.id),
-                ("state", "=", "done"),
-            ]
-
-            total_in = (
-                sum(
-                    Move.search(domain_base + [("movement_type", "=", "in")]).mapped(
-                        "quantity"
-                    )
-                )
-                or 0.0
-            )
-
-            total_out = (
-                sum(
-                    Move.search(domain_base + [("movement_type", "=", "out")]).mapped(
-                        "quantity"
-                    )
-                )
-                or 0.0
-            )
-
-            # Available = In - Out
-            l.available_qty = float(total_in) + float(total_out)
+            l.available_qty = availability[(l.item_id.id, keys[l])] if l.item_id else 0.0
 
     @api.depends("available_qty")
     def _compute_stock_indicator(self):
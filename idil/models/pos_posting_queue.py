@@ -0,0 +1,191 @@
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+
+class PosPostingQueue(models.Model):
+    """
+    Paid POS orders waiting to be booked in the idil ledger.
+
+    Paying an order only adds a row here; the cron drains the queue in
+    batches, creating the bookings and their lines with list create() calls.
+    There is one row per order, and orders that already have a booking are
+    marked done without posting twice. Failed orders are retried with a
+    growing delay until MAX_ATTEMPTS, then left in 'failed' for review.
+    """
+
+    _name = "idil.pos.posting.queue"
+    _description = "POS Order Posting Queue"
+    _order = "id"
+
+    order_id = fields.Many2one(
+        "pos.order", string="POS Order", required=True, readonly=True, ondelete="cascade"
+    )
+    company_id = fields.Many2one(
+        related="order_id.company_id", string="Company", store=True, readonly=True
+    )
+    state = fields.Selection(
+        [("pending", "Pending"), ("done", "Posted"), ("failed", "Failed")],
+        string="Status",
+        default="pending",
+        required=True,
+        readonly=True,
+        index=True,
+    )
+    attempts = fields.Integer(string="Attempts", readonly=True)
+    next_attempt = fields.Datetime(
+        string="Next Attempt", default=fields.Datetime.now, readonly=True, index=True
+    )
+    last_error = fields.Text(string="Last Error", readonly=True)
+    transaction_booking_id = fields.Many2one(
+        "idil.transaction_booking", string="Transaction Booking", readonly=True
+    )
+
+    _sql_constraints = [
+        (
+            "uniq_order",
+            "unique(order_id)",
+            "A POS order can only be queued for posting once.",
+        ),
+    ]
+
+    @api.model
+    def enqueue(self, orders):
+        """Queue orders for posting; orders already queued are left alone."""
+        if not orders:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO idil_pos_posting_queue
+                (order_id, company_id, state, attempts, next_attempt,
+                 create_uid, write_uid, create_date, write_date)
+            SELECT o.id, o.company_id, 'pending', 0, now() AT TIME ZONE 'UTC',
+                   %s, %s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM pos_order o
+             WHERE o.id IN %s
+            ON CONFLICT (order_id) DO NOTHING
+            """,
+            (self.env.uid, self.env.uid, tuple(orders.ids)),
+        )
+        cron = self.env.ref("idil.ir_cron_pos_posting_queue", raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def action_retry(self):
+        self.write(
+            {"state": "pending", "attempts": 0, "next_attempt": fields.Datetime.now()}
+        )
+
+    @api.model
+    def _cron_process_queue(self, batch_size=200):
+        """Post the due entries, batch_size orders at a time."""
+        while True:
+            # SKIP LOCKED lets several workers drain the queue side by side
+            self.env.cr.execute(
+                """
+                SELECT id FROM idil_pos_posting_queue
+                 WHERE state = 'pending' AND next_attempt <= now() AT TIME ZONE 'UTC'
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+                """,
+                (batch_size,),
+            )
+            entries = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not entries:
+                break
+            entries._process()
+            self.env.cr.commit()
+            if len(entries) < batch_size:
+                break
+
+    def _process(self):
+        """Post self in one go; on failure, isolate the orders that break."""
+        try:
+            trx_source_id = self.env["pos.order"].get_manual_transaction_source_id()
+        except ValidationError as e:
+            for entry in self:
+                entry._register_failure(e)
+            return
+        pending = self._skip_already_posted()
+        if not pending:
+            return
+        try:
+            with self.env.cr.savepoint():
+                pending._post(trx_source_id)
+        except Exception:
+            for entry in pending:
+                try:
+                    with self.env.cr.savepoint():
+                        entry._post(trx_source_id)
+                except Exception as e:
+                    entry._register_failure(e)
+
+    def _skip_already_posted(self):
+        """Mark entries done whose order already has a booking (idempotency)."""
+        bookings = self.env["idil.transaction_booking"].search(
+            [("order_number", "in", self.order_id.mapped("name"))]
+        )
+        by_order = {booking.order_number: booking for booking in bookings}
+        pending = self.browse()
+        for entry in self:
+            booking = by_order.get(entry.order_id.name)
+            if booking:
+                entry.write(
+                    {"state": "done", "transaction_booking_id": booking.id, "last_error": False}
+                )
+            else:
+                pending |= entry
+        return pending
+
+    def _post(self, trx_source_id):
+        # The cron runs as its own user: post each order in its company, so
+        # the bookings, their lines and the budget checks use that company.
+        for company in self.company_id:
+            entries = self.filtered(lambda e: e.company_id == company)
+            entries.with_company(company)._post_company(trx_source_id)
+
+    def _post_company(self, trx_source_id):
+        orders = self.order_id
+        bookings = (
+            self.env["idil.transaction_booking"]
+            .with_context(skip_validations=True)
+            .create([order._prepare_transaction_booking_vals(trx_source_id) for order in orders])
+        )
+        line_vals = []
+        for order, booking in zip(orders, bookings):
+            line_vals += order._prepare_transaction_booking_line_vals(booking)
+        self.env["idil.transaction_bookingline"].create(line_vals)
+
+        for entry, booking in zip(self, bookings):
+            entry.write(
+                {"state": "done", "transaction_booking_id": booking.id, "last_error": False}
+            )
+        _logger.info(
+            "Posted %s POS order(s) of %s to the ledger.", len(orders), self.env.company.name
+        )
+
+    def _register_failure(self, error):
+        self.ensure_one()
+        attempts = self.attempts + 1
+        _logger.error(
+            "Error posting POS order %s (attempt %s): %s",
+            self.order_id.name,
+            attempts,
+            error,
+        )
+        self.write(
+            {
+                "attempts": attempts,
+                "state": "failed" if attempts >= MAX_ATTEMPTS else "pending",
+                # Back off 1, 4, 9, 16 minutes between retries
+                "next_attempt": fields.Datetime.now() + timedelta(minutes=attempts ** 2),
+                "last_error": str(error),
+            }
+        )
@@ -1,5 +1,7 @@
 from odoo import api, models, fields
 
+from .db_indexes import ensure_indexes
+
 
 class ProductMovement(models.Model):
     _name = "idil.product.movement"
@@ -106,3 +108,6 @@ class ProductMovement(models.Model):
         tracking=True,
         domain="[('warehouse_id', '=', destination_warehouse_id), ('active', '=', True)]",
     )
+
+    def init(self):
+        ensure_indexes(self.env.cr, self._table)
@@ -244,14 +244,18 @@ class Product(models.Model):
 
     @api.depends("movement_ids.quantity", "movement_ids.movement_type")
     def _compute_stock_quantity(self):
+        # IN + OUT of the whole history, read from the stock quants
+        totals = self.env["idil.stock.quant"].get_totals("product_id", self._origin.ids)
         for product in self:
-            qty_in = sum(
-                m.quantity for m in product.movement_ids if m.movement_type == "in"
-            )
-            qty_out = sum(
-                m.quantity for m in product.movement_ids if m.movement_type == "out"
-            )
-            product.stock_quantity = round(qty_in + qty_out, 2)
+            product.stock_quantity = round(totals.get(product._origin.id) or 0.0, 2)
+
+    def action_verify_stock(self):
+        """Check the stock quants of these products against their movements."""
+        return self.env["idil.stock.quant"].action_verify(product_ids=self.ids or None)
+
+    def action_rebuild_stock(self):
+        """Recompute the stock quants of these products from their movements."""
+        return self.env["idil.stock.quant"].action_rebuild(product_ids=self.ids or None)
 
     @api.depends("stock_quantity", "asset_account_id")
     def _compute_actual_cost_from_transaction(self):
@@ -358,19 +362,18 @@ class Product(models.Model):
 
     @api.depends("rate_currency_id")
     def _compute_exchange_rate(self):
+        RateService = self.env["idil.currency.rate.service"]
         for rec in self:
             if rec.rate_currency_id:
                 # Find the latest available rate up to today
-                rate = self.env["res.currency.rate"].search(
-                    [
-                        ("currency_id", "=", rec.rate_currency_id.id),
-                        ("name", "<=", fields.Date.today()),
-                        ("company_id", "=", self.env.company.id),
-                    ],
-                    order="name desc",
-                    limit=1,
+                rec.rate = (
+                    RateService.get_rate(
+                        rec.rate_currency_id.id,
+                        fields.Date.today(),
+                        self.env.company.id,
+                    )
+                    or 0.0
                 )
-                rec.rate = rate.rate if rate else 0.0
             else:
                 rec.rate = 0.0
 
@@ -1,10 +1,15 @@
 import logging
+import time
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 from dateutil.relativedelta import relativedelta
 
 _logger = logging.getLogger(__name__)
 
+DISPATCH_BATCH = 500  # templates handled per dispatcher run
+CATCHUP_LIMIT = 20  # missed runs generated per template and dispatcher run
+
+
 class RecurringJournalEntry(models.Model):
     _name = "idil.recurring.journal.entry"
     _description = "Advanced Recurring Journal Entry"
@@ -54,8 +59,6 @@ class RecurringJournalEntry(models.Model):
 
     run_count = fields.Integer(string="Total Runs", default=0, readonly=True, help="Number of times this entry has been successfully generated.")
     
-    cron_id = fields.Many2one('ir.cron', string="Scheduled Action", ondelete='set null', copy=False)
-
     # Timer field
     remaining_time = fields.Char(string="Next Run In", compute='_compute_remaining_time')
 
@@ -91,132 +94,51 @@ class RecurringJournalEntry(models.Model):
             vals['name'] = self.env['ir.sequence'].next_by_code('idil.recurring.journal') or _('New')
         return super(RecurringJournalEntry, self).create(vals)
 
-    def write(self, vals):
-        res = super(RecurringJournalEntry, self).write(vals)
-        # Synchronize cron job if relevant fields changed
-        # CRITICAL: We skip this if skip_cron_update is in context to avoid "Record cannot be modified" (locking) 
-        # when this is called from within the cron job itself.
-        if any(field in vals for field in ['next_run_time', 'state', 'interval_number', 'interval_type', 'active']):
-            if not self._context.get('skip_cron_update'):
-                self._sync_cron()
-        return res
-
-    def unlink(self):
-        # Delete associated cron jobs before deleting records
-        for rec in self:
-            if rec.cron_id:
-                rec.cron_id.unlink()
-        return super(RecurringJournalEntry, self).unlink()
-
-    def _sync_cron(self):
-        """Creates, updates or deletes a dedicated ir.cron for this record."""
-        for rec in self:
-            if rec.state == 'running':
-                # Map our interval types to ir.cron interval types
-                # Odoo ir.cron uses: minutes, hours, days, weeks, months
-                # Our selection: hours, days, weeks, months, years
-                interval_type = rec.interval_type
-                if interval_type == 'years':
-                    # Odoo doesn't have 'years' in ir.cron interval_type, we use months=12 * interval
-                    interval_type = 'months'
-                    interval_number = rec.interval_number * 12
-                else:
-                    interval_number = rec.interval_number
-
-                vals = {
-                    'name': _('Recurring JV: %s') % rec.name,
-                    'model_id': self.env['ir.model']._get_id(self._name),
-                    'state': 'code',
-                    'code': f'log("Starting Auto-Execution for {rec.name}"); model.browse({rec.id})._generate_entry_from_cron()',
-                    'interval_number': interval_number,
-                    'interval_type': interval_type,
-                    'numbercall': -1,
-                    # Ensure nextcall is written as a string format Odoo expects
-                    'nextcall': fields.Datetime.to_string(rec.next_run_time),
-                    'active': True,
-                    'user_id': self.env.ref('base.user_root').id,
-                }
-                
-                if rec.cron_id:
-                    try:
-                        # Use call_kw style or sudo() to ensure writing to ir.cron
-                        rec.cron_id.sudo().write(vals)
-                    except Exception as e:
-                        _logger.debug("Could not update cron [ID: %s] - it might be currently running: %s", rec.cron_id.id, str(e))
-                else:
-                    cron = self.env['ir.cron'].sudo().create(vals)
-                    rec.with_context(skip_cron_update=True).write({'cron_id': cron.id})
-            else:
-                # If stopped, draft or done, we deactivate the cron
-                if rec.cron_id:
-                    try:
-                        rec.cron_id.sudo().write({'active': False})
-                    except Exception as e:
-                        _logger.info("Could not deactivate cron [ID: %s]: %s", rec.cron_id.id, str(e))
-
-    def action_view_cron(self):
-        self.ensure_one()
-        if not self.cron_id:
-             self._sync_cron()
-             
-        return {
-            'type': 'ir.actions.act_window',
-            'res_model': 'ir.cron',
-            'res_id': self.cron_id.id,
-            'view_mode': 'form',
-            'target': 'current',
-        }
-
-    def _generate_entry_from_cron(self):
-        """Method called by the dedicated Cron Job"""
-        self = self.sudo()
-        self.ensure_one()
-        _logger.info("CRON RUNNER: Executing catch-up for recurring entry %s", self.name)
-        return self.action_process_overdue()
-
-    def action_process_overdue(self):
-        """Processes missed intervals to catch up to the current time."""
-        self.ensure_one()
-        if self.state != 'running':
-            return
-            
-        now = fields.Datetime.now()
-        count = 0
-        limit = 20 # Safety limit to prevent timeouts
-        
-        while self.state == 'running' and self.next_run_time <= now and count < limit:
-            _logger.info("Catch-up: Processing Run #%s for %s", self.run_count + 1, self.name)
-            # Try to generate. We ONLY want to increment count and allow the loop 
-            # to continue if it SUCCEEDED. If it fails (funds, etc), we STOP 
-            # so it retries the same time/run next minute.
-            success = self.with_context(skip_cron_update=True)._generate_entry()
-            if not success:
-                 _logger.info("Catch-up: Stop/Retry later for %s (Likely funds or validation)", self.name)
-                 break
-                 
-            count += 1
-            # Refresh 'now' to be precise
-            now = fields.Datetime.now()
-            
-        if count >= limit:
-            _logger.warning("Catch-up limit reached (20) for %s. More pending entries exist.", self.name)
-        
-        return True
+    def init(self):
+        cr = self.env.cr
+        # the dispatcher only ever looks at running templates that are due
+        cr.execute("""
+            CREATE INDEX IF NOT EXISTS idil_recurring_journal_entry_due_idx
+                ON idil_recurring_journal_entry (next_run_time)
+             WHERE state = 'running'
+        """)
+        # Templates used to get a dedicated scheduled action each; the
+        # dispatcher runs all of them now.
+        self.env['ir.cron'].sudo().with_context(active_test=False).search([
+            ('model_id.model', '=', self._name),
+            ('code', 'like', '_generate_entry_from_cron'),
+        ]).unlink()
 
     @api.model
     def _cron_check_pending_dues(self):
-        """Global check for any running entries that are overdue."""
-        now = fields.Datetime.now()
-        overdue_entries = self.sudo().search([
-            ('state', '=', 'running'),
-            ('next_run_time', '<=', now)
-        ])
-        _logger.info("Global Check: Found %s overdue recurring entries.", len(overdue_entries))
-        for entry in overdue_entries:
-            try:
-                entry.action_process_overdue()
-            except Exception as e:
-                _logger.error("Global Check failed for %s: %s", entry.name, str(e))
+        """
+        Dispatcher: generate the runs of every running template that is due.
+
+        Due templates are picked with one query on the partial index (rows
+        locked by a manual run or another worker are skipped), and the run
+        is recorded with its duration in the execution logs.
+        """
+        started = time.monotonic()
+        self.env.cr.execute("""
+            SELECT id FROM idil_recurring_journal_entry
+             WHERE state = 'running' AND next_run_time <= %s
+             ORDER BY next_run_time, id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (fields.Datetime.now(), DISPATCH_BATCH))
+        templates = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+        if not templates:
+            return
+        posted, failed = templates._process_runs(fields.Datetime.now())
+        duration = time.monotonic() - started
+        self.env['idil.recurring.journal.log'].sudo().create({
+            'status': 'failed' if failed else 'success',
+            'duration': duration,
+            'message': _("Dispatcher: %s template(s) due, %s entry(ies) posted, %s failure(s).")
+                       % (len(templates), posted, failed),
+        })
+        _logger.info("Recurring dispatcher: %s template(s), %s posted, %s failed in %.2fs",
+                     len(templates), posted, failed, duration)
 
     @api.depends('generated_entry_ids')
     def _compute_generated_count(self):
@@ -233,17 +155,13 @@ class RecurringJournalEntry(models.Model):
         self.state = 'running'
         # Trigger immediate generation if overdue
         if self.next_run_time and self.next_run_time <= fields.Datetime.now():
-            self._generate_entry()
-        
-        self._sync_cron()
+            self._process_runs(fields.Datetime.now())
 
     def action_stop(self):
         self.write({'state': 'stopped'})
-        self._sync_cron()
 
     def action_draft(self):
         self.write({'state': 'draft'})
-        self._sync_cron()
 
     def action_view_generated_entries(self):
         self.ensure_one()
@@ -285,35 +203,32 @@ class RecurringJournalEntry(models.Model):
         return current_time
 
     def action_generate_entry_manual(self):
-        self._generate_entry(manual=True)
+        self._process_runs(manual=True)
 
-    def _log_execution(self, status, message, entry_id=False):
-        self.env['idil.recurring.journal.log'].create({
-            'recurring_id': self.id,
-            'status': status,
-            'journal_entry_id': entry_id,
-            'message': message,
-        })
+    def _log_vals(self, status, message, entry_id=False):
         if status == 'failed':
             _logger.warning("Recurring Entry [%s] Failed: %s", self.name, message)
         else:
             _logger.info("Recurring Entry [%s] Success: %s", self.name, message)
+        return {
+            'recurring_id': self.id,
+            'status': status,
+            'journal_entry_id': entry_id,
+            'message': message,
+        }
+
+    def _check_funds_availability(self, balances):
+        """
+        Check if accounts have enough balance based on template lines.
 
-    def _check_funds_availability(self):
-        """Check if accounts have enough balance based on template lines."""
+        balances is {account_id: balance} for the accounts of the lines, as
+        returned by idil.account.balance.get_balances().
+        """
         for line in self.line_ids:
             account = line.account_id
             if not account:
                 continue
-                
-            # Calculate current balance in the same way as journal_entry.py
-            # Using sudo() to ensure visibility of all bookings
-            account_balance = self.env["idil.transaction_bookingline"].sudo().search(
-                [("account_number", "=", account.id)]
-            )
-            debit_total = sum(b_line.dr_amount for b_line in account_balance)
-            credit_total = sum(b_line.cr_amount for b_line in account_balance)
-            current_balance = debit_total - credit_total
+            current_balance = balances.get(account.id, 0.0)
 
             if account.sign == "Dr":
                 if line.credit > 0 and current_balance < line.credit:
@@ -327,134 +242,147 @@ class RecurringJournalEntry(models.Model):
                     return False, msg
         return True, ""
 
-    def _generate_entry(self, manual=False):
+    def _plan_runs(self, until, manual, balances, existing, logs):
         """
-        Creates or Retries the Journal Entry.
+        Runs of this template to process now, in order, as a list of
+        [run_number, run_time, entry] where entry is an existing journal
+        entry (a draft to post again, or a run already posted that only
+        moves the schedule) or the vals of the entry to create. The second
+        value tells whether the template reaches its end date after them.
+
+        balances are moved by every run that still has to be posted, so the
+        funds check of the next one, of this template or another, sees it.
         """
         self.ensure_one()
-        _logger.info("Starting recurring generation for %s (Manual: %s)", self.name, manual)
-        
-        # Determine Accounting Date (Date only)
-        run_datetime = self.next_run_time or fields.Datetime.now()
-        accounting_date = run_datetime.date()
-        
-        # Check end date
-        if self.end_date and accounting_date > self.end_date:
-            self.state = 'done'
-            _logger.info("Ending recurring cycle for %s (End Date reached)", self.name)
-            return False
-
-        # 0. Check minimum lines (at least 2)
-        if len(self.line_ids) < 2:
-            msg = _("Recurring entry must have at least two journal lines.")
-            self._log_execution('failed', msg)
-            if manual:
-                raise UserError(msg)
-            return False
-
-        # 1. Check for duplicates using the target Run Number
-        next_run_number = self.run_count + 1
-        target_entry = False
-        
-        existing_entry = self.env['idil.journal.entry'].search([
-            ('recurring_source_id', '=', self.id),
-            ('recurring_run_number', '=', next_run_number),
-            ('state', '!=', 'cancel')
-        ], limit=1)
-
-        if existing_entry:
-            if existing_entry.state == 'draft':
-                # If there's a draft, we try to process it instead of creating a new one
-                _logger.info("Found existing draft for Run #%s, retrying confirmation.", next_run_number)
-                target_entry = existing_entry
-            else:
-                # Already posted/confirmed. We MUST advance the schedule and Run Count to avoid getting stuck.
-                _logger.info("Run #%s already posted for %s, synchronizing schedule and run_count.", next_run_number, self.name)
-                self.with_context(skip_cron_update=True).write({
-                    'next_run_time': self._get_next_time(self.next_run_time),
-                    'run_count': next_run_number
-                })
-                return True
-        # We don't reuse draft entries anymore to keep it simple and avoid "already exists" confusion;
-        # if a fresh run is needed, we create a fresh entry.
-
-        # 2. Check funds availability BEFORE creating a new entry if none exists
-        if not target_entry:
-            funds_ok, msg = self._check_funds_availability()
-            if not funds_ok:
-                # Log failure and stop (don't create journal entry as requested)
-                # DO NOT advance next_run_time here so it retries next minute
-                self._log_execution('failed', msg)
-                self.message_post(body=_("Automatic generation failed: %s. Will retry when funds are available.") % msg)
-                if manual:
-                    raise ValidationError(msg)
-                return False
-
-            # Prepare Template Lines with Increment Info
-            jv_lines = []
-            for line in self.line_ids:
-                # Append Run # to description for uniqueness and tracking
-                desc = f"{line.description or self.description} (Run #{next_run_number})"
-                jv_lines.append((0, 0, {
-                    'account_id': line.account_id.id,
-                    'description': desc,
-                    'debit': line.debit,
-                    'credit': line.credit,
-                }))
-
-            # Create Journal Entry (Draft)
-            jv_vals = {
-                'partner_type': 'others', 
-                'date': accounting_date,
-                'line_ids': jv_lines,
-                'recurring_source_id': self.id,
-                'recurring_run_number': next_run_number,
-                'state': 'draft', 
-                'company_id': self.company_id.id,
-            }
-            
-            try:
-                target_entry = self.env['idil.journal.entry'].create(jv_vals)
-                _logger.info("Created draft Journal Entry %s for recurring source %s", target_entry.id, self.name)
-                if not target_entry: # Should not happen with create, but as a safeguard
-                    msg = f"Failed to create draft entry: target_entry is None after creation."
-                    self._log_execution('failed', msg)
-                    if manual:
-                        raise UserError(msg)
-                    return False # Failed
-            except Exception as e:
-                msg = f"Failed to create draft entry: {str(e)}"
-                self._log_execution('failed', msg)
+        plan = []
+        run_time = self.next_run_time or fields.Datetime.now()
+        run_number = self.run_count
+        while len(plan) < CATCHUP_LIMIT:
+            if until and run_time > until:
+                break
+            accounting_date = run_time.date()
+            if self.end_date and accounting_date > self.end_date:
+                _logger.info("Ending recurring cycle for %s (End Date reached)", self.name)
+                return plan, True
+            if len(self.line_ids) < 2:
+                msg = _("Recurring entry must have at least two journal lines.")
+                logs.append(self._log_vals('failed', msg))
                 if manual:
                     raise UserError(msg)
-                return False # Failed
-
-        # 3. Try to confirm (validate balance)
-        try:
-            target_entry.action_confirm()
-            
-            # Log success
-            self._log_execution('success', f"Successfully generated and posted {target_entry.name}.", entry_id=target_entry.id)
-            self.message_post(body=_("Successfully generated and posted journal entry: %s") % target_entry.name)
-            
-            # SUCCESS: Advance schedule and increment run count
-            self.with_context(skip_cron_update=True).write({
-                'next_run_time': self._get_next_time(self.next_run_time),
-                'run_count': self.run_count + 1
-            })
-            return True
-            
-        except ValidationError as e:
-            # Final validation check before posting
-            self._log_execution('failed', f"Validation failed: {str(e)}. Will retry later.", entry_id=target_entry.id)
-            self.message_post(body=_("Validation failed during generation: %s. It will retry automatically.") % str(e))
-            
+                break
+
+            run_number += 1
+            entry = existing.get((self.id, run_number))
+            if not entry:
+                funds_ok, msg = self._check_funds_availability(balances)
+                if not funds_ok:
+                    # Keep next_run_time so it retries on the next dispatch
+                    logs.append(self._log_vals('failed', msg))
+                    self.message_post(body=_("Automatic generation failed: %s. Will retry when funds are available.") % msg)
+                    if manual:
+                        raise ValidationError(msg)
+                    break
+                entry = {
+                    'partner_type': 'others',
+                    'date': accounting_date,
+                    'line_ids': [(0, 0, {
+                        'account_id': line.account_id.id,
+                        # Run # in the description for uniqueness and tracking
+                        'description': f"{line.description or self.description} (Run #{run_number})",
+                        'debit': line.debit,
+                        'credit': line.credit,
+                    }) for line in self.line_ids],
+                    'recurring_source_id': self.id,
+                    'recurring_run_number': run_number,
+                    'state': 'draft',
+                    'company_id': self.company_id.id,
+                }
+            plan.append([run_number, run_time, entry])
+            if isinstance(entry, dict) or entry.state == 'draft':
+                for line in self.line_ids:
+                    balances[line.account_id.id] = balances.get(line.account_id.id, 0.0) + line.debit - line.credit
+            run_time = self._get_next_time(run_time)
             if manual:
-                raise e
-            
-            return False
+                break
 
+        if len(plan) >= CATCHUP_LIMIT:
+            _logger.warning("Catch-up limit reached (%s) for %s. More pending entries exist.", CATCHUP_LIMIT, self.name)
+        return plan, False
 
+    def _process_runs(self, until=None, manual=False):
+        """
+        Generate and post the due runs of the templates in self.
+
+        Every run due at `until` is processed (up to CATCHUP_LIMIT per
+        template); with manual, exactly the next run of each template,
+        whatever its date, and errors are raised instead of logged.
+
+        Funds are checked against balances read once for all the accounts
+        involved, the new draft entries are created in one call, then each
+        one is posted in its own savepoint: a failed run is logged and stops
+        its template (it retries on the next dispatch) without affecting the
+        others. Budget checks read the lines actually booked, so neither the
+        rolled-back run nor the dropped drafts count against later templates.
+        Returns (posted, failed).
+        """
+        if not self:
+            return 0, 0
+        JournalEntry = self.env['idil.journal.entry']
+        self.env['idil.transaction_bookingline'].flush_model()
+        balances = self.env['idil.account.balance'].get_balances(self.line_ids.account_id.ids)
+
+        # Entries of the runs not counted yet: drafts left by a failed post,
+        # or runs posted without the template being updated
+        existing = {}
+        for entry in JournalEntry.search([
+            ('recurring_source_id', 'in', self.ids),
+            ('recurring_run_number', '>', min(self.mapped('run_count'))),
+            ('state', '!=', 'cancel'),
+        ], order='id'):
+            existing.setdefault((entry.recurring_source_id.id, entry.recurring_run_number), entry)
+
+        logs = []
+        plans = {}
+        for rec in self:
+            plans[rec] = rec._plan_runs(until, manual, balances, existing, logs)
+
+        new_runs = [run for plan, _end in plans.values() for run in plan if isinstance(run[2], dict)]
+        created = JournalEntry.create([run[2] for run in new_runs]) if new_runs else JournalEntry
+        for run, entry in zip(new_runs, created):
+            run[2] = entry
+
+        posted = 0
+        for rec, (plan, reaches_end) in plans.items():
+            vals = {}
+            for index, (run_number, run_time, entry) in enumerate(plan):
+                if entry.state == 'draft':
+                    try:
+                        with self.env.cr.savepoint():
+                            entry.action_confirm()
+                    except Exception as e:
+                        if manual:
+                            raise
+                        logs.append(rec._log_vals('failed', f"Validation failed: {str(e)}. Will retry later.", entry_id=entry.id))
+                        rec.message_post(body=_("Validation failed during generation: %s. It will retry automatically.") % str(e))
+                        # the next runs of this template wait for this one
+                        JournalEntry.browse([
+                            r[2].id for r in plan[index + 1:] if r[2] in created
+                        ]).unlink()
+                        break
+                    posted += 1
+                    logs.append(rec._log_vals('success', f"Successfully generated and posted {entry.name}.", entry_id=entry.id))
+                    rec.message_post(body=_("Successfully generated and posted journal entry: %s") % entry.name)
+                else:
+                    _logger.info("Run #%s already posted for %s, synchronizing schedule and run_count.", run_number, rec.name)
+                vals.update(next_run_time=rec._get_next_time(run_time), run_count=run_number)
+            else:
+                if reaches_end:
+                    vals['state'] = 'done'
+            if vals:
+                rec.write(vals)
+        if logs:
+            self.env['idil.recurring.journal.log'].sudo().create(logs)
+        return posted, sum(1 for log in logs if log['status'] == 'failed')
 
 
 class RecurringJournalLine(models.Model):
@@ -474,7 +402,8 @@ class RecurringJournalLog(models.Model):
     _description = "Recurring Journal Execution Log"
     _order = "create_date desc"
 
-    recurring_id = fields.Many2one('idil.recurring.journal.entry', string="Recurring Source", required=True, ondelete='cascade')
+    # empty on the summary rows of the dispatcher runs
+    recurring_id = fields.Many2one('idil.recurring.journal.entry', string="Recurring Source", ondelete='cascade', index=True)
     run_date = fields.Datetime(string="Run Date", default=fields.Datetime.now, readonly=True)
     status = fields.Selection([
         ('success', 'Success'),
@@ -483,3 +412,4 @@ class RecurringJournalLog(models.Model):
     
     journal_entry_id = fields.Many2one('idil.journal.entry', string="Generated Entry", readonly=True)
     message = fields.Text(string="Message")
+    duration = fields.Float(string="Duration (s)", digits=(16, 3), readonly=True)
@@ -2,6 +2,8 @@ from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import logging
 
+from .report_metrics import track_report
+
 _logger = logging.getLogger(__name__)
 
 
@@ -160,15 +162,36 @@ class BalanceSheetWizard(models.TransientModel):
         self.write({"line_ids": lines})
 
     def _compute_balance_sheet_data(self):
+        with track_report(self.env, "balance_sheet") as stats:
+            data = self._build_balance_sheet_data()
+        data["stats"] = stats
+        return data
+
+    def _get_statement_balances(self, prefixes):
+        """
+        Chart hierarchy for the given header prefixes plus the USD (dr, cr)
+        of every reported account, fetched in one batch.
+        """
+        Header = self.env["idil.chart.account.header"]
+        hierarchy = Header._get_statement_hierarchy(self.company_id.id, prefixes)
+        accounts = self.env["idil.chart.account"]
+        for _header, subs in hierarchy:
+            for _sub, accs in subs:
+                accounts |= accs.filtered(
+                    lambda a: a.code not in ["100994", "100998"]
+                )
+        balances = accounts.get_dr_cr_balances_usd(
+            self.report_date, self.company_id.id
+        )
+        return hierarchy, balances
+
+    def _build_balance_sheet_data(self):
         """
         Compute balance sheet using weighted-average / average-rate converted balances.
         FX revaluation is NOT summed per account.
         Instead, the final residual difference is posted into equity as
         Foreign Exchange Revaluation.
         """
-        Header = self.env["idil.chart.account.header"]
-        SubHeader = self.env["idil.chart.account.subheader"]
-        Account = self.env["idil.chart.account"]
 
         assets_data = []
         liabilities_data = []
@@ -184,12 +207,9 @@ class BalanceSheetWizard(models.TransientModel):
         def round_usd(x):
             return round((x or 0.0) / USD_ROUND) * USD_ROUND
 
-        headers = Header.search([], order="code")
-
-        for header in headers:
-            if not header.code or header.code[0] not in ["1", "2", "3"]:
-                continue
+        hierarchy, balances = self._get_statement_balances(["1", "2", "3"])
 
+        for header, subheaders in hierarchy:
             header_type = header.code[0]  # 1=asset, 2=liability, 3=equity
 
             header_dict = {
@@ -199,23 +219,13 @@ class BalanceSheetWizard(models.TransientModel):
                 "total": 0.0,
             }
 
-            subheaders = SubHeader.search([("header_id", "=", header.id)], order="name")
-
-            for subheader in subheaders:
+            for subheader, accounts in subheaders:
                 sub_dict = {
                     "name": subheader.name,
                     "accounts": [],
                     "total": 0.0,
                 }
 
-                accounts = Account.search(
-                    [
-                        ("subheader_id", "=", subheader.id),
-                        ("company_id", "=", self.company_id.id),
-                    ],
-                    order="code",
-                )
-
                 for account in accounts:
                     if account.code in ["100994", "100998"]:
                         continue
@@ -223,9 +233,7 @@ class BalanceSheetWizard(models.TransientModel):
                     # ==========================================
                     # Use WEIGHTED AVG / AVERAGE RATE balance
                     # ==========================================
-                    dr_usd, cr_usd = account.get_dr_cr_balance_usd(
-                        self.report_date, self.company_id.id
-                    )
+                    dr_usd, cr_usd = balances[account.id]
 
                     signed = (dr_usd or 0.0) - (cr_usd or 0.0)
 
@@ -680,7 +688,7 @@ class BalanceSheetWizard(models.TransientModel):
         - header code startswith '4' => Income/Revenue
         - header code startswith '5' => Expense
 
-        Uses: account.get_dr_cr_balance_usd(report_date, company_id)
+        Uses: get_dr_cr_balances_usd(report_date, company_id), one batch
         Convention:
         signed_balance = dr - cr
 
@@ -691,43 +699,20 @@ class BalanceSheetWizard(models.TransientModel):
         net_profit > 0 => profit
         net_profit < 0 => loss
         """
-        Header = self.env["idil.chart.account.header"]
-        SubHeader = self.env["idil.chart.account.subheader"]
-        Account = self.env["idil.chart.account"]
-
-        report_date = self.report_date
-        company_id = self.company_id.id
-
         income_signed_total = 0.0
         expense_signed_total = 0.0
 
-        headers = Header.search([], order="code")
-        for header in headers:
-            if not header.code:
-                continue
-
+        hierarchy, balances = self._get_statement_balances(["4", "5"])
+        for header, subheaders in hierarchy:
             first = header.code[0]
-            if first not in ("4", "5"):
-                continue
-
-            subheaders = SubHeader.search([("header_id", "=", header.id)], order="name")
-            for subheader in subheaders:
-                accounts = Account.search(
-                    [
-                        ("subheader_id", "=", subheader.id),
-                        ("company_id", "=", company_id),
-                    ],
-                    order="code",
-                )
 
+            for subheader, accounts in subheaders:
                 for account in accounts:
                     # skip clearing if you don't want them in reports
                     if account.code in ["100994", "100998"]:
                         continue
 
-                    dr_usd, cr_usd = account.get_dr_cr_balance_usd(
-                        report_date, company_id
-                    )
+                    dr_usd, cr_usd = balances[account.id]
                     signed = (dr_usd or 0.0) - (cr_usd or 0.0)
 
                     if first == "4":
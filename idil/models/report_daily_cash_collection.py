@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
 
@@ -11,6 +13,10 @@ class DailyCashCollectionWizard(models.TransientModel):
         required=True,
         default=fields.Date.context_today,
     )
+    date_to = fields.Date(
+        string="Date To",
+        help="Set to report a range of days, with a subtotal per day",
+    )
     salesperson_id = fields.Many2one(
         "idil.sales.sales_personnel",
         string="Salesperson",
@@ -23,9 +29,16 @@ class DailyCashCollectionWizard(models.TransientModel):
         help="Leave empty for all payment methods",
     )
 
+    @api.constrains("date", "date_to")
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_to and wizard.date_to < wizard.date:
+                raise ValidationError("Date To must be on or after Date.")
+
     def action_print_report(self):
         data = {
             "date": self.date.strftime("%Y-%m-%d"),
+            "date_to": self.date_to.strftime("%Y-%m-%d") if self.date_to else False,
             "salesperson_id": self.salesperson_id.id if self.salesperson_id else False,
             "salesperson_name": self.salesperson_id.name if self.salesperson_id else "All Salespersons",
             "payment_method_id": self.payment_method_id.id if self.payment_method_id else False,
@@ -40,90 +53,118 @@ class ReportDailyCashCollection(models.AbstractModel):
     _name = "report.idil.report_daily_cash_collection_template"
     _description = "Daily Cash Collection Report"
 
+    @api.model
+    def _summarize(self, salesperson_rows, payment_rows):
+        total_sales = sum(sp["total_sales"] for sp in salesperson_rows)
+        total_collected = sum(sp["total_collected"] for sp in salesperson_rows)
+        return {
+            "salesperson_summary": salesperson_rows,
+            "payment_method_summary": payment_rows,
+            "total_sales": total_sales,
+            "total_collected": total_collected,
+            "total_by_method": sum(pm["amount"] for pm in payment_rows),
+            "collection_rate": (total_collected / total_sales * 100) if total_sales > 0 else 0,
+        }
+
     @api.model
     def _get_report_values(self, docids, data=None):
+        """
+        Receipts and payments are aggregated by the database, per day and
+        salesperson and per day and payment account, with every filter in
+        the domain. A range of days is covered by the same two queries; the
+        range totals are summed from the per-day groups.
+        """
         if not data:
             raise ValidationError("No data provided for report")
 
         date = data.get("date")
+        date_to = data.get("date_to") or date
         salesperson_id = data.get("salesperson_id")
         payment_method_id = data.get("payment_method_id")
 
-        # Build domain for sales payments
-        domain = [("payment_date", ">=", f"{date} 00:00:00"), ("payment_date", "<=", f"{date} 23:59:59")]
+        # Dates are matched in UTC, so group the days in UTC as well
+        Receipt = self.env["idil.sales.receipt"].with_context(tz="UTC")
+        Payment = self.env["idil.sales.payment"].with_context(tz="UTC")
 
-        # Get sales receipts for the date
         receipt_domain = [
             ("receipt_date", ">=", f"{date} 00:00:00"),
-            ("receipt_date", "<=", f"{date} 23:59:59"),
+            ("receipt_date", "<=", f"{date_to} 23:59:59"),
         ]
         if salesperson_id:
             receipt_domain.append(("salesperson_id", "=", salesperson_id))
+        receipt_groups = Receipt._read_group(
+            receipt_domain,
+            ["receipt_date:day", "salesperson_id"],
+            ["__count", "due_amount:sum", "paid_amount:sum"],
+        )
 
-        receipts = self.env["idil.sales.receipt"].search(receipt_domain)
-
-        # Get payments for the date
         payment_domain = [
             ("payment_date", ">=", f"{date} 00:00:00"),
-            ("payment_date", "<=", f"{date} 23:59:59"),
+            ("payment_date", "<=", f"{date_to} 23:59:59"),
         ]
-        payments = self.env["idil.sales.payment"].search(payment_domain)
+        if payment_method_id:
+            payment_domain.append(("payment_account", "=", payment_method_id))
+        payment_groups = Payment._read_group(
+            payment_domain,
+            ["payment_date:day", "payment_account"],
+            ["__count", "paid_amount:sum"],
+        )
 
-        # Group by salesperson
+        # {day: {key: row}} and {key: row} for the whole range
+        by_day_salesperson = defaultdict(dict)
         salesperson_data = {}
-        for receipt in receipts:
-            sp_name = receipt.salesperson_id.name if receipt.salesperson_id else "Direct/Customer"
-            sp_id = receipt.salesperson_id.id if receipt.salesperson_id else 0
-            
-            if sp_id not in salesperson_data:
-                salesperson_data[sp_id] = {
-                    "name": sp_name,
-                    "total_sales": 0,
-                    "total_collected": 0,
-                    "receipt_count": 0,
-                }
-            
-            salesperson_data[sp_id]["total_sales"] += receipt.due_amount
-            salesperson_data[sp_id]["total_collected"] += receipt.paid_amount
-            salesperson_data[sp_id]["receipt_count"] += 1
-
-        # Group by payment method
+        for day, salesperson, count, due, paid in receipt_groups:
+            day = fields.Date.to_date(day)
+            for bucket in (by_day_salesperson[day], salesperson_data):
+                row = bucket.setdefault(
+                    salesperson.id,
+                    {
+                        "name": salesperson.name or "Direct/Customer",
+                        "total_sales": 0,
+                        "total_collected": 0,
+                        "receipt_count": 0,
+                    },
+                )
+                row["total_sales"] += due or 0.0
+                row["total_collected"] += paid or 0.0
+                row["receipt_count"] += count
+
+        by_day_method = defaultdict(dict)
         payment_method_data = {}
-        for payment in payments:
-            if payment_method_id and payment.payment_account.id != payment_method_id:
-                continue
-                
-            pm_name = payment.payment_account.name if payment.payment_account else "Unknown"
-            pm_id = payment.payment_account.id if payment.payment_account else 0
-            
-            if pm_id not in payment_method_data:
-                payment_method_data[pm_id] = {
-                    "name": pm_name,
-                    "amount": 0,
-                    "count": 0,
-                }
-            
-            payment_method_data[pm_id]["amount"] += payment.paid_amount
-            payment_method_data[pm_id]["count"] += 1
-
-        # Calculate totals
-        total_sales = sum(sp["total_sales"] for sp in salesperson_data.values())
-        total_collected = sum(sp["total_collected"] for sp in salesperson_data.values())
-        total_by_method = sum(pm["amount"] for pm in payment_method_data.values())
+        for day, account, count, paid in payment_groups:
+            day = fields.Date.to_date(day)
+            for bucket in (by_day_method[day], payment_method_data):
+                row = bucket.setdefault(
+                    account.id,
+                    {"name": account.name or "Unknown", "amount": 0, "count": 0},
+                )
+                row["amount"] += paid or 0.0
+                row["count"] += count
+
+        days = [
+            dict(
+                self._summarize(
+                    list(by_day_salesperson[day].values()),
+                    list(by_day_method[day].values()),
+                ),
+                date=fields.Date.to_string(day),
+            )
+            for day in sorted(set(by_day_salesperson) | set(by_day_method))
+        ]
 
         return {
             "doc_ids": docids,
             "doc_model": "idil.daily.cash.collection.wizard",
             "docs": self,
-            "data": {
-                "date": date,
-                "salesperson_name": data.get("salesperson_name"),
-                "payment_method_name": data.get("payment_method_name"),
-                "salesperson_summary": list(salesperson_data.values()),
-                "payment_method_summary": list(payment_method_data.values()),
-                "total_sales": total_sales,
-                "total_collected": total_collected,
-                "total_by_method": total_by_method,
-                "collection_rate": (total_collected / total_sales * 100) if total_sales > 0 else 0,
-            },
+            "data": dict(
+                self._summarize(
+                    list(salesperson_data.values()),
+                    list(payment_method_data.values()),
+                ),
+                date=date,
+                date_to=date_to if date_to != date else False,
+                salesperson_name=data.get("salesperson_name"),
+                payment_method_name=data.get("payment_method_name"),
+                days=days,
+            ),
         }
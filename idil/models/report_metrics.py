@@ -0,0 +1,31 @@
+import logging
+import time
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def track_report(env, report_name):
+    """
+    Measure the SQL queries and wall time spent building a report.
+
+    Yields a dict that is filled on exit with ``query_count`` and
+    ``duration_ms``; callers attach it to the report data so the numbers are
+    visible next to the output, and every run is logged for trend tracking.
+    """
+    cr = env.cr
+    start_count = getattr(cr, "sql_log_count", 0)
+    start = time.perf_counter()
+    stats = {"report": report_name}
+    try:
+        yield stats
+    finally:
+        stats["query_count"] = getattr(cr, "sql_log_count", 0) - start_count
+        stats["duration_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+        _logger.info(
+            "Report %s built with %s queries in %.1f ms",
+            report_name,
+            stats["query_count"],
+            stats["duration_ms"],
+        )
@@ -1135,7 +1135,13 @@ class SaleReturn(models.Model):
                 raise UserError(
                     "🛑 Editing is not allowed for this sales return at the moment."
                 )
-        return super(SaleReturn, self).write(vals)
+        touches_facts = {"state", "return_date"} & set(vals)
+        res = super(SaleReturn, self).write(vals)
+        if touches_facts:
+            self.env["idil.sales.daily.fact"]._mark_dirty(
+                self.filtered(lambda r: r.state == "confirmed").mapped("return_date")
+            )
+        return res
 
     def unlink(self):
         """
@@ -1158,6 +1164,10 @@ class SaleReturn(models.Model):
                 SpTxn = self.env["idil.salesperson.transaction"]
                 Move = self.env["idil.product.movement"]
 
+                self.env["idil.sales.daily.fact"]._mark_dirty(
+                    self.filtered(lambda r: r.state == "confirmed").mapped("return_date")
+                )
+
                 for record in self:
                     # If you want to allow deleting draft freely:
                     if record.state != "confirmed":
@@ -351,7 +351,7 @@ class SaleOrder(models.Model):
 
     @api.depends("currency_id", "order_date", "company_id")
     def _compute_exchange_rate(self):
-        Rate = self.env["res.currency.rate"].sudo()
+        RateService = self.env["idil.currency.rate.service"].sudo()
         for order in self:
             order.rate = 0.0
             if not order.currency_id:
@@ -363,18 +363,10 @@ class SaleOrder(models.Model):
                 else fields.Date.today()
             )
 
-            rate_rec = Rate.search(
-                [
-                    ("currency_id", "=", order.currency_id.id),
-                    ("name", "<=", doc_date),
-                    ("company_id", "in", [order.company_id.id, False]),
-                ],
-                order="company_id desc, name desc",
-                limit=1,
+            order.rate = RateService.get_document_rate(
+                order.currency_id, doc_date, order.company_id
             )
 
-            order.rate = rate_rec.rate or 0.0
-
     @api.depends(
         "order_lines.commission_amount",
         "order_lines.currency_id",
@@ -532,6 +524,7 @@ class SaleOrder(models.Model):
 
     # 3) CONFIRM: single place to do validations + posting (receipt, movements, accounting)
     def button_confirm(self):
+        confirm_data = self._prepare_confirm_data()
         for order in self:
             if order.state == "confirmed":
                 raise UserError("This Sales Order is already confirmed.")
@@ -541,34 +534,122 @@ class SaleOrder(models.Model):
 
             # precheck
             order.precheck_before_confirm()
-            order.freeze_exchange_rate()
+            order.freeze_exchange_rate(confirm_data["rates"])
 
             try:
                 with self.env.cr.savepoint():
+                    order._post_confirmation(confirm_data)
 
-                    # ✅ Step 0: capture credit BEFORE creating any order transactions
-                    credit_before = order._get_salesperson_credit_before_order()
+            except Exception as e:
+                _logger.error("Confirm failed for %s: %s", order.name, e)
+                raise ValidationError("Confirm failed: %s" % e)
 
-                    # ✅ Step 1: post normal effects
-                    order.post_salesperson_transactions_on_confirm()
-                    order._create_sales_commission_record()
+    def action_confirm_batch(self):
+        """
+        Confirm many draft orders at once (end-of-day confirmation).
 
-                    order.create_movements_on_confirm()
-                    order.book_accounting_entry()
+        Rates, clearing accounts and salesperson credits are read once for
+        the whole batch. Each order is posted in its own savepoint: an order
+        that fails is rolled back alone and reported, the others stay
+        confirmed. Budget checks read the lines actually booked, so the
+        lines of a rolled-back order never count against the next orders.
+        """
+        orders = self.filtered(lambda o: o.state == "draft")
+        confirm_data = orders._prepare_confirm_data()
+        confirmed = self.browse()
+        failures = []
+        for order in orders:
+            try:
+                with self.env.cr.savepoint():
+                    order.precheck_before_confirm()
+                    order.freeze_exchange_rate(confirm_data["rates"])
+                    order._post_confirmation(confirm_data)
+            except Exception as e:
+                _logger.error("Confirm failed for %s: %s", order.name, e)
+                failures.append(f"{order.name}: {e}")
+            else:
+                confirmed |= order
+
+        message = "Confirmed %s of %s draft order(s)." % (len(confirmed), len(orders))
+        if failures:
+            message += "\n" + "\n".join(failures)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": "Batch Confirmation",
+                "message": message,
+                "type": "warning" if failures else "success",
+                "sticky": bool(failures),
+            },
+        }
+
+    def _prepare_confirm_data(self):
+        """
+        Lookups shared by the confirmation of the orders in self, read once:
+        exchange rates per (currency, day), Exchange Clearing Accounts per
+        currency, the "Sales Order" transaction source and the credit of
+        each salesperson.
+        """
+        days = {(o.order_date or fields.Datetime.now()).date() for o in self}
+        rates = {}
+        for rate in self.env["res.currency.rate"].search(
+            [
+                ("currency_id", "in", self.currency_id.ids),
+                ("name", "in", list(days)),
+                ("company_id", "=", self.env.company.id),
+            ]
+        ):
+            rates.setdefault((rate.currency_id.id, rate.name), rate.rate)
 
-                    # ✅ Step 2: apply previous credit AFTER receipt exists
-                    order._apply_previous_credit_to_receipt(credit_before)
+        return {
+            "rates": rates,
+            "clearing": self._get_exchange_clearing_accounts(),
+            "trx_source": self.env["idil.transaction.source"].search(
+                [("name", "=", "Sales Order")], limit=1
+            ),
+            "credits": self._read_salesperson_credits(self.sales_person_id.ids),
+        }
+
+    def _get_exchange_clearing_accounts(self):
+        """{currency id: Exchange Clearing Account}, first match per currency."""
+        clearing = {}
+        for account in self.env["idil.chart.account"].search(
+            [("name", "=", "Exchange Clearing Account")]
+        ):
+            clearing.setdefault(account.currency_id.id, account)
+        return clearing
+
+    def _post_confirmation(self, confirm_data):
+        """Post every effect of confirming this order (run in a savepoint)."""
+        self.ensure_one()
 
-                    # flip states only after successful postings
-                    order.state = "confirmed"
-                    if order.salesperson_order_id:
-                        order.salesperson_order_id.write({"state": "confirmed"})
+        # ✅ Step 0: capture credit BEFORE creating any order transactions
+        credit_before = self._get_salesperson_credit_before_order(
+            confirm_data["credits"]
+        )
 
-                    _logger.info("Confirmed: %s", order.name)
+        # ✅ Step 1: post normal effects
+        self.post_salesperson_transactions_on_confirm()
+        self._create_sales_commission_record()
 
-            except Exception as e:
-                _logger.error("Confirm failed for %s: %s", order.name, e)
-                raise ValidationError("Confirm failed: %s" % e)
+        self.create_movements_on_confirm()
+        self.book_accounting_entry(
+            trx_source=confirm_data["trx_source"], clearing=confirm_data["clearing"]
+        )
+
+        # ✅ Step 2: apply previous credit AFTER receipt exists
+        self._apply_previous_credit_to_receipt(credit_before)
+
+        # flip states only after successful postings
+        self.state = "confirmed"
+        if self.salesperson_order_id:
+            self.salesperson_order_id.write({"state": "confirmed"})
+
+        # the credit of this salesperson moved: read it again for its next order
+        confirm_data["credits"].pop(self.sales_person_id.id, None)
+
+        _logger.info("Confirmed: %s", self.name)
 
     def post_salesperson_transactions_on_confirm(self):
         self.ensure_one()
@@ -604,6 +685,7 @@ class SaleOrder(models.Model):
             )
 
         Txn = self.env["idil.salesperson.transaction"]
+        txn_vals = []
 
         for line in self.order_lines:
             product = line.product_id
@@ -651,7 +733,7 @@ class SaleOrder(models.Model):
                 # 1️⃣ A/R NET (base - discount)
                 ar_out = base_staff
 
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -667,7 +749,7 @@ class SaleOrder(models.Model):
                 )
 
                 # 2️⃣ COMMISSION RECORDED (OUT – affects balance)
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -683,7 +765,7 @@ class SaleOrder(models.Model):
                 )
 
                 # 3️⃣ DISCOUNT ON SPOT (IN)
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -706,7 +788,7 @@ class SaleOrder(models.Model):
                 # 1️⃣ A/R GROSS (commission included)
                 ar_out = base_staff
 
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -722,7 +804,7 @@ class SaleOrder(models.Model):
                 )
 
                 # 2️⃣ COMMISSION ON SPOT (IN – reduce A/R)
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -738,7 +820,7 @@ class SaleOrder(models.Model):
                 )
 
                 # 3️⃣ DISCOUNT ON SPOT (IN)
-                Txn.create(
+                txn_vals.append(
                     {
                         "sales_person_id": self.sales_person_id.id,
                         "sale_order_id": self.id,
@@ -753,6 +835,8 @@ class SaleOrder(models.Model):
                     }
                 )
 
+        Txn.create(txn_vals)
+
         # ======================================================================
         # FINAL SAFETY CHECK: salesperson balance == receipt due
         # ======================================================================
@@ -898,13 +982,17 @@ class SaleOrder(models.Model):
                     ("Insufficient stock for product: %s") % p.display_name
                 )
 
-    def freeze_exchange_rate(self):
+    def freeze_exchange_rate(self, rates=None):
+        """rates: {(currency id, date): rate} preloaded for a batch."""
         self.ensure_one()
         if not self.currency_id:
             self.rate = 0.0
             return
 
         on_date = (self.order_date or fields.Datetime.now()).date()
+        if rates is not None:
+            self.rate = rates.get((self.currency_id.id, on_date)) or self.rate or 0.0
+            return
         rate = self.env["res.currency.rate"].search(
             [
                 ("currency_id", "=", self.currency_id.id),
@@ -917,9 +1005,8 @@ class SaleOrder(models.Model):
 
     def create_movements_on_confirm(self):
         self.ensure_one()
-        Movement = self.env["idil.product.movement"]
-        for line in self.order_lines:
-            Movement.create(
+        self.env["idil.product.movement"].create(
+            [
                 {
                     "product_id": line.product_id.id,
                     "sale_order_id": self.id,
@@ -930,10 +1017,16 @@ class SaleOrder(models.Model):
                     "source_document": self.name,
                     "sales_person_id": self.sales_person_id.id,
                 }
-            )
+                for line in self.order_lines
+            ]
+        )
 
-    def _validate_before_posting(self):
+    def _validate_before_posting(self, trx_source=None):
         """Validate all required setup before creating any booking/lines."""
+        if trx_source is None:
+            trx_source = self.env["idil.transaction.source"].search(
+                [("name", "=", "Sales Order")], limit=1
+            )
         for order in self:
             if (
                 not order.sales_person_id
@@ -946,9 +1039,6 @@ class SaleOrder(models.Model):
             if not order.rate or float(order.rate) <= 0:
                 raise ValidationError("Exchange rate is missing or invalid.")
 
-            trx_source = self.env["idil.transaction.source"].search(
-                [("name", "=", "Sales Order")], limit=1
-            )
             if not trx_source:
                 raise ValidationError('Transaction source "Sales Order" not found.')
 
@@ -1037,25 +1127,42 @@ class SaleOrder(models.Model):
                             f"Product '{product.name}' Sales Discount Account has no currency."
                         )
 
-    def _get_salesperson_credit_before_order(self):
+    def _get_salesperson_credit_before_order(self, credits=None):
         """
         Credit available BEFORE confirming this order.
         Credit exists when total IN > total OUT.
+
+        credits: {salesperson id: credit} preloaded for a batch; a missing
+        salesperson is read (and added to it).
         """
         self.ensure_one()
-        Txn = self.env["idil.salesperson.transaction"]
-
-        txns = Txn.search([("sales_person_id", "=", self.sales_person_id.id)])
-
-        total_out = sum(
-            txns.filtered(lambda t: t.transaction_type == "out").mapped("amount")
-        )
-        total_in = sum(
-            txns.filtered(lambda t: t.transaction_type == "in").mapped("amount")
+        person_id = self.sales_person_id.id
+        if credits is None:
+            credits = {}
+        if person_id not in credits:
+            credits.update(self._read_salesperson_credits([person_id]))
+        return credits[person_id]
+
+    def _read_salesperson_credits(self, person_ids):
+        """{salesperson id: credit} with one grouped query on the transactions."""
+        credits = dict.fromkeys(person_ids, 0.0)
+        if not person_ids:
+            return credits
+        groups = self.env["idil.salesperson.transaction"]._read_group(
+            [
+                ("sales_person_id", "in", list(person_ids)),
+                ("transaction_type", "in", ["in", "out"]),
+            ],
+            ["sales_person_id", "transaction_type"],
+            ["amount:sum"],
         )
-
-        credit = total_in - total_out
-        return credit if credit > 0 else 0.0
+        for person, transaction_type, amount in groups:
+            sign = 1 if transaction_type == "in" else -1
+            credits[person.id] += sign * (amount or 0.0)
+        return {
+            person_id: credit if credit > 0 else 0.0
+            for person_id, credit in credits.items()
+        }
 
     def _apply_previous_credit_to_receipt(self, credit_before):
         """
@@ -1140,20 +1247,20 @@ class SaleOrder(models.Model):
         applied = apply_amount - allocation_left
         return applied
 
-    def book_accounting_entry(self):
+    def book_accounting_entry(self, trx_source=None, clearing=None):
         try:
             with self.env.cr.savepoint():
                 # Step 1: validate once
-                self._validate_before_posting()
+                self._validate_before_posting(trx_source)
 
                 # Step 2: create booking + lines
-                self._create_accounting_booking_and_lines()
+                self._create_accounting_booking_and_lines(trx_source, clearing)
 
         except Exception as e:
             _logger.error("transaction failed: %s", e)
             raise ValidationError(("Transaction failed: %s") % e)
 
-    def _create_accounting_booking_and_lines(self):
+    def _create_accounting_booking_and_lines(self, trx_source=None, clearing=None):
         """
         Sales Order accounting posting (MO-style lines, explicit create() calls only)
 
@@ -1171,17 +1278,21 @@ class SaleOrder(models.Model):
             - daily:   DR commission expense / CR Salesperson A/R (reduce AR)
         4) DISCOUNT: ALWAYS on-spot => DR discount expense / CR Salesperson A/R (reduce AR)
         5) Receipt due = (DR-CR) on A/R lines in this booking
+
+        trx_source and clearing ({currency id: Exchange Clearing Account})
+        can be passed preloaded for a batch; the lines of each order are
+        created with one create() call.
         """
         try:
             with self.env.cr.savepoint():
                 Booking = self.env["idil.transaction_booking"]
                 BookingLine = self.env["idil.transaction_bookingline"]
-                Chart = self.env["idil.chart.account"]
                 Receipt = self.env["idil.sales.receipt"]
 
-                trx_source = self.env["idil.transaction.source"].search(
-                    [("name", "=", "Sales Order")], limit=1
-                )
+                if trx_source is None:
+                    trx_source = self.env["idil.transaction.source"].search(
+                        [("name", "=", "Sales Order")], limit=1
+                    )
                 if not trx_source:
                     raise ValidationError('Transaction source "Sales Order" not found.')
 
@@ -1215,14 +1326,11 @@ class SaleOrder(models.Model):
                         )
                     return acc.currency_id
 
+                if clearing is None:
+                    clearing = self._get_exchange_clearing_accounts()
+
                 def _get_clearing(currency_id):
-                    acc = Chart.search(
-                        [
-                            ("name", "=", "Exchange Clearing Account"),
-                            ("currency_id", "=", currency_id),
-                        ],
-                        limit=1,
-                    )
+                    acc = clearing.get(currency_id)
                     if not acc:
                         cur = self.env["res.currency"].browse(currency_id)
                         raise ValidationError(
@@ -1231,6 +1339,7 @@ class SaleOrder(models.Model):
                     return acc
 
                 def _post_lines_mo_style(
+                    line_vals,
                     transaction_booking,
                     order,
                     product,
@@ -1241,7 +1350,7 @@ class SaleOrder(models.Model):
                     description_prefix,
                 ):
                     """
-                    EXACT MO line style.
+                    EXACT MO line style, appended to line_vals.
                     amount_in_cr_currency is expressed in CR account currency.
                     """
                     amount_cr = float(cr_amount or 0.0)
@@ -1260,7 +1369,7 @@ class SaleOrder(models.Model):
                     # Same currency => 2 lines
                     if dr_cur.id == cr_cur.id:
                         if amount_dr > 0:
-                            BookingLine.create(
+                            line_vals.append(
                                 {
                                     "transaction_booking_id": transaction_booking.id,
                                     "description": f"{description_prefix} - Debit",
@@ -1276,7 +1385,7 @@ class SaleOrder(models.Model):
                             )
 
                         if amount_cr > 0:
-                            BookingLine.create(
+                            line_vals.append(
                                 {
                                     "transaction_booking_id": transaction_booking.id,
                                     "description": f"{description_prefix} - Credit",
@@ -1303,7 +1412,7 @@ class SaleOrder(models.Model):
                     )  # DR currency clearing (target)
 
                     # Debit real DR account (DR currency)
-                    BookingLine.create(
+                    line_vals.append(
                         {
                             "transaction_booking_id": transaction_booking.id,
                             "description": f"{description_prefix} - Debit",
@@ -1319,7 +1428,7 @@ class SaleOrder(models.Model):
                     )
 
                     # Credit target clearing (DR currency)
-                    BookingLine.create(
+                    line_vals.append(
                         {
                             "transaction_booking_id": transaction_booking.id,
                             "description": f"{description_prefix} Exchange - Credit",
@@ -1335,7 +1444,7 @@ class SaleOrder(models.Model):
                     )
 
                     # Debit source clearing (CR currency)
-                    BookingLine.create(
+                    line_vals.append(
                         {
                             "transaction_booking_id": transaction_booking.id,
                             "description": f"{description_prefix} Exchange - Debit",
@@ -1351,7 +1460,7 @@ class SaleOrder(models.Model):
                     )
 
                     # Credit real CR account (CR currency)
-                    BookingLine.create(
+                    line_vals.append(
                         {
                             "transaction_booking_id": transaction_booking.id,
                             "description": f"{description_prefix} - Credit",
@@ -1414,6 +1523,7 @@ class SaleOrder(models.Model):
                         "idil.salesperson.order.summary"
                     ].update_summary_from_order(order)
 
+                    line_vals = []
                     for ln in order.order_lines:
                         product = ln.product_id
                         if not product:
@@ -1462,6 +1572,7 @@ class SaleOrder(models.Model):
                         cost_in_asset = _convert(cost_in_bom, bom_cur, asset_cur, rate)
 
                         _post_lines_mo_style(
+                            line_vals,
                             transaction_booking=booking,
                             order=order,
                             product=product,
@@ -1487,6 +1598,7 @@ class SaleOrder(models.Model):
                         )
 
                         _post_lines_mo_style(
+                            line_vals,
                             transaction_booking=booking,
                             order=order,
                             product=product,
@@ -1519,6 +1631,7 @@ class SaleOrder(models.Model):
                                 )
 
                                 _post_lines_mo_style(
+                                    line_vals,
                                     transaction_booking=booking,
                                     order=order,
                                     product=product,
@@ -1534,6 +1647,7 @@ class SaleOrder(models.Model):
                                 )
 
                                 _post_lines_mo_style(
+                                    line_vals,
                                     transaction_booking=booking,
                                     order=order,
                                     product=product,
@@ -1559,6 +1673,7 @@ class SaleOrder(models.Model):
                             )
 
                             _post_lines_mo_style(
+                                line_vals,
                                 transaction_booking=booking,
                                 order=order,
                                 product=product,
@@ -1569,6 +1684,8 @@ class SaleOrder(models.Model):
                                 description_prefix=f"Discount (On Spot Reduce AR) - {product.name}",
                             )
 
+                    BookingLine.create(line_vals)
+
                     # ------------------------------
                     # Receipt = A/R due for this booking
                     # ------------------------------
@@ -1618,8 +1735,17 @@ class SaleOrder(models.Model):
                         _("You cannot modify a Sales Order once it is confirmed.")
                     )
 
+        # Confirmed orders feed the daily sales facts, before and after the change
+        touches_facts = {"state", "order_date"} & set(vals)
+        if touches_facts:
+            Fact = self.env["idil.sales.daily.fact"]
+            Fact._mark_dirty(self.filtered(lambda o: o.state == "confirmed").mapped("order_date"))
+
         # ✅ Normal write for draft orders or pure state update
-        return super(SaleOrder, self).write(vals)
+        res = super(SaleOrder, self).write(vals)
+        if touches_facts:
+            Fact._mark_dirty(self.filtered(lambda o: o.state == "confirmed").mapped("order_date"))
+        return res
 
     def unlink(self):
         try:
@@ -1663,6 +1789,9 @@ class SaleOrder(models.Model):
                             )
                             % return_details
                         )
+                self.env["idil.sales.daily.fact"]._mark_dirty(
+                    self.filtered(lambda o: o.state == "confirmed").mapped("order_date")
+                )
                 res = super(SaleOrder, self).unlink()
 
                 return res
@@ -1915,6 +2044,11 @@ class SaleOrderLine(models.Model):
                         quantity_diff = vals["quantity"] - line.quantity
                         self.update_product_stock(line.product_id, quantity_diff)
 
+                self.env["idil.sales.daily.fact"]._mark_dirty(
+                    self.order_id.filtered(lambda o: o.state == "confirmed").mapped(
+                        "order_date"
+                    )
+                )
                 res = super(SaleOrderLine, self).write(vals)
 
                 for line in self:
@@ -0,0 +1,167 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Confirmed sales and returns as one row per line; order/return header
+# measures are carried by the first line of each document only, so they add
+# up once whatever the grouping. Dates and hours are UTC.
+_FACT_SOURCE = """
+    SELECT so.order_date::date AS date,
+           EXTRACT(HOUR FROM so.order_date)::int AS hour,
+           so.company_id,
+           sol.product_id,
+           so.sales_person_id,
+           COALESCE(sol.quantity, 0) AS qty_sold,
+           COALESCE(sol.quantity * sol.price_unit, 0) AS revenue,
+           CASE WHEN ROW_NUMBER() OVER w = 1 THEN 1 ELSE 0 END AS order_count,
+           CASE WHEN ROW_NUMBER() OVER w = 1
+                THEN COALESCE(so.order_total, 0) ELSE 0 END AS order_total,
+           CASE WHEN ROW_NUMBER() OVER w = 1
+                THEN COALESCE(so.commission_amount, 0) ELSE 0 END AS commission_amount,
+           0 AS qty_returned,
+           0 AS return_value,
+           0 AS return_line_count,
+           0 AS return_count
+      FROM idil_sale_order so
+      LEFT JOIN idil_sale_order_line sol ON sol.order_id = so.id
+     WHERE so.state = 'confirmed' AND so.order_date IS NOT NULL {order_dates}
+    WINDOW w AS (PARTITION BY so.id ORDER BY sol.id)
+    UNION ALL
+    SELECT sr.return_date::date,
+           EXTRACT(HOUR FROM sr.return_date)::int,
+           sr.company_id,
+           srl.product_id,
+           sr.salesperson_id,
+           0, 0, 0, 0, 0,
+           COALESCE(srl.returned_quantity, 0),
+           COALESCE(srl.subtotal, 0),
+           CASE WHEN srl.id IS NULL THEN 0 ELSE 1 END,
+           CASE WHEN ROW_NUMBER() OVER (PARTITION BY sr.id ORDER BY srl.id) = 1
+                THEN 1 ELSE 0 END
+      FROM idil_sale_return sr
+      LEFT JOIN idil_sale_return_line srl ON srl.return_id = sr.id
+     WHERE sr.state = 'confirmed' AND sr.return_date IS NOT NULL {return_dates}
+"""
+
+MEASURES = [
+    "qty_sold",
+    "revenue",
+    "order_count",
+    "order_total",
+    "commission_amount",
+    "qty_returned",
+    "return_value",
+    "return_line_count",
+    "return_count",
+]
+
+
+class SalesDailyFact(models.Model):
+    """
+    Sales and returns aggregated by day, hour, product and salesperson.
+
+    Dashboard widgets read this table instead of scanning the whole sales
+    history. Confirming, cancelling or deleting an order or a return marks
+    its day dirty; the dirty days are recomputed from the documents right
+    before the transaction commits, so the table always matches what is
+    committed. A daily cron rebuilds everything as a safety net.
+    """
+
+    _name = "idil.sales.daily.fact"
+    _description = "Daily Sales Fact"
+    _order = "date desc, hour"
+
+    date = fields.Date(string="Date", required=True, readonly=True, index=True)
+    hour = fields.Integer(string="Hour (UTC)", readonly=True)
+    company_id = fields.Many2one("res.company", string="Company", readonly=True, index=True)
+    product_id = fields.Many2one("my_product.product", string="Product", readonly=True)
+    category_id = fields.Many2one("product.category", string="Category", readonly=True)
+    sales_person_id = fields.Many2one(
+        "idil.sales.sales_personnel", string="Salesperson", readonly=True
+    )
+    qty_sold = fields.Float(string="Quantity Sold", readonly=True)
+    revenue = fields.Float(string="Revenue", readonly=True)
+    order_count = fields.Integer(string="Orders", readonly=True)
+    order_total = fields.Float(string="Orders Total", readonly=True)
+    commission_amount = fields.Float(string="Commission", readonly=True)
+    qty_returned = fields.Float(string="Quantity Returned", readonly=True)
+    return_value = fields.Float(string="Returned Value", readonly=True)
+    return_line_count = fields.Integer(string="Return Lines", readonly=True)
+    return_count = fields.Integer(string="Returns", readonly=True)
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM idil_sales_daily_fact LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._refresh()
+
+    @api.model
+    def _mark_dirty(self, datetimes):
+        """Schedule the days of datetimes for a refresh before commit."""
+        days = {fields.Datetime.to_datetime(dt).date() for dt in datetimes if dt}
+        if not days:
+            return
+        precommit = self.env.cr.precommit
+        dirty = precommit.data.get("idil.sales.daily.fact")
+        if dirty is None:
+            dirty = precommit.data["idil.sales.daily.fact"] = set()
+            env = self.env
+
+            def refresh():
+                # the hook may run again for a later commit of the same cursor
+                days = precommit.data.pop("idil.sales.daily.fact", None)
+                if days:
+                    env["idil.sales.daily.fact"]._refresh(days)
+
+            precommit.add(refresh)
+        dirty.update(days)
+
+    @api.model
+    def _refresh(self, days=None):
+        """Recompute the given days, or the whole table when days is None."""
+        for model in (
+            "idil.sale.order",
+            "idil.sale.order.line",
+            "idil.sale.return",
+            "idil.sale.return.line",
+        ):
+            self.env[model].flush_model()
+        cr = self.env.cr
+        params = {"uid": self.env.uid}
+        if days is None:
+            cr.execute("TRUNCATE idil_sales_daily_fact RESTART IDENTITY")
+            order_dates = return_dates = ""
+        else:
+            params["days"] = sorted(days)
+            cr.execute(
+                "DELETE FROM idil_sales_daily_fact WHERE date = ANY(%(days)s)", params
+            )
+            order_dates = "AND so.order_date::date = ANY(%(days)s)"
+            return_dates = "AND sr.return_date::date = ANY(%(days)s)"
+        sums = ", ".join(f"SUM(f.{m})" for m in MEASURES)
+        cr.execute(
+            f"""
+            INSERT INTO idil_sales_daily_fact
+                (date, hour, company_id, product_id, category_id, sales_person_id,
+                 {", ".join(MEASURES)},
+                 create_uid, write_uid, create_date, write_date)
+            SELECT f.date, f.hour, f.company_id, f.product_id, p.category_id,
+                   f.sales_person_id, {sums},
+                   %(uid)s, %(uid)s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+              FROM ({_FACT_SOURCE.format(order_dates=order_dates, return_dates=return_dates)}) f
+              LEFT JOIN my_product_product p ON p.id = f.product_id
+             GROUP BY f.date, f.hour, f.company_id, f.product_id, p.category_id,
+                      f.sales_person_id
+            """,
+            params,
+        )
+        self.invalidate_model()
+        _logger.info(
+            "Sales fact refreshed for %s: %s row(s)",
+            "all days" if days is None else len(days),
+            cr.rowcount,
+        )
+
+    @api.model
+    def _cron_rebuild(self):
+        self._refresh()
@@ -1,10 +1,26 @@
-from odoo import models, fields, api
+from collections import defaultdict
+from datetime import date
+
+from odoo import models, fields, api, _
 import logging
 
 from odoo.exceptions import ValidationError
 
 _logger = logging.getLogger(__name__)
 
+# Transaction columns that move the salesperson running balance
+RUNNING_BALANCE_FIELDS = {"sales_person_id", "date", "transaction_type", "amount"}
+
+# Ledger order of the running balance: by date, undated rows last, then id
+LEDGER_ORDER = "COALESCE(date, 'infinity'::date), id"
+LEDGER_KEY = "(COALESCE(date, 'infinity'::date), id)"
+SIGNED_AMOUNT = (
+    "CASE transaction_type WHEN 'in' THEN COALESCE(amount, 0)"
+    " WHEN 'out' THEN -COALESCE(amount, 0) ELSE 0 END"
+)
+# Set once the stored running balances follow LEDGER_ORDER
+LEDGER_ORDER_PARAM = "idil.salesperson_running_balance_ledger_order"
+
 
 class SalesPersonnel(models.Model):
     _name = "idil.sales.sales_personnel"
@@ -39,7 +55,7 @@ class SalesPersonnel(models.Model):
     due_amount = fields.Float(
         string="Due Amount",
         compute="_compute_due_amount",
-        store=False,  # Set to True only if you want to store it permanently
+        store=True,  # kept up to date by the transactions, so lists can sort/filter on it
     )
 
     # Commission Payment Settings
@@ -131,14 +147,36 @@ class SalesPersonnel(models.Model):
 
     @api.depends("transaction_ids.amount", "transaction_ids.transaction_type")
     def _compute_due_amount(self):
+        # One grouped query for every salesperson in self
+        groups = self.env["idil.salesperson.transaction"].read_group(
+            [("sales_person_id", "in", self._origin.ids), ("transaction_type", "in", ["in", "out"])],
+            ["amount:sum"],
+            ["sales_person_id", "transaction_type"],
+            lazy=False,
+        )
+        dues = defaultdict(float)
+        for g in groups:
+            sign = 1 if g["transaction_type"] == "out" else -1
+            dues[g["sales_person_id"][0]] += sign * (g["amount"] or 0.0)
         for person in self:
-            total_in = sum(
-                t.amount for t in person.transaction_ids if t.transaction_type == "in"
-            )
-            total_out = sum(
-                t.amount for t in person.transaction_ids if t.transaction_type == "out"
-            )
-            person.due_amount = total_out - total_in
+            person.due_amount = dues[person._origin.id]
+
+    def action_rebuild_running_balances(self):
+        """Recompute the transaction running balances of these salespeople."""
+        self.env["idil.salesperson.transaction"]._rebuild_running_balances(
+            self.ids or None
+        )
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Running Balances Rebuilt"),
+                "message": _("Rebuilt running balances for %s salesperson(s).")
+                % (len(self) or _("all")),
+                "type": "success",
+                "sticky": False,
+            },
+        }
 
     @api.onchange("currency_id")
     def _onchange_currency_id(self):
@@ -307,9 +345,7 @@ class SalespersonTransaction(models.Model):
     amount = fields.Float(string="Amount")
 
     description = fields.Text(string="Description")
-    running_balance = fields.Float(
-        string="Running Balance", compute="_compute_running_balance", store=True
-    )
+    running_balance = fields.Float(string="Running Balance", readonly=True, copy=False)
     sales_receipt_id = fields.Many2one(
         "idil.sales.receipt", string="Sales Receipt", ondelete="cascade"
     )
@@ -331,24 +367,144 @@ class SalespersonTransaction(models.Model):
         "idil.receipt.bulk.payment", index=True, ondelete="cascade"
     )
 
-    @api.depends("sales_person_id", "amount", "transaction_type")
-    def _compute_running_balance(self):
-        for transaction in self:
-            # Get all transactions for the salesperson up to and including this one
-            transactions = self.search(
-                [
-                    ("sales_person_id", "=", transaction.sales_person_id.id),
-                    ("id", "<=", transaction.id),
-                ],
-                order="date asc, id asc",
+    def init(self):
+        # Balances stored before the ledger order were summed by id only: the
+        # tail updates start from the stored row before the anchor, so rebuild
+        # every ledger once in (date, id) order before relying on them.
+        params = self.env["ir.config_parameter"].sudo()
+        if params.get_param(LEDGER_ORDER_PARAM):
+            return
+        self._rebuild_running_balances(self._get_ledger_person_ids())
+        params.set_param(LEDGER_ORDER_PARAM, "1")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        transactions = super(SalespersonTransaction, self).create(vals_list)
+        transactions._update_running_balances()
+        return transactions
+
+    def write(self, vals):
+        anchors = None
+        if RUNNING_BALANCE_FIELDS.intersection(vals):
+            # Old positions: the tail must also be redone where a row left
+            anchors = self._running_balance_anchors()
+        res = super(SalespersonTransaction, self).write(vals)
+        if anchors is not None:
+            self._update_running_balances(anchors)
+        return res
+
+    def unlink(self):
+        anchors = self._running_balance_anchors()
+        res = super(SalespersonTransaction, self).unlink()
+        self.browse()._update_running_balances(anchors)
+        return res
+
+    def _running_balance_anchors(self, anchors=None):
+        """
+        {salesperson_id: (date, id)} of the earliest transaction of self per
+        salesperson, in ledger order (date, id; undated rows last).
+        """
+        anchors = dict(anchors or {})
+        for trans in self:
+            person_id = trans.sales_person_id.id
+            if not person_id:
+                continue
+            key = (trans.date or date.max, trans.id)
+            if person_id not in anchors or key < anchors[person_id]:
+                anchors[person_id] = key
+        return anchors
+
+    def _update_running_balances(self, anchors=None):
+        """
+        Recompute running balances from the earliest touched transaction on.
+
+        The balance just before the anchor is taken from the stored row
+        preceding it, so only the tail of each salesperson's ledger is read
+        and rewritten, with one cumulative-sum query per salesperson.
+        """
+        anchors = self._running_balance_anchors(anchors)
+        if not anchors:
+            return
+        self.flush_model(list(RUNNING_BALANCE_FIELDS) + ["running_balance"])
+        for person_id, (anchor_date, anchor_id) in anchors.items():
+            if anchor_date == date.max:
+                anchor_date = None
+            self.env.cr.execute(
+                f"""
+                WITH opening AS (
+                    SELECT COALESCE((
+                        SELECT running_balance
+                          FROM idil_salesperson_transaction
+                         WHERE sales_person_id = %(person)s
+                           AND {LEDGER_KEY} < (COALESCE(%(date)s::date, 'infinity'), %(id)s)
+                         ORDER BY {LEDGER_ORDER} DESC
+                         LIMIT 1
+                    ), 0) AS balance
+                ), tail AS (
+                    SELECT id,
+                           (SELECT balance FROM opening)
+                           + SUM({SIGNED_AMOUNT}) OVER (ORDER BY {LEDGER_ORDER}) AS balance
+                      FROM idil_salesperson_transaction
+                     WHERE sales_person_id = %(person)s
+                       AND {LEDGER_KEY} >= (COALESCE(%(date)s::date, 'infinity'), %(id)s)
+                )
+                UPDATE idil_salesperson_transaction t
+                   SET running_balance = tail.balance
+                  FROM tail
+                 WHERE t.id = tail.id
+                   AND t.running_balance IS DISTINCT FROM tail.balance
+                """,
+                {"person": person_id, "date": anchor_date, "id": anchor_id},
             )
+        self.invalidate_model(["running_balance"])
 
-            # Calculate the running balance
-            balance = 0.0
-            for trans in transactions:
-                if trans.transaction_type == "in":
-                    balance += trans.amount
-                elif trans.transaction_type == "out":  # 'out'
-                    balance -= trans.amount
-                # Update the running balance for this transaction
-                trans.running_balance = balance
+    @api.model
+    def _rebuild_running_balances(self, person_ids=None, batch_size=200):
+        """
+        Recompute every running balance of the given salespeople (all when
+        None) from scratch, one cumulative-sum UPDATE per batch of
+        salespeople. Batches are committed one by one when rebuilding all,
+        so a long rebuild neither holds every row lock nor restarts from zero.
+        """
+        if person_ids is None:
+            person_ids = self._get_ledger_person_ids()
+            commit = True
+        else:
+            commit = False
+        self.flush_model()
+        for start in range(0, len(person_ids), batch_size):
+            batch = tuple(person_ids[start:start + batch_size])
+            self.env.cr.execute(
+                f"""
+                UPDATE idil_salesperson_transaction t
+                   SET running_balance = c.balance
+                  FROM (
+                        SELECT id,
+                               SUM({SIGNED_AMOUNT}) OVER (
+                                   PARTITION BY sales_person_id ORDER BY {LEDGER_ORDER}
+                               ) AS balance
+                          FROM idil_salesperson_transaction
+                         WHERE sales_person_id IN %s
+                       ) c
+                 WHERE t.id = c.id
+                   AND t.running_balance IS DISTINCT FROM c.balance
+                """,
+                (batch,),
+            )
+            _logger.info(
+                "Rebuilt running balances of %s salesperson(s), %s row(s) changed.",
+                len(batch),
+                self.env.cr.rowcount,
+            )
+            if commit:
+                self.env.cr.commit()
+        self.invalidate_model(["running_balance"])
+
+    @api.model
+    def _get_ledger_person_ids(self):
+        """Salespeople having at least one transaction."""
+        self.env.cr.execute(
+            "SELECT DISTINCT sales_person_id FROM idil_salesperson_transaction"
+            " WHERE sales_person_id IS NOT NULL ORDER BY sales_person_id"
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
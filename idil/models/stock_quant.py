@@ -0,0 +1,369 @@
+from odoo import models, fields, api, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Movement tables feeding the quants and the column holding their item or
+# product.
+QUANT_SOURCES = {
+    "idil_item_movement": "item_id",
+    "idil_product_movement": "product_id",
+}
+
+
+class StockQuant(models.Model):
+    """
+    On-hand quantity per item or product, warehouse and location.
+
+    Rows are maintained by database triggers on idil_item_movement and
+    idil_product_movement, so every movement insert/update/delete moves the
+    quantities in the same transaction, whichever way it is written.
+    A movement counts at these places (idil_stock_move_places):
+      - in: destination, or source when no destination is recorded
+      - out: source, quantity as stored (negative)
+      - internal: -ABS(quantity) at source, ABS(quantity) at destination
+    Movements without warehouse/location land on a row with empty places,
+    so the sum of an item's rows is its global stock.
+    """
+
+    _name = "idil.stock.quant"
+    _description = "Stock On Hand per Location"
+    _order = "item_id, product_id, warehouse_id, location_id"
+
+    item_id = fields.Many2one(
+        "idil.item", string="Item", readonly=True, index=True, ondelete="cascade"
+    )
+    product_id = fields.Many2one(
+        "my_product.product",
+        string="Product",
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    warehouse_id = fields.Many2one(
+        "idil.warehouse", string="Warehouse", readonly=True, ondelete="cascade"
+    )
+    location_id = fields.Many2one(
+        "idil.warehouse.location", string="Location", readonly=True, ondelete="cascade"
+    )
+    quantity = fields.Float(string="On Hand", digits=(16, 5), readonly=True)
+    movement_count = fields.Integer(string="Movements", readonly=True)
+
+    def init(self):
+        cr = self.env.cr
+        cr.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idil_stock_quant_place_uniq
+                ON idil_stock_quant (COALESCE(item_id, 0), COALESCE(product_id, 0),
+                                     COALESCE(warehouse_id, 0), COALESCE(location_id, 0));
+
+            CREATE OR REPLACE FUNCTION idil_stock_move_places(
+                p_type varchar, p_src_wh integer, p_src_loc integer,
+                p_dst_wh integer, p_dst_loc integer, p_qty double precision
+            ) RETURNS TABLE (warehouse_id integer, location_id integer,
+                             quantity double precision) AS $$
+                SELECT CASE WHEN p_type = 'in' AND (p_dst_wh IS NOT NULL OR p_dst_loc IS NOT NULL)
+                            THEN p_dst_wh ELSE p_src_wh END,
+                       CASE WHEN p_type = 'in' AND (p_dst_wh IS NOT NULL OR p_dst_loc IS NOT NULL)
+                            THEN p_dst_loc ELSE p_src_loc END,
+                       CASE WHEN p_type = 'internal' THEN -ABS(COALESCE(p_qty, 0))
+                            ELSE COALESCE(p_qty, 0) END
+                 WHERE p_type IN ('in', 'out', 'internal')
+                UNION ALL
+                SELECT p_dst_wh, p_dst_loc, ABS(COALESCE(p_qty, 0))
+                 WHERE p_type = 'internal'
+            $$ LANGUAGE sql IMMUTABLE;
+
+            CREATE OR REPLACE FUNCTION idil_stock_quant_bump(
+                p_item integer, p_product integer, p_type varchar,
+                p_src_wh integer, p_src_loc integer, p_dst_wh integer,
+                p_dst_loc integer, p_qty double precision, p_sign integer
+            ) RETURNS void AS $$
+            BEGIN
+                INSERT INTO idil_stock_quant AS q
+                    (item_id, product_id, warehouse_id, location_id, quantity,
+                     movement_count, create_date, write_date)
+                SELECT p_item, p_product, pl.warehouse_id, pl.location_id,
+                       pl.quantity * p_sign, p_sign,
+                       now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+                  FROM idil_stock_move_places(p_type, p_src_wh, p_src_loc,
+                                              p_dst_wh, p_dst_loc, p_qty) pl
+                 -- records being deleted in the same statement (cascades)
+                 WHERE (p_item IS NULL OR EXISTS (SELECT 1 FROM idil_item WHERE id = p_item))
+                   AND (p_product IS NULL
+                        OR EXISTS (SELECT 1 FROM my_product_product WHERE id = p_product))
+                   AND (pl.warehouse_id IS NULL
+                        OR EXISTS (SELECT 1 FROM idil_warehouse WHERE id = pl.warehouse_id))
+                   AND (pl.location_id IS NULL
+                        OR EXISTS (SELECT 1 FROM idil_warehouse_location WHERE id = pl.location_id))
+                ON CONFLICT (COALESCE(item_id, 0), COALESCE(product_id, 0),
+                             COALESCE(warehouse_id, 0), COALESCE(location_id, 0))
+                DO UPDATE
+                   SET quantity = q.quantity + EXCLUDED.quantity,
+                       movement_count = q.movement_count + EXCLUDED.movement_count,
+                       write_date = EXCLUDED.write_date;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION idil_stock_quant_item_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM idil_stock_quant_bump(
+                        OLD.item_id, NULL, OLD.movement_type,
+                        OLD.source_warehouse_id, OLD.source_location_id,
+                        OLD.destination_warehouse_id, OLD.destination_location_id,
+                        OLD.quantity, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM idil_stock_quant_bump(
+                        NEW.item_id, NULL, NEW.movement_type,
+                        NEW.source_warehouse_id, NEW.source_location_id,
+                        NEW.destination_warehouse_id, NEW.destination_location_id,
+                        NEW.quantity, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION idil_stock_quant_product_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM idil_stock_quant_bump(
+                        NULL, OLD.product_id, OLD.movement_type,
+                        OLD.source_warehouse_id, OLD.source_location_id,
+                        OLD.destination_warehouse_id, OLD.destination_location_id,
+                        OLD.quantity, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM idil_stock_quant_bump(
+                        NULL, NEW.product_id, NEW.movement_type,
+                        NEW.source_warehouse_id, NEW.source_location_id,
+                        NEW.destination_warehouse_id, NEW.destination_location_id,
+                        NEW.quantity, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS idil_stock_quant_sync ON idil_item_movement;
+            CREATE TRIGGER idil_stock_quant_sync
+                AFTER INSERT OR DELETE OR UPDATE OF
+                    item_id, movement_type, quantity,
+                    source_warehouse_id, source_location_id,
+                    destination_warehouse_id, destination_location_id
+                ON idil_item_movement
+                FOR EACH ROW EXECUTE PROCEDURE idil_stock_quant_item_trigger();
+
+            DROP TRIGGER IF EXISTS idil_stock_quant_sync ON idil_product_movement;
+            CREATE TRIGGER idil_stock_quant_sync
+                AFTER INSERT OR DELETE OR UPDATE OF
+                    product_id, movement_type, quantity,
+                    source_warehouse_id, source_location_id,
+                    destination_warehouse_id, destination_location_id
+                ON idil_product_movement
+                FOR EACH ROW EXECUTE PROCEDURE idil_stock_quant_product_trigger();
+            """
+        )
+        cr.execute("SELECT 1 FROM idil_stock_quant LIMIT 1")
+        if not cr.fetchone():
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def _raw_quants_query(self, table, ids=None):
+        """SQL + params aggregating the movements of table per place."""
+        column = QUANT_SOURCES[table]
+        where = ""
+        params = []
+        if ids:
+            where = f"WHERE m.{column} IN %s"
+            params.append(tuple(ids))
+        query = f"""
+            SELECT m.{column} AS owner_id, pl.warehouse_id, pl.location_id,
+                   COALESCE(SUM(pl.quantity), 0) AS quantity,
+                   COUNT(*) AS movement_count
+              FROM {table} m
+             CROSS JOIN LATERAL idil_stock_move_places(
+                   m.movement_type, m.source_warehouse_id, m.source_location_id,
+                   m.destination_warehouse_id, m.destination_location_id, m.quantity) pl
+              {where}
+             GROUP BY m.{column}, pl.warehouse_id, pl.location_id
+        """
+        return query, params
+
+    def _flush_sources(self):
+        self.flush_model()
+        self.env["idil.item.movement"].flush_model()
+        self.env["idil.product.movement"].flush_model()
+
+    @api.model
+    def rebuild(self, item_ids=None, product_ids=None):
+        """
+        Recompute the quants from the movement history: all of them, or
+        only those of the given items/products.
+        """
+        cr = self.env.cr
+        self._flush_sources()
+        scopes = {"idil_item_movement": item_ids, "idil_product_movement": product_ids}
+        if item_ids or product_ids:
+            scopes = {table: ids for table, ids in scopes.items() if ids}
+        for table, ids in scopes.items():
+            column = QUANT_SOURCES[table]
+            if ids:
+                cr.execute(
+                    f"DELETE FROM idil_stock_quant WHERE {column} IN %s", (tuple(ids),)
+                )
+            else:
+                cr.execute(f"DELETE FROM idil_stock_quant WHERE {column} IS NOT NULL")
+            query, params = self._raw_quants_query(table, ids)
+            cr.execute(
+                f"""
+                INSERT INTO idil_stock_quant
+                    ({column}, warehouse_id, location_id, quantity, movement_count,
+                     create_uid, write_uid, create_date, write_date)
+                SELECT t.owner_id, t.warehouse_id, t.location_id, t.quantity,
+                       t.movement_count, %s, %s,
+                       now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC'
+                  FROM ({query}) t
+                """,
+                [self.env.uid, self.env.uid] + params,
+            )
+        self.invalidate_model()
+        _logger.info(
+            "Rebuilt stock quants from %s.",
+            ", ".join(
+                f"{table} ({len(ids) if ids else 'all'})" for table, ids in scopes.items()
+            ),
+        )
+
+    @api.model
+    def verify(self, item_ids=None, product_ids=None, tolerance=0.00001):
+        """
+        Compare the quants against the movement history.
+
+        Returns a list of dicts, one per (item or product, place) that drifted.
+        """
+        self._flush_sources()
+        scopes = {"idil_item_movement": item_ids, "idil_product_movement": product_ids}
+        if item_ids or product_ids:
+            scopes = {table: ids for table, ids in scopes.items() if ids}
+        mismatches = []
+        for table, ids in scopes.items():
+            column = QUANT_SOURCES[table]
+            query, params = self._raw_quants_query(table, ids)
+            owner_filter = f"AND q.{column} IN %s" if ids else ""
+            self.env.cr.execute(
+                f"""
+                SELECT COALESCE(q.{column}, raw.owner_id),
+                       COALESCE(q.warehouse_id, raw.warehouse_id),
+                       COALESCE(q.location_id, raw.location_id),
+                       COALESCE(q.quantity, 0), COALESCE(raw.quantity, 0)
+                  FROM (SELECT * FROM idil_stock_quant q
+                         WHERE q.{column} IS NOT NULL {owner_filter}) q
+                  FULL OUTER JOIN ({query}) raw
+                    ON raw.owner_id = q.{column}
+                   AND raw.warehouse_id IS NOT DISTINCT FROM q.warehouse_id
+                   AND raw.location_id IS NOT DISTINCT FROM q.location_id
+                 WHERE ABS(COALESCE(q.quantity, 0) - COALESCE(raw.quantity, 0)) > %s
+                    OR COALESCE(q.movement_count, 0) <> COALESCE(raw.movement_count, 0)
+                """,
+                ([tuple(ids)] if ids else []) + params + [tolerance],
+            )
+            mismatches += [
+                {
+                    column: row[0],
+                    "warehouse_id": row[1],
+                    "location_id": row[2],
+                    "stored_qty": row[3],
+                    "actual_qty": row[4],
+                }
+                for row in self.env.cr.fetchall()
+            ]
+        return mismatches
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    @api.model
+    def get_totals(self, column, ids):
+        """{item or product id: quantity over all places}, column being item_id or product_id."""
+        if not ids:
+            return {}
+        self._flush_sources()
+        self.env.cr.execute(
+            f"""
+            SELECT {column}, SUM(quantity)
+              FROM idil_stock_quant
+             WHERE {column} IN %s
+             GROUP BY {column}
+            """,
+            (tuple(ids),),
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def lock_item_quants(self, item_ids, places):
+        """
+        Lock the quants of item_ids at places ((warehouse_id, location_id)
+        pairs) until the end of the transaction, so two transactions cannot
+        both check and consume the same stock.
+        """
+        places = [place for place in set(places) if place[0] and place[1]]
+        if not item_ids or not places:
+            return
+        self.env.cr.execute(
+            """
+            SELECT q.id
+              FROM idil_stock_quant q
+              JOIN unnest(%s::int[], %s::int[]) AS p(warehouse_id, location_id)
+                ON p.warehouse_id = q.warehouse_id AND p.location_id = q.location_id
+             WHERE q.item_id = ANY(%s)
+             ORDER BY q.id
+               FOR UPDATE OF q
+            """,
+            (
+                [place[0] for place in places],
+                [place[1] for place in places],
+                list(set(item_ids)),
+            ),
+        )
+
+    # ------------------------------------------------------------------
+    # Reconcile commands (server actions on items and products)
+    # ------------------------------------------------------------------
+    @api.model
+    def _notify(self, title, message, level="success", sticky=False):
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": title,
+                "message": message,
+                "type": level,
+                "sticky": sticky,
+            },
+        }
+
+    @api.model
+    def action_verify(self, item_ids=None, product_ids=None):
+        mismatches = self.verify(item_ids, product_ids)
+        if not mismatches:
+            return self._notify(
+                _("Stock Verification"), _("Stock quants match the movements.")
+            )
+        return self._notify(
+            _("Stock Verification"),
+            _("%s stock quant(s) out of sync with the movements.") % len(mismatches),
+            level="warning",
+            sticky=True,
+        )
+
+    @api.model
+    def action_rebuild(self, item_ids=None, product_ids=None):
+        self.rebuild(item_ids, product_ids)
+        return self._notify(
+            _("Stock Rebuild Complete"), _("Stock quants rebuilt from the movements.")
+        )
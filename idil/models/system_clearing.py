@@ -1,8 +1,442 @@
-from odoo import models, fields, api
+from time import perf_counter
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
 import logging
 
 _logger = logging.getLogger(__name__)
 
+DELETE_BATCH_SIZE = 50000
+
+# Transaction tables emptied by the system clearing; master data is kept.
+CLEARING_TABLES = [
+    "idil_transaction_bookingline",
+    "idil_transaction_booking",
+    "idil_purchase_return",
+    "idil_product_purchase_return",
+    "idil_product_purchase_order",
+    "idil_product_purchase_return_line",
+    "idil_vendor_payment",
+    "idil_vendor_transaction",
+    "idil_received_purchase",
+    "idil_purchase_receipt_line",
+    "idil_purchase_receipt",
+    "idil_purchase_order_line",
+    "idil_purchase_order",
+    "idil_material_request_line",
+    "idil_material_request",
+    "idil_vendor_opening_balance_line",
+    "idil_vendor_opening_balance",
+    "idil_vendor_bulk_payment",
+    "idil_vendor_bulk_payment_line",
+    "idil_commission_payment",
+    "idil_commission_bulk_payment_line",
+    "idil_commission_bulk_payment",
+    "idil_commission",
+    "idil_manufacturing_order",
+    "idil_manufacturing_order_line",
+    "idil_receipt_bulk_payment_line",
+    "idil_receipt_bulk_payment_method",
+    "idil_receipt_bulk_payment",
+    "idil_sales_receipt",
+    "idil_sale_return_line",
+    "idil_sale_return",
+    "idil_sale_order",
+    "idil_customer_sale_return_line",
+    "idil_customer_sale_return",
+    "idil_sales_payment",
+    "idil_customer_sale_payment",
+    "idil_customer_sale_order_line",
+    "idil_customer_sale_order",
+    "idil_journal_entry",
+    "idil_salesperson_transaction",
+    "idil_salesperson_place_order",
+    "idil_salesperson_place_order_line",
+    "idil_salesperson_order_summary",
+    "idil_employee_salary_advance",
+    "idil_employee_salary",
+    "idil_currency_exchange",
+    "idil_item_opening_balance",
+    "idil_item_opening_balance_line",
+    "idil_sales_opening_balance_line",
+    "idil_sales_opening_balance",
+    "idil_customer_opening_balance",
+    "idil_customer_opening_balance_line",
+    "idil_product_adjustment",
+    "idil_stock_adjustment",
+    "idil_product_movement",
+    "idil_item_movement",
+    "my_product_opening_balance",
+    "my_product_opening_balance_line",
+    "idil_staff_sales",
+    "idil_staff_sales_line",
+    "idil_customer_place_order_line",
+    "idil_customer_place_order",
+    "idil_pos_posting_queue",
+]
+
+# Tables derived from a cleared table: they describe its rows only and are
+# emptied with it (TRUNCATE does not fire the row triggers maintaining them).
+DERIVED_TABLES = {
+    "idil_transaction_bookingline": [
+        "idil_account_balance",
+        "idil_account_balance_snapshot",
+    ],
+}
+
+# Documents summarized in idil.sales.daily.fact, rebuilt once they are cleared.
+SALES_FACT_SOURCES = {
+    "idil_sale_order",
+    "idil_sale_order_line",
+    "idil_sale_return",
+    "idil_sale_return_line",
+}
+
+# Movements summarized in idil.stock.quant, rebuilt once they are cleared
+# (TRUNCATE does not fire the row triggers that maintain the quants).
+STOCK_QUANT_SOURCES = {"idil_item_movement", "idil_product_movement"}
+
+# Stored figures computed from the cleared documents, reset to zero.
+RESET_FIELDS = {
+    "idil.vendor.registration": ["opening_balance", "total_due_amount"],
+    "idil.customer.registration": ["customer_balance"],
+    "idil.sales.sales_personnel": ["due_amount"],
+    "my_product.product": ["stock_quantity"],
+    "idil.item": ["quantity"],
+    "idil.chart.account": ["balance"],
+}
+
+
+class DataClearing(models.AbstractModel):
+    """
+    Set-based clearing of transaction tables.
+
+    The foreign keys of the database decide what else has to go: tables
+    referencing a cleared table with ON DELETE CASCADE are cleared too,
+    nullable references from kept tables are set to NULL. Tables only
+    referenced from cleared tables are emptied by one TRUNCATE ... RESTART
+    IDENTITY; the rest is deleted in batches, children before parents.
+    TRUNCATE CASCADE is not used on purpose: it would also empty master
+    tables holding a nullable link to a cleared document.
+    """
+
+    _name = "idil.data.clearing"
+    _description = "Transaction Data Clearing"
+
+    @api.model
+    def tables_of_models(self, model_names):
+        """(tables, missing model names) of the given models."""
+        tables, missing = [], []
+        for name in model_names:
+            model = self.env.get(name)
+            if model is None or model._abstract or not model._auto:
+                missing.append(name)
+            else:
+                tables.append(model._table)
+        return tables, missing
+
+    def _existing_tables(self, tables):
+        self.env.cr.execute(
+            """
+            SELECT tablename FROM pg_tables
+             WHERE schemaname = current_schema() AND tablename IN %s
+            """,
+            (tuple(tables) or ("",),),
+        )
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    def _foreign_keys(self):
+        """[(child, column, parent, on_delete, nullable)] of the current schema."""
+        self.env.cr.execute(
+            """
+            SELECT cl.relname, att.attname, pcl.relname, con.confdeltype,
+                   NOT att.attnotnull
+              FROM pg_constraint con
+              JOIN pg_class cl ON cl.oid = con.conrelid
+              JOIN pg_class pcl ON pcl.oid = con.confrelid
+              JOIN pg_namespace ns ON ns.oid = cl.relnamespace
+              JOIN pg_attribute att
+                ON att.attrelid = con.conrelid AND att.attnum = con.conkey[1]
+             WHERE con.contype = 'f' AND ns.nspname = current_schema()
+            """
+        )
+        return self.env.cr.fetchall()
+
+    def _plan(self, tables, method):
+        existing = self._existing_tables(
+            list(tables)
+            + [derived for table in tables for derived in DERIVED_TABLES.get(table, [])]
+        )
+        targets = {t for t in tables if t in existing}
+        for table in list(targets):
+            targets.update(t for t in DERIVED_TABLES.get(table, []) if t in existing)
+        foreign_keys = self._foreign_keys()
+
+        # Close the set over the rows that would go with their parent
+        changed = True
+        while changed:
+            changed = False
+            for child, column, parent, on_delete, nullable in foreign_keys:
+                if parent in targets and child not in targets and on_delete == "c":
+                    targets.add(child)
+                    changed = True
+        blocking = sorted(
+            f"{child}.{column} -> {parent}"
+            for child, column, parent, on_delete, nullable in foreign_keys
+            if parent in targets and child not in targets and not nullable
+        )
+        if blocking:
+            raise UserError(
+                _("These references prevent the clearing, clear them first:\n%s")
+                % "\n".join(blocking)
+            )
+
+        nullify = sorted(
+            {
+                (child, column)
+                for child, column, parent, _on_delete, _nullable in foreign_keys
+                if parent in targets and child not in targets
+            }
+        )
+
+        # TRUNCATE only the tables every referencing table of which goes too
+        truncate = set(targets) if method == "truncate" else set()
+        changed = True
+        while changed:
+            changed = False
+            for child, _column, parent, _on_delete, _nullable in foreign_keys:
+                if parent in truncate and child not in truncate:
+                    truncate.discard(parent)
+                    changed = True
+
+        # Delete the others children first (self references are nulled)
+        remaining = targets - truncate
+        edges = {
+            (child, parent)
+            for child, _column, parent, _on_delete, _nullable in foreign_keys
+            if child in remaining and parent in remaining and child != parent
+        }
+        delete_order = []
+        while remaining:
+            leaves = sorted(
+                t for t in remaining if not any(p == t for _c, p in edges)
+            ) or sorted(remaining)  # reference cycle: fall back to name order
+            for table in leaves:
+                delete_order.append(table)
+                remaining.discard(table)
+            edges = {(c, p) for c, p in edges if c in remaining and p in remaining}
+        self_references = sorted(
+            {
+                (child, column)
+                for child, column, parent, _on_delete, nullable in foreign_keys
+                if child == parent and child in delete_order and nullable
+            }
+        )
+
+        return {
+            "tables": sorted(targets),
+            "missing": sorted(set(tables) - existing),
+            "nullify": nullify + self_references,
+            "truncate": sorted(truncate),
+            "delete": delete_order,
+        }
+
+    def _count_rows(self, tables):
+        if not tables:
+            return {}
+        self.env.cr.execute(
+            " UNION ALL ".join(
+                f'SELECT %s, COUNT(*) FROM "{table}"' for table in tables
+            ),
+            tables,
+        )
+        return dict(self.env.cr.fetchall())
+
+    def _delete_in_batches(self, table, batch_size=DELETE_BATCH_SIZE):
+        cr = self.env.cr
+        cr.execute(
+            """
+            SELECT 1 FROM information_schema.columns
+             WHERE table_schema = current_schema()
+               AND table_name = %s AND column_name = 'id'
+            """,
+            (table,),
+        )
+        if not cr.fetchone():
+            cr.execute(f'DELETE FROM "{table}"')
+            return cr.rowcount
+        deleted = 0
+        while True:
+            cr.execute(
+                f'DELETE FROM "{table}" WHERE id IN (SELECT id FROM "{table}" LIMIT %s)',
+                (batch_size,),
+            )
+            deleted += cr.rowcount
+            if cr.rowcount < batch_size:
+                return deleted
+
+    def _clear_document_links(self, tables):
+        """
+        Delete the chatter, followers, activities and attachments of the
+        models stored in tables. They only point to their document by
+        (res_model, res_id): left behind, they would show up on the new
+        documents reusing the ids once the sequences restart.
+        """
+        cr = self.env.cr
+        model_names = sorted(
+            {
+                model._name
+                for model in self.env.registry.values()
+                if not model._abstract and model._table in tables
+            }
+        )
+        if not model_names:
+            return []
+        report = []
+        cr.execute(
+            """
+            SELECT DISTINCT store_fname FROM ir_attachment
+             WHERE res_model = ANY(%s) AND store_fname IS NOT NULL
+            """,
+            (model_names,),
+        )
+        fnames = [row[0] for row in cr.fetchall()]
+        for table in ("mail_message", "mail_followers", "mail_activity", "ir_attachment"):
+            start = perf_counter()
+            cr.execute(f'DELETE FROM "{table}" WHERE res_model = ANY(%s)', (model_names,))
+            report.append(
+                {
+                    "table": table,
+                    "action": _("deleted (cleared documents)"),
+                    "rows": cr.rowcount,
+                    "seconds": perf_counter() - start,
+                }
+            )
+        # files still used by other attachments are kept by the garbage collector
+        Attachment = self.env["ir.attachment"]
+        for fname in fnames:
+            Attachment._file_delete(fname)
+        return report
+
+    @api.model
+    def clear_tables(self, tables, method="truncate"):
+        """
+        Empty the given tables (and what depends on them, see _plan).
+
+        Returns a report: a list of dicts with table, action, rows and
+        seconds, in execution order.
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        plan = self._plan(tables, method)
+        counts = self._count_rows(plan["tables"])
+        report = [
+            {"table": table, "action": _("missing"), "rows": 0, "seconds": 0.0}
+            for table in plan["missing"]
+        ]
+
+        for table, column in plan["nullify"]:
+            start = perf_counter()
+            cr.execute(
+                f'UPDATE "{table}" SET "{column}" = NULL WHERE "{column}" IS NOT NULL'
+            )
+            report.append(
+                {
+                    "table": f"{table}.{column}",
+                    "action": _("set to NULL"),
+                    "rows": cr.rowcount,
+                    "seconds": perf_counter() - start,
+                }
+            )
+
+        report += self._clear_document_links(plan["truncate"] + plan["delete"])
+
+        if plan["truncate"]:
+            start = perf_counter()
+            cr.execute(
+                "TRUNCATE %s RESTART IDENTITY"
+                % ", ".join(f'"{table}"' for table in plan["truncate"])
+            )
+            seconds = perf_counter() - start
+            report += [
+                {
+                    "table": table,
+                    "action": _("truncated"),
+                    "rows": counts.get(table, 0),
+                    # one statement for all of them
+                    "seconds": seconds if i == 0 else 0.0,
+                }
+                for i, table in enumerate(plan["truncate"])
+            ]
+
+        for table in plan["delete"]:
+            start = perf_counter()
+            rows = self._delete_in_batches(table)
+            report.append(
+                {
+                    "table": table,
+                    "action": _("deleted"),
+                    "rows": rows,
+                    "seconds": perf_counter() - start,
+                }
+            )
+
+        self.env.invalidate_all()
+        cleared = set(plan["truncate"]) | set(plan["delete"])
+        if SALES_FACT_SOURCES & cleared:
+            self.env["idil.sales.daily.fact"]._refresh()
+        if STOCK_QUANT_SOURCES & cleared:
+            self.env["idil.stock.quant"].rebuild()
+        for line in report:
+            _logger.info(
+                "Clearing %s: %s %s rows in %.2fs",
+                line["table"],
+                line["action"],
+                line["rows"],
+                line["seconds"],
+            )
+        return report
+
+    @api.model
+    def reset_fields(self, fields_by_model=None):
+        """Set stored figures derived from the cleared data back to zero."""
+        cr = self.env.cr
+        report = []
+        for model_name, field_names in (fields_by_model or RESET_FIELDS).items():
+            model = self.env.get(model_name)
+            if model is None:
+                continue
+            for field_name in field_names:
+                field = model._fields.get(field_name)
+                if not field or not field.store:
+                    continue
+                start = perf_counter()
+                cr.execute(
+                    f'UPDATE "{model._table}" SET "{field_name}" = 0 '
+                    f'WHERE "{field_name}" IS DISTINCT FROM 0'
+                )
+                report.append(
+                    {
+                        "table": f"{model._table}.{field_name}",
+                        "action": _("reset to 0"),
+                        "rows": cr.rowcount,
+                        "seconds": perf_counter() - start,
+                    }
+                )
+        self.env.invalidate_all()
+        return report
+
+    @api.model
+    def format_report(self, report):
+        total = sum(line["seconds"] for line in report)
+        lines = [
+            "%-55s %-12s %10s %8.2fs"
+            % (line["table"], line["action"], line["rows"], line["seconds"])
+            for line in report
+        ]
+        lines.append(_("Total: %.2fs") % total)
+        return "\n".join(lines)
+
 
 class SystemClearingWizard(models.TransientModel):
     _name = "system.clearing.wizard"
@@ -13,91 +447,32 @@ class SystemClearingWizard(models.TransientModel):
         help="Check this box to confirm system clearing",
         default=False,
     )
+    method = fields.Selection(
+        [
+            ("truncate", "TRUNCATE (fastest, locks the tables)"),
+            ("delete", "Batched DELETE"),
+        ],
+        string="Method",
+        default="truncate",
+        required=True,
+    )
+    result = fields.Text(string="Result", readonly=True)
 
     def action_clear_system_data(self):
+        self.ensure_one()
         if not self.confirm:
-            raise Warning("Please confirm before running system clearing!")
-
-        query = """
-        Update public.idil_vendor_registration set opening_balance =0;
-        Delete from idil_transaction_bookingline;
-        Delete from idil_transaction_booking;
-
-       
-
-        Delete from idil_purchase_return;
-       
-        Delete from idil_product_purchase_return;
-        Delete from idil_product_purchase_order;
-        Delete from idil_product_purchase_return_line;
-        Delete FROM public.idil_vendor_payment;
-        Delete from idil_vendor_transaction;
- 
-        Delete from idil_received_purchase;
-
-        Delete from idil_purchase_receipt_line;
-        Delete from idil_purchase_receipt;
-        Delete FROM public.idil_purchase_order_line;
-        Delete FROM public.idil_purchase_order;
-        Delete from idil_material_request_line;
-        Delete from idil_material_request;
-
-
-       
-        
-        Delete from idil_vendor_opening_balance_line;
-        Delete from idil_vendor_opening_balance;
-        Delete FROM public.idil_vendor_bulk_payment;
-        Delete FROM public.idil_vendor_bulk_payment_line;
-        Delete FROM public.idil_commission_payment;
-        Delete FROM public.idil_commission_bulk_payment_line;
-        Delete FROM public.idil_commission_bulk_payment;
-        Delete FROM public.idil_commission;
-        Delete from idil_manufacturing_order;
-        Delete from idil_manufacturing_order_line;
-        Delete from idil_receipt_bulk_payment_line;
-        Delete from idil_receipt_bulk_payment_method;
-        Delete from idil_receipt_bulk_payment;
-        Delete FROM public.idil_sales_receipt;
-        Delete FROM public.idil_sale_return_line;
-        Delete FROM public.idil_sale_return;
-        Delete FROM public.idil_sale_order;
-        Delete from idil_customer_sale_return_line;
-        Delete from idil_customer_sale_return;
-        Delete FROM public.idil_sales_payment;
-        Delete FROM public.idil_customer_sale_payment;
-        Delete FROM public.idil_customer_sale_order_line;
-        Delete FROM public.idil_customer_sale_order;
-        Delete FROM public.idil_journal_entry;
-        Delete FROM public.idil_salesperson_transaction;
-        Delete FROM public.idil_salesperson_place_order;
-        Delete FROM public.idil_salesperson_place_order_line;
-        Delete FROM public.idil_salesperson_order_summary;
-        Delete FROM public.idil_employee_salary_advance;
-        Delete FROM public.idil_employee_salary;
-        Delete FROM public.idil_currency_exchange;
-        Delete FROM public.idil_item_opening_balance;
-        Delete FROM public.idil_item_opening_balance_line;
-        Delete from idil_sales_opening_balance_line;
-        Delete from idil_sales_opening_balance;
-        Delete from idil_customer_opening_balance;
-        Delete from idil_customer_opening_balance_line;
-        Delete FROM public.idil_product_adjustment;
-        Delete FROM public.idil_stock_adjustment;
-        Delete FROM public.idil_product_movement;
-        Delete FROM public.idil_item_movement;
-        Delete from my_product_opening_balance;
-        Delete from my_product_opening_balance_line;     
-        Delete from idil_staff_sales;
-        Delete from idil_staff_sales_line;
-        Delete from idil_customer_place_order_line;
-        Delete from idil_customer_place_order;
-        
-
- 
+            raise UserError(_("Please confirm before running system clearing!"))
 
-        """
-
-        self.env.cr.execute(query)
-        self.env.cr.commit()
+        Clearing = self.env["idil.data.clearing"]
+        report = Clearing.clear_tables(CLEARING_TABLES, self.method)
+        report += Clearing.reset_fields()
+        self.result = Clearing.format_report(report)
         _logger.info("✅ System clearing completed successfully.")
+
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
@@ -86,7 +86,7 @@ class Vendor(models.Model):
     total_due_amount = fields.Float(
         string="Total Due Amount",
         compute="_compute_total_due_amount",
-        store=False,  # Change to True if you want it stored
+        store=True,  # kept up to date by the transactions, so lists can sort/filter on it
     )
     # Evaluation
     evaluation_score = fields.Float(
@@ -186,10 +186,13 @@ class Vendor(models.Model):
 
     @api.depends("vendor_transaction_ids.remaining_amount")
     def _compute_total_due_amount(self):
+        # One grouped query for every vendor in self
+        groups = self.env["idil.vendor_transaction"].read_group(
+            [("vendor_id", "in", self._origin.ids)], ["remaining_amount:sum"], ["vendor_id"]
+        )
+        totals = {g["vendor_id"][0]: g["remaining_amount"] or 0.0 for g in groups}
         for vendor in self:
-            vendor.total_due_amount = sum(
-                vendor.vendor_transaction_ids.mapped("remaining_amount")
-            )
+            vendor.total_due_amount = totals.get(vendor._origin.id, 0.0)
 
     @api.model
     def create(self, vals):
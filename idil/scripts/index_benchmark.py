@@ -0,0 +1,146 @@
+"""
+Before/after timings of the main report queries for the ledger indexes
+(HOT_INDEXES in models/db_indexes.py).
+
+Not part of the module: run it from an Odoo shell on a copy of production
+data, never on a live database:
+
+    odoo-bin shell -d <copy_db> < idil/scripts/index_benchmark.py
+
+Every query runs with the indexes, then again after dropping them inside a
+savepoint that is rolled back, so nothing is changed. Dropping an index
+takes an ACCESS EXCLUSIVE lock on its table until the rollback.
+"""
+import logging
+import time
+
+from odoo.addons.idil.models.db_indexes import HOT_INDEXES
+
+_logger = logging.getLogger("idil.index_benchmark")
+
+QUERIES = {
+    "account_balance_as_of": """
+        SELECT COALESCE(SUM(dr_amount), 0) - COALESCE(SUM(cr_amount), 0)
+          FROM idil_transaction_bookingline
+         WHERE account_number = %(account)s AND company_id = %(company)s
+           AND transaction_date <= %(date_to)s
+    """,
+    "account_statement": """
+        SELECT id, transaction_date, dr_amount, cr_amount
+          FROM idil_transaction_bookingline
+         WHERE account_number = %(account)s AND company_id = %(company)s
+           AND transaction_date BETWEEN %(date_from)s AND %(date_to)s
+         ORDER BY transaction_date, id
+    """,
+    "company_period_totals": """
+        SELECT account_number, SUM(dr_amount), SUM(cr_amount)
+          FROM idil_transaction_bookingline
+         WHERE company_id = %(company)s
+           AND transaction_date BETWEEN %(date_to)s - 31 AND %(date_to)s
+         GROUP BY account_number
+    """,
+    "product_cost": """
+        SELECT COALESCE(SUM(COALESCE(dr_amount, 0) - COALESCE(cr_amount, 0)), 0)
+          FROM idil_transaction_bookingline
+         WHERE product_id = %(product)s AND account_number = %(product_account)s
+    """,
+    "item_stock_at_location": """
+        SELECT COALESCE(SUM(quantity), 0)
+          FROM idil_item_movement
+         WHERE item_id = %(item)s
+           AND source_warehouse_id = %(warehouse)s
+           AND source_location_id = %(location)s
+           AND date <= %(as_of)s
+    """,
+}
+
+
+def sample_params(cr):
+    """Busiest account/company, product and item of the database."""
+    cr.execute(
+        """
+        SELECT account_number, company_id, MIN(transaction_date), MAX(transaction_date)
+          FROM idil_transaction_bookingline
+         WHERE account_number IS NOT NULL AND company_id IS NOT NULL
+         GROUP BY account_number, company_id
+         ORDER BY COUNT(*) DESC
+         LIMIT 1
+        """
+    )
+    account = cr.fetchone()
+    cr.execute(
+        """
+        SELECT product_id, account_number FROM idil_transaction_bookingline
+         WHERE product_id IS NOT NULL
+         GROUP BY product_id, account_number ORDER BY COUNT(*) DESC LIMIT 1
+        """
+    )
+    product = cr.fetchone()
+    cr.execute(
+        """
+        SELECT item_id, source_warehouse_id, source_location_id, MAX(date)
+          FROM idil_item_movement
+         WHERE source_location_id IS NOT NULL
+         GROUP BY item_id, source_warehouse_id, source_location_id
+         ORDER BY COUNT(*) DESC LIMIT 1
+        """
+    )
+    item = cr.fetchone()
+    if not (account and product and item):
+        return None
+    return {
+        "account": account[0],
+        "company": account[1],
+        "date_from": account[2],
+        "date_to": account[3],
+        "product": product[0],
+        "product_account": product[1],
+        "item": item[0],
+        "warehouse": item[1],
+        "location": item[2],
+        "as_of": item[3],
+    }
+
+
+def time_query(cr, query, params, repeat):
+    """Best of repeat runs, in milliseconds."""
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        cr.execute(query, params)
+        cr.fetchall()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+def run(env, repeat=5):
+    """[{"query", "with_indexes_ms", "without_indexes_ms"}], also printed."""
+    cr = env.cr
+    env.flush_all()
+    params = sample_params(cr)
+    if not params:
+        _logger.warning("Index benchmark skipped: not enough ledger/movement data.")
+        return []
+    results = {
+        name: {"query": name, "with_indexes_ms": time_query(cr, sql, params, repeat)}
+        for name, sql in QUERIES.items()
+    }
+    with cr.savepoint(flush=False) as savepoint:
+        for indexes in HOT_INDEXES.values():
+            for name, _columns, _where in indexes:
+                cr.execute(f"DROP INDEX IF EXISTS {name}")
+        for name, sql in QUERIES.items():
+            results[name]["without_indexes_ms"] = time_query(cr, sql, params, repeat)
+        savepoint.rollback()
+    for row in results.values():
+        print(
+            "%-24s with: %8.2f ms  without: %8.2f ms"
+            % (row["query"], row["with_indexes_ms"], row["without_indexes_ms"])
+        )
+    return list(results.values())
+
+
+if "env" in globals():
+    run(env)  # noqa: F821 (provided by odoo-bin shell)
+    env.cr.rollback()  # noqa: F821